@@ -0,0 +1,336 @@
+"""Bulk user import and export through Postgres COPY.
+
+Import: uploaded NDJSON or CSV is validated against `UserCreate` in chunks,
+each chunk is COPYed into a temporary staging table, and one
+INSERT ... SELECT ... ON CONFLICT DO NOTHING moves the first row per id into
+`users` (and its cart into `cart_items`) at the end, in a single transaction.
+
+Export: `COPY (SELECT ...) TO STDOUT` streamed to the client as it arrives.
+
+Both run on the asyncpg connection of their own session, whatever DB_ASYNC
+says, like the streaming branch of /list_users.
+"""
+import asyncio
+import csv
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from pydantic import ValidationError, field_validator
+from pydantic.networks import validate_email
+from sqlalchemy import text
+
+from app.database import get_async_db_session
+from app.schemas import UserCreate
+
+IMPORT_CHUNK_ROWS = 5000
+# Per-row errors returned in the response; the rest are only counted.
+IMPORT_MAX_ERRORS = 1000
+# Chunks buffered between COPY TO and a slow client.
+EXPORT_QUEUE_CHUNKS = 16
+
+_CREATE_STAGING = text(
+    "CREATE TEMPORARY TABLE user_import ("
+    " line integer NOT NULL, id varchar(36) NOT NULL, username varchar(150) NOT NULL,"
+    " email varchar(255) NOT NULL, cart integer[]"
+    ") ON COMMIT DROP"
+)
+_STAGING_COLUMNS = ("line", "id", "username", "email", "cart")
+
+# Duplicate ids within the upload: the first line wins, later ones conflict.
+# The cart of an inserted user keeps the upload order via added_at offsets,
+# as in app.cart.add_items.
+_MERGE = text("""
+WITH first AS (
+    SELECT DISTINCT ON (id) line, id, username, email, cart
+    FROM user_import ORDER BY id, line
+), inserted AS (
+    INSERT INTO users (id, username, email, created_at, updated_at)
+    SELECT id, username, email, CAST(:now AS timestamp), CAST(:now AS timestamp) FROM first ORDER BY line
+    ON CONFLICT DO NOTHING
+    RETURNING id
+), added AS (
+    SELECT first.line, first.id, first.cart FROM first JOIN inserted USING (id)
+), carts AS (
+    INSERT INTO cart_items (user_id, order_id, quantity, added_at)
+    SELECT added.id, item.order_id, count(*), CAST(:now AS timestamp) + min(item.n) * interval '1 microsecond'
+    FROM added CROSS JOIN LATERAL unnest(added.cart) WITH ORDINALITY AS item(order_id, n)
+    GROUP BY added.id, item.order_id
+)
+SELECT line, id FROM added
+""")
+
+CONFLICT_ERROR = "conflicts with an existing user (id, username or email)"
+INVALID_UTF8_ERROR = "row is not valid UTF-8"
+
+# Plain ASCII dot-atom local parts, which email validation leaves as they are.
+_DOT_ATOM = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+# Domain as written -> normalised domain, for domains that passed validation.
+_valid_domains: dict[str, str] = {}
+_VALID_DOMAINS_MAX = 10000
+
+
+def _check_email(value: str) -> str:
+    """Same result as EmailStr, but the domain checks (most of the cost) run
+    once per domain instead of once per row.
+    """
+    local, _, domain = value.rpartition("@")
+    plain = len(local) <= 64 and len(value) <= 254 and _DOT_ATOM.fullmatch(local)
+    normalized = _valid_domains.get(domain)
+    if plain and normalized is not None:
+        return f"{local}@{normalized}"
+    email = validate_email(value)[1]
+    if plain:
+        if len(_valid_domains) >= _VALID_DOMAINS_MAX:
+            _valid_domains.clear()
+        _valid_domains[domain] = email.rpartition("@")[2]
+    return email
+
+
+class ImportedUser(UserCreate):
+    """UserCreate with the email check memoised per domain."""
+
+    email: str
+
+    @field_validator("email")
+    @classmethod
+    def _email(cls, value: str) -> str:
+        return _check_email(value)
+
+
+@dataclass
+class ImportResult:
+    received: int = 0
+    inserted: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    inserted_ids: list = field(default_factory=list)
+
+    def error(self, line: int, message: str, user_id: str | None = None):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "id": user_id, "error": message})
+
+
+def _describe(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+    )
+
+
+def _parse_cart(value: str):
+    """CSV carts use the Postgres array form written by the export, e.g. {3,1,3}."""
+    value = value.strip().strip("{}")
+    return [item for item in value.replace(" ", ",").split(",") if item] if value else None
+
+
+async def _lines(chunks):
+    """Group an upload stream into lists of complete, decoded lines, line ends kept.
+
+    Bytes that are not UTF-8 are kept as lone surrogates (surrogateescape), so
+    `_validate` can reject the row they are in instead of importing U+FFFD.
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if lines:
+            yield [line.decode("utf-8", errors="surrogateescape") + "\n" for line in lines]
+    if pending:
+        yield [pending.decode("utf-8", errors="surrogateescape")]
+
+
+def _is_utf8(value) -> bool:
+    """False if `value`, a string or a list of them, holds bytes `_lines` could not decode."""
+    if isinstance(value, list):
+        return all(_is_utf8(v) for v in value)
+    if not isinstance(value, str):
+        return True
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+class _LineFeed:
+    """Line iterator for one csv.reader, topped up as the upload arrives."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+def _csv_records(reader, feed: _LineFeed):
+    """(first line number, fields) for every non-blank record left in `feed`."""
+    while feed.lines:
+        number = reader.line_num + 1
+        fields = next(reader, None)
+        if fields and any(f.strip() for f in fields):
+            yield number, fields
+
+
+async def _csv_rows(chunks):
+    """Records of one csv.reader over the whole upload.
+
+    A quoted field may hold newlines (the export writes them that way), so a
+    record can span lines and chunks. Lines reach the reader only up to a
+    record boundary, where the quotes seen are balanced ("" escapes count
+    twice), so it never runs dry in the middle of a record.
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    quotes = 0
+    async for lines in _lines(chunks):
+        for line in lines:
+            feed.lines.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                quotes = 0
+                for record in _csv_records(reader, feed):
+                    yield record
+    # An unterminated quote at the end: whatever the reader makes of the rest.
+    for record in _csv_records(reader, feed):
+        yield record
+
+
+async def _rows(chunks, fmt: str):
+    """(line number, raw row) for every non-blank row, numbered by its first line."""
+    if fmt == "ndjson":
+        number = 0
+        async for lines in _lines(chunks):
+            for line in lines:
+                number += 1
+                if line.strip():
+                    yield number, line.rstrip("\r\n")
+        return
+
+    header = None
+    async for number, fields in _csv_rows(chunks):
+        if header is None:
+            header = [f.strip() for f in fields]
+            continue
+        row = dict(zip(header, fields))
+        if "cart" in row:
+            row["cart"] = _parse_cart(row["cart"])
+        yield number, row
+
+
+def _validate(number: int, row, result: ImportResult):
+    if not _is_utf8(row if isinstance(row, str) else list(row.values())):
+        user_id = row.get("id") if isinstance(row, dict) else None
+        result.error(number, INVALID_UTF8_ERROR, user_id if _is_utf8(user_id) else None)
+        return None
+    try:
+        if isinstance(row, str):
+            user = ImportedUser.model_validate_json(row)
+        else:
+            user = ImportedUser.model_validate(row)
+    except ValidationError as e:
+        user_id = row.get("id") if isinstance(row, dict) else None
+        result.error(number, _describe(e), user_id)
+        return None
+    return (number, user.id, user.username, user.email, user.cart)
+
+
+async def _driver_connection(db, tenant_id: str):
+    """The asyncpg connection behind `db`, with the tenant schema on its search_path.
+
+    COPY and the staging SQL are not rendered by SQLAlchemy, so they rely on
+    search_path rather than schema_translate_map; set_config(..., true) lasts
+    only for the session's transaction.
+    """
+    await db.execute(text("SELECT set_config('search_path', :schema, true)"), {"schema": tenant_id})
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    return raw.driver_connection
+
+
+async def import_users(tenant_id: str, chunks, fmt: str) -> ImportResult:
+    """Load the users in `chunks` (an async iterable of bytes) into `tenant_id`."""
+    result = ImportResult()
+    staged = []
+    async with get_async_db_session(schema=tenant_id) as db:
+        pg = await _driver_connection(db, tenant_id)
+        await db.execute(_CREATE_STAGING)
+
+        async def _copy(batch):
+            await pg.copy_records_to_table("user_import", records=batch, columns=_STAGING_COLUMNS)
+            staged.extend((r[0], r[1]) for r in batch)
+
+        batch = []
+        async for number, row in _rows(chunks, fmt):
+            result.received += 1
+            record = _validate(number, row, result)
+            if record is not None:
+                batch.append(record)
+            if len(batch) >= IMPORT_CHUNK_ROWS:
+                await _copy(batch)
+                batch = []
+        if batch:
+            await _copy(batch)
+
+        if staged:
+            rows = (await db.execute(_MERGE, {"now": datetime.utcnow()})).all()
+            result.inserted = len(rows)
+            result.inserted_ids = [r.id for r in rows]
+            inserted_lines = {r.line for r in rows}
+            for line, user_id in staged:
+                if line not in inserted_lines:
+                    result.error(line, CONFLICT_ERROR, user_id)
+        await db.commit()
+    result.errors.sort(key=lambda e: e["line"])
+    return result
+
+
+def _copy_options(fmt: str) -> dict:
+    if fmt == "csv":
+        return {"format": "csv", "header": True}
+    # One JSON object per line, written verbatim: CSV mode with quote and
+    # delimiter characters that JSON always escapes never alters the text.
+    return {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+
+
+async def export_users(tenant_id: str, stmt, fmt: str):
+    """Yield `stmt` (a SELECT over users) as CSV or NDJSON bytes via COPY TO."""
+    async with get_async_db_session(schema=tenant_id) as db:
+        pg = await _driver_connection(db, tenant_id)
+        compiled = stmt.compile(dialect=db.bind.dialect)
+        params = compiled.construct_params()
+        query = compiled.string
+        if fmt == "ndjson":
+            query = f"SELECT row_to_json(u) FROM ({query}) AS u"
+        args = [params[name] for name in compiled.positiontup]
+
+        queue = asyncio.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+
+        async def _output(chunk: bytes):
+            await queue.put(bytes(chunk))
+
+        async def _copy():
+            try:
+                await pg.copy_from_query(query, *args, output=_output, **_copy_options(fmt))
+            except Exception as e:
+                await queue.put(e)
+            else:
+                await queue.put(None)
+
+        task = asyncio.ensure_future(_copy())
+        try:
+            while (chunk := await queue.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            # The client went away mid-export: stop COPY before the session closes.
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,452 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Protocol
+
+from prometheus_client import Counter
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_HITS = Counter("cache_hits_total", "Cache hits", ["cache", "tier"])
+CACHE_MISSES = Counter("cache_misses_total", "Cache misses", ["cache"])
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total", "Entries dropped from a local cache tier", ["cache", "reason"]
+)
+
+
+class TTLCache:
+    """Thread-safe in-process LRU with a per-entry TTL and a hard entry cap."""
+
+    def __init__(self, name: str, max_entries: int, ttl_s: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        for reason in ("expired", "capacity"):
+            CACHE_EVICTIONS.labels(name, reason)
+
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                CACHE_EVICTIONS.labels(self.name, "expired").inc()
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_s: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                CACHE_EVICTIONS.labels(self.name, "capacity").inc()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedCache(Protocol):
+    """Cross-process cache tier (e.g. Redis). Values must be JSON-serialisable."""
+
+    def get(self, key: str) -> Optional[Any]: ...
+
+    def set(self, key: str, value: Any, ttl_s: float) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class InMemorySharedCache:
+    """Dict-backed SharedCache for tests and single-process deployments."""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl_s: float) -> None:
+        self._data[key] = (time.monotonic() + ttl_s, value)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class SQLiteSharedCache:
+    """SharedCache persisted in a local SQLite file, so entries survive restarts.
+
+    Meant for long-lived, rarely changing data such as Google place details.
+    Expiry uses wall-clock time because entries outlive the process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] <= time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+        return json.loads(row[1])
+
+    def set(self, key: str, value: Any, ttl_s: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, time.time() + ttl_s, json.dumps(value)),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def close(self):
+        self._conn.close()
+
+
+class TieredCache:
+    """Read-through cache: a local TTLCache in front of an optional SharedCache.
+
+    Lookups try the local tier first, then the shared tier (which back-fills
+    the local one). Values must be JSON-serialisable for the shared tier.
+    Async code uses `aget`/`aset`/`adelete`, which keep shared-tier I/O off
+    the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        local: TTLCache,
+        shared: Optional[SharedCache] = None,
+        enabled: bool = True,
+        shared_ttl_s: Optional[float] = None,
+    ):
+        self.name = name
+        self.local = local
+        self.shared = shared
+        self.enabled = enabled
+        self.shared_ttl_s = shared_ttl_s
+        CACHE_MISSES.labels(name)
+        for tier in ("local", "shared"):
+            CACHE_HITS.labels(name, tier)
+
+    def _local_hit(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            CACHE_HITS.labels(self.name, "local").inc()
+        return value
+
+    def _shared_result(self, key: str, value: Optional[Any]) -> Optional[Any]:
+        if value is not None:
+            CACHE_HITS.labels(self.name, "shared").inc()
+            self.local.set(key, value)
+        else:
+            CACHE_MISSES.labels(self.name).inc()
+        return value
+
+    def _shared_ttl(self) -> float:
+        return self.shared_ttl_s or self.local.ttl_s
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self._local_hit(key)
+        if value is not None:
+            return value
+        return self._shared_result(key, self.shared.get(key) if self.shared is not None else None)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """`get` for the event loop: the shared tier is read in a worker thread."""
+        if not self.enabled:
+            return None
+        value = self._local_hit(key)
+        if value is not None:
+            return value
+        if self.shared is None:
+            return self._shared_result(key, None)
+        return self._shared_result(key, await asyncio.to_thread(self.shared.get, key))
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self._shared_ttl())
+
+    async def aset(self, key: str, value: Any):
+        """`set` for the event loop: the shared write (a commit for SQLite) runs in a worker thread."""
+        if not self.enabled:
+            return
+        self.local.set(key, value)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, value, self._shared_ttl())
+
+    def delete(self, key: str):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    async def adelete(self, key: str):
+        self.local.delete(key)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.delete, key)
+
+    def clear(self):
+        self.local.clear()
+
+
+class UserCache(TieredCache):
+    """Serialised `UserOut` payloads keyed by (tenant, user id).
+
+    Writers must call `invalidate` after commit. Readers take a `generation()`
+    before querying and pass it to `set`, which then drops the fill if the key
+    was invalidated since: otherwise a read that saw the row before a
+    concurrent write committed would cache the old payload after the writer's
+    invalidation. Invalidations are remembered for the local TTL, so only
+    fills from reads started within that window are checked.
+
+    Invalidation clears this process and the shared tier, never another
+    process's local tier: those serve the old entry until it expires. The
+    event loop uses `aget`/`aset`/`ainvalidate`.
+    """
+
+    name = "user"
+
+    def __init__(self, local: TTLCache, shared: Optional[SharedCache] = None, enabled: bool = True):
+        super().__init__(self.name, local, shared, enabled)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._invalidated = TTLCache(f"{self.name}_invalidations", local.max_entries, local.ttl_s)
+
+    @staticmethod
+    def _key(tenant_id: str, user_id: str) -> str:
+        return f"user:{tenant_id}:{user_id}"
+
+    def generation(self) -> int:
+        return self._generation
+
+    def _stale(self, key: str, generation: Optional[int]) -> bool:
+        if generation is None:
+            return False
+        invalidated_at = self._invalidated.get(key)
+        return invalidated_at is not None and invalidated_at > generation
+
+    def _fill_local(self, key: str, value: dict, generation: Optional[int]) -> bool:
+        # Atomic with `_forget`; the shared tier is written outside the lock.
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._stale(key, generation):
+                return False
+            self.local.set(key, value)
+        return True
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._generation += 1
+            self._invalidated.set(key, self._generation)
+            self.local.delete(key)
+
+    def get(self, tenant_id: str, user_id: str) -> Optional[dict]:
+        return super().get(self._key(tenant_id, user_id))
+
+    async def aget(self, tenant_id: str, user_id: str) -> Optional[dict]:
+        return await super().aget(self._key(tenant_id, user_id))
+
+    def set(self, tenant_id: str, user_id: str, value: dict, generation: Optional[int] = None):
+        key = self._key(tenant_id, user_id)
+        if self._fill_local(key, value, generation) and self.shared is not None:
+            self.shared.set(key, value, self._shared_ttl())
+            # An invalidation that ran while writing may have missed this entry.
+            if self._stale(key, generation):
+                self.shared.delete(key)
+
+    async def aset(self, tenant_id: str, user_id: str, value: dict, generation: Optional[int] = None):
+        key = self._key(tenant_id, user_id)
+        if self._fill_local(key, value, generation) and self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, value, self._shared_ttl())
+            if self._stale(key, generation):
+                await asyncio.to_thread(self.shared.delete, key)
+
+    def invalidate(self, tenant_id: str, user_id: str):
+        key = self._key(tenant_id, user_id)
+        self._forget(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    async def ainvalidate(self, tenant_id: str, user_id: str):
+        key = self._key(tenant_id, user_id)
+        self._forget(key)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.delete, key)
+
+    def clear(self):
+        super().clear()
+        self._invalidated.clear()
+
+
+class StaleWhileRevalidateCache:
+    """Async cache for slow remote lookups.
+
+    An entry is fresh for `ttl_s`. For the next `swr_s` it is still served
+    while one background task refreshes it. After that a request waits for a
+    reload, but if the reload fails an entry younger than
+    `ttl_s + stale_if_error_s` is served instead of the error. Concurrent
+    loads of the same key share one in-flight task (single-flight).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        ttl_s: float,
+        swr_s: float,
+        stale_if_error_s: float,
+        refresh_timeout_s: float,
+    ):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.swr_s = swr_s
+        self.refresh_timeout_s = refresh_timeout_s
+        self.entries = TTLCache(name, max_entries, ttl_s=ttl_s + max(swr_s, stale_if_error_s))
+        self._inflight = {}
+        self._background = set()
+        CACHE_MISSES.labels(name)
+        for tier in ("fresh", "stale"):
+            CACHE_HITS.labels(name, tier)
+
+    def _load(self, key, loader, timeout_s: float) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, loader, timeout_s))
+            self._inflight[key] = task
+        return task
+
+    async def _run(self, key, loader, timeout_s: float):
+        try:
+            value = await loader(timeout_s)
+            self.entries.set(key, (time.monotonic(), value))
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _refresh_in_background(self, key, loader):
+        if key in self._inflight:
+            return
+        task = self._load(key, loader, self.refresh_timeout_s)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("[%s] background refresh failed: %s", self.name, task.exception())
+
+    async def get(self, key, loader, timeout_s: float):
+        """Return the value for `key`, calling `await loader(timeout_s)` to (re)load it.
+
+        `timeout_s` bounds how long this caller waits for a load; a shared load
+        started by an earlier caller is not cancelled when a waiter gives up.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            loaded_at, value = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl_s:
+                CACHE_HITS.labels(self.name, "fresh").inc()
+                return value
+            if age < self.ttl_s + self.swr_s:
+                CACHE_HITS.labels(self.name, "stale").inc()
+                self._refresh_in_background(key, loader)
+                return value
+
+        CACHE_MISSES.labels(self.name).inc()
+        task = self._load(key, loader, timeout_s)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout_s)
+        except Exception:
+            if entry is None:
+                raise
+            CACHE_HITS.labels(self.name, "stale").inc()
+            logger.warning("[%s] serving stale entry for %s after failed reload", self.name, key)
+            return entry[1]
+
+    def clear(self):
+        self.entries.clear()
+
+
+user_cache = UserCache(
+    TTLCache(
+        UserCache.name,
+        max_entries=settings.user_cache_max_entries,
+        ttl_s=settings.user_cache_ttl_s,
+    ),
+    enabled=settings.user_cache_enabled,
+)
+
+order_history_cache = StaleWhileRevalidateCache(
+    "order_history",
+    max_entries=settings.order_history_cache_max_entries,
+    ttl_s=settings.order_history_cache_ttl_s,
+    swr_s=settings.order_history_swr_s,
+    stale_if_error_s=settings.order_history_stale_if_error_s,
+    refresh_timeout_s=settings.request_timeout_s,
+)
+
+place_cache = TieredCache(
+    "place",
+    TTLCache("place", max_entries=settings.place_cache_max_entries, ttl_s=settings.place_cache_ttl_s),
+    shared=SQLiteSharedCache(settings.place_cache_path) if settings.place_cache_path else None,
+)
+
+autocomplete_cache = TieredCache(
+    "autocomplete",
+    TTLCache(
+        "autocomplete",
+        max_entries=settings.autocomplete_cache_max_entries,
+        ttl_s=settings.autocomplete_cache_ttl_s,
+    ),
+)
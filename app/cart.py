@@ -0,0 +1,94 @@
+"""SQL statements for the normalised cart (`cart_items`).
+
+Each mutation touches only the cart rows involved, never the users row.
+Callers run them inside the request session and commit.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, column, delete, func, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import CartItem, User
+
+cart_items = CartItem.__table__
+users = User.__table__
+
+# Columns of UserOut, in its field order: the profile plus the expanded
+# cart, in one SELECT.
+USER_COLUMNS = (
+    users.c.id,
+    users.c.username,
+    users.c.email,
+    users.c.name,
+    users.c.surname,
+    users.c.address,
+    users.c.longitude,
+    users.c.latitude,
+    users.c.partner_id,
+    users.c.created_at,
+    users.c.updated_at,
+    User.cart,
+)
+
+
+def select_user(user_id: str):
+    return select(*USER_COLUMNS).where(users.c.id == user_id)
+
+
+def add_items(user_id: str, order_ids):
+    """Add one unit per occurrence in `order_ids`.
+
+    Raises IntegrityError (foreign key) when the user does not exist.
+    """
+    now = datetime.utcnow()
+    rows = [
+        # Microsecond offsets keep the first-occurrence order of a bulk add.
+        {"user_id": user_id, "order_id": order_id, "quantity": n, "added_at": now + timedelta(microseconds=i)}
+        for i, (order_id, n) in enumerate(Counter(order_ids).items())
+    ]
+    stmt = insert(cart_items).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[cart_items.c.user_id, cart_items.c.order_id],
+        set_={"quantity": cart_items.c.quantity + stmt.excluded.quantity},
+    )
+
+
+def remove_items(user_id: str, order_ids):
+    """Remove one unit per occurrence in `order_ids`; unknown ids are ignored.
+
+    Returns two statements: the decrement and the cleanup of emptied rows.
+    """
+    counts = values(
+        column("order_id", Integer), column("n", Integer), name="removed"
+    ).data(list(Counter(order_ids).items()))
+    decrement = (
+        update(cart_items)
+        .where(cart_items.c.user_id == user_id, cart_items.c.order_id == counts.c.order_id)
+        .values(quantity=func.greatest(cart_items.c.quantity - counts.c.n, 0))
+    )
+    cleanup = delete(cart_items).where(cart_items.c.user_id == user_id, cart_items.c.quantity == 0)
+    return decrement, cleanup
+
+
+def clear_items(user_id: str):
+    return delete(cart_items).where(cart_items.c.user_id == user_id)
+
+
+def select_cart(user_id: str):
+    """The cart rows of one user without any profile columns.
+
+    LEFT JOIN so a user with an empty cart still yields one row (and a missing
+    user yields none).
+    """
+    return (
+        select(users.c.id, cart_items.c.order_id, cart_items.c.quantity, cart_items.c.added_at)
+        .select_from(
+            users.outerjoin(
+                cart_items,
+                (cart_items.c.user_id == users.c.id) & (cart_items.c.quantity > 0),
+            )
+        )
+        .where(users.c.id == user_id)
+        .order_by(cart_items.c.added_at, cart_items.c.order_id)
+    )
@@ -1,27 +1,294 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import asyncio
+import time
+
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
+from app import sql_metrics, tracing
 from app.config import settings
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 
 DATABASE_URL = f"postgresql://{settings.pg_user}:{settings.pg_password}@{settings.pg_host}:{settings.pg_port}/{settings.pg_database}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.pg_user}:{settings.pg_password}@{settings.pg_host}:{settings.pg_port}/{settings.pg_database}"
+
+# --------------------
+# Pool metrics
+# --------------------
+POOL_SIZE = Gauge(
+    "db_pool_size", "Configured persistent connections in the pool", ["engine"]
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool", ["engine"]
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Overflow connections currently open beyond pool_size", ["engine"]
+)
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a usable pooled connection",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class _CheckoutTimingMixin:
+    engine_label = ""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            with tracing.child_span("db.pool.checkout"):
+                return super().connect()
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(self.engine_label).observe(
+                time.perf_counter() - start
+            )
+
+
+class TimedQueuePool(_CheckoutTimingMixin, QueuePool):
+    engine_label = "sync"
+
+
+class TimedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+def _pool_options():
+    return dict(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle_s,
+        pool_timeout=settings.db_pool_timeout_s,
+        pool_pre_ping=settings.db_pool_pre_ping == "always",
+    )
+
+
+def _ping_after_idle(sync_engine):
+    """Ping a pooled connection only if it sat idle longer than the threshold.
+
+    `pool_pre_ping=True` costs a round trip on every checkout; connections that
+    were returned a moment ago are almost certainly still alive.
+    """
+    idle_s = settings.db_pool_pre_ping_idle_s
+
+    @event.listens_for(sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_s:
+            return
+        try:
+            sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            # The pool invalidates the record and retries with a fresh connection.
+            raise exc.DisconnectionError() from e
+
+
+def _instrument(sync_engine, label: str):
+    # Read through the engine so the gauges follow the new pool after dispose().
+    POOL_SIZE.labels(label).set_function(lambda: sync_engine.pool.size())
+    POOL_CHECKED_OUT.labels(label).set_function(lambda: sync_engine.pool.checkedout())
+    POOL_OVERFLOW.labels(label).set_function(lambda: max(sync_engine.pool.overflow(), 0))
+    POOL_CHECKOUT_SECONDS.labels(label)
+
+    if settings.db_pool_pre_ping == "idle":
+        _ping_after_idle(sync_engine)
+    sql_metrics.instrument_engine(sync_engine)
+    tracing.instrument_engine(sync_engine)
+
+
 engine = create_engine(
     DATABASE_URL,
-    pool_size=2,
-    max_overflow=0,
-    pool_pre_ping=True,
+    poolclass=TimedQueuePool,
+    **_pool_options(),
 )
+_instrument(engine, TimedQueuePool.engine_label)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
-class Base(DeclarativeBase):
+# The async engine does not connect until first use, so it is cheap to build
+# even when DB_ASYNC is off and only the sync path is exercised.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=TimedAsyncQueuePool,
+    **_pool_options(),
+)
+_instrument(async_engine.sync_engine, TimedAsyncQueuePool.engine_label)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+# --------------------
+# Tenant routing
+# --------------------
+class UnknownTenantError(LookupError):
     pass
 
+
+_TENANT_SCHEMAS_SQL = text(
+    "SELECT nspname FROM pg_namespace "
+    "WHERE nspname NOT LIKE 'pg\\_%' AND nspname <> 'information_schema'"
+)
+
+
+class TenantSchemas:
+    """Cached allow-list of the schemas a tenant id may resolve to.
+
+    The list is loaded lazily and refreshed on a miss, at most once per
+    `refresh_s`, so a newly provisioned tenant is picked up without letting
+    bogus X-Tenant-Id values turn into a catalog query per request.
+    """
+
+    def __init__(self, refresh_s: float):
+        self.refresh_s = refresh_s
+        self._schemas = frozenset()
+        self._loaded_at = None
+
+    def _needs_refresh(self, schema: str) -> bool:
+        if schema in self._schemas:
+            return False
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_s
+
+    def _store(self, names):
+        self._schemas = frozenset(names)
+        self._loaded_at = time.monotonic()
+
+    def _check(self, schema: str) -> str:
+        if schema not in self._schemas:
+            raise UnknownTenantError(schema)
+        return schema
+
+    def load(self):
+        with engine.connect() as conn:
+            self._store(conn.execute(_TENANT_SCHEMAS_SQL).scalars().all())
+
+    async def aload(self):
+        async with async_engine.connect() as conn:
+            self._store((await conn.execute(_TENANT_SCHEMAS_SQL)).scalars().all())
+
+    def validate(self, schema: str) -> str:
+        if self._needs_refresh(schema):
+            self.load()
+        return self._check(schema)
+
+    async def avalidate(self, schema: str) -> str:
+        if self._needs_refresh(schema):
+            await self.aload()
+        return self._check(schema)
+
+    def clear(self):
+        self._schemas = frozenset()
+        self._loaded_at = None
+
+
+tenant_schemas = TenantSchemas(refresh_s=settings.tenant_schema_refresh_s)
+
+# One execution-options view of each engine per tenant. Unqualified tables are
+# rendered as "<schema>.users" at compile time, so sessions need no
+# `SET search_path` round trip and pooled connections stay tenant-neutral.
+_tenant_engines = {}
+_async_tenant_engines = {}
+
+
+def _tenant_engine(schema: str):
+    bound = _tenant_engines.get(schema)
+    if bound is None:
+        bound = engine.execution_options(schema_translate_map={None: schema})
+        _tenant_engines[schema] = bound
+    return bound
+
+
+def _async_tenant_engine(schema: str):
+    bound = _async_tenant_engines.get(schema)
+    if bound is None:
+        bound = async_engine.execution_options(schema_translate_map={None: schema})
+        _async_tenant_engines[schema] = bound
+    return bound
+
+
 @contextmanager
 def get_db_session(schema: str = None):
-    session = SessionLocal()
+    with tracing.child_span("db.session", attributes={"tenant.id": schema or "public"}):
+        schema = tenant_schemas.validate(schema or "public")
+    session = SessionLocal(bind=_tenant_engine(schema))
     try:
-        session.execute(text(f"SET search_path TO {schema}"))
         yield session
     finally:
         session.close()
+
+@asynccontextmanager
+async def get_async_db_session(schema: str = None):
+    with tracing.child_span("db.session", attributes={"tenant.id": schema or "public"}):
+        schema = await tenant_schemas.avalidate(schema or "public")
+    session = AsyncSessionLocal(bind=_async_tenant_engine(schema))
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+class ThreadedSession:
+    """Awaitable facade over a sync Session.
+
+    Lets the async route handlers run unchanged on the psycopg2 engine when
+    DB_ASYNC is off: every blocking call is pushed to the threadpool, which is
+    what the original sync handlers did implicitly.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+# --------------------
+# Prewarm
+# --------------------
+def _open_sync(connections: int):
+    opened = [engine.connect() for _ in range(connections)]
+    for conn in opened:
+        conn.close()
+
+
+async def prewarm_pool(connections: int):
+    """Open up to `connections` pooled connections on the engine serving requests.
+
+    Also loads the tenant allow-list, so the first requests after a deploy
+    neither connect to Postgres nor query the catalog. Connections beyond
+    DB_POOL_SIZE would be discarded on return, so that is the cap.
+    """
+    connections = min(connections, settings.db_pool_size)
+    if settings.db_async:
+        opened = await asyncio.gather(*(async_engine.connect().start() for _ in range(connections)))
+        await asyncio.gather(*(conn.close() for conn in opened))
+        await tenant_schemas.aload()
+    else:
+        await run_in_threadpool(_open_sync, connections)
+        await run_in_threadpool(tenant_schemas.load)
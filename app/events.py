@@ -0,0 +1,530 @@
+"""Asyncio event consumer that can run inside the API process.
+
+Each routing key has its own durable queue (plus the dead-letter and delay
+queues of `app.rabbitmq_consumer.queue_topology`) and one registered async
+handler. Deliveries are fanned out to a fixed number of worker tasks; on
+shutdown the consumer stops taking new deliveries and drains what it already
+holds before closing the connection.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Protocol
+
+from prometheus_client import Counter, Gauge
+from pydantic import ValidationError
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app import tracing
+from app.cache import user_cache
+from app.config import settings
+from app.database import get_async_db_session
+from app.models import User
+from app.rabbitmq_consumer import (
+    EVENTS,
+    OUTCOMES,
+    RETRY_HEADER,
+    CONSUMER_MAX_RETRIES,
+    PoisonMessage,
+    attempts,
+    classify,
+    dead_letter_queue,
+    parse_event,
+    queue_topology,
+    retry_delay_ms,
+    retry_queue,
+)
+from app.schemas import UserUpdate
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_CONNECTED = Gauge(
+    "events_consumer_connected", "1 while the in-process event consumer is connected to its broker"
+)
+RECONNECTS = Counter("events_consumer_reconnects_total", "Broker connections lost by the event consumer")
+
+
+@dataclass
+class Delivery:
+    routing_key: str
+    body: bytes
+    headers: dict = field(default_factory=dict)
+    ack: Callable[[], None] = lambda: None
+
+
+class Broker(Protocol):
+    """What EventConsumer needs from a message broker."""
+
+    async def connect(self) -> None: ...
+
+    async def declare(self, queue: str, arguments: dict | None = None) -> None: ...
+
+    async def consume(self, queue: str, on_delivery: Callable[[Delivery], None]) -> None: ...
+
+    async def cancel(self) -> None: ...
+
+    async def publish(self, routing_key: str, body: bytes, headers: dict) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def wait_closed(self) -> None:
+        """Return once the connection is gone, whoever closed it."""
+
+
+# --------------------
+# Brokers
+# --------------------
+
+class PikaBroker:
+    """RabbitMQ through pika's AsyncioConnection on the running event loop.
+
+    pika is imported on connect, so the API only loads it with this broker.
+    """
+
+    def __init__(self, url: str, prefetch: int):
+        self.url = url
+        self.prefetch = prefetch
+        self._connection = None
+        self._channel = None
+        self._consumer_tags = []
+        self._closed = None
+
+    async def _wait(self, start: Callable[[Callable], None]):
+        """Run a callback-style pika call and wait for its callback."""
+        future = asyncio.get_running_loop().create_future()
+
+        def _done(result=None):
+            if not future.done():
+                future.set_result(result)
+
+        start(_done)
+        return await future
+
+    async def connect(self):
+        import pika
+        from pika.adapters.asyncio_connection import AsyncioConnection
+
+        loop = asyncio.get_running_loop()
+        opened = loop.create_future()
+        self._closed = loop.create_future()
+        self._consumer_tags = []
+
+        def _on_open_error(connection, error):
+            if not opened.done():
+                opened.set_exception(ConnectionError(f"RabbitMQ connection failed: {error!r}"))
+
+        def _on_closed(connection, reason):
+            if not self._closed.done():
+                self._closed.set_result(reason)
+
+        self._connection = AsyncioConnection(
+            pika.URLParameters(self.url),
+            on_open_callback=lambda connection: opened.set_result(connection),
+            on_open_error_callback=_on_open_error,
+            on_close_callback=_on_closed,
+            custom_ioloop=loop,
+        )
+        def _on_channel_closed(channel, reason):
+            # Without its channel the connection is useless: close it, so
+            # wait_closed() reports the loss and the consumer reconnects.
+            if not (self._connection.is_closing or self._connection.is_closed):
+                self._connection.close()
+
+        await opened
+        self._channel = await self._wait(lambda done: self._connection.channel(on_open_callback=done))
+        self._channel.add_on_close_callback(_on_channel_closed)
+        await self._wait(lambda done: self._channel.basic_qos(prefetch_count=self.prefetch, callback=done))
+
+    async def declare(self, queue, arguments=None):
+        await self._wait(lambda done: self._channel.queue_declare(
+            queue, durable=True, arguments=arguments, callback=done
+        ))
+
+    async def consume(self, queue, on_delivery):
+        channel = self._channel
+
+        def _on_message(ch, method, properties, body):
+            def _ack():
+                # Tags are per channel: after a reconnect RabbitMQ redelivers
+                # the message, so an ack for the old channel is dropped.
+                if channel.is_open:
+                    channel.basic_ack(method.delivery_tag)
+
+            on_delivery(Delivery(
+                routing_key=queue,
+                body=body,
+                headers=properties.headers or {},
+                ack=_ack,
+            ))
+
+        self._consumer_tags.append(channel.basic_consume(queue, _on_message))
+
+    async def cancel(self):
+        if self._channel is None or not self._channel.is_open:
+            self._consumer_tags.clear()
+            return
+        for tag in self._consumer_tags:
+            await self._wait(lambda done: self._channel.basic_cancel(tag, callback=done))
+        self._consumer_tags.clear()
+
+    async def publish(self, routing_key, body, headers):
+        import pika
+
+        self._channel.basic_publish(
+            exchange="",
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(delivery_mode=2, headers=headers),
+        )
+
+    async def close(self):
+        if self._connection is not None and not self._connection.is_closed:
+            if not self._connection.is_closing:
+                self._connection.close()
+            await self._closed
+
+    async def wait_closed(self):
+        # Shielded: a cancelled waiter must not cancel the future close() awaits.
+        await asyncio.shield(self._closed)
+
+
+class InMemoryBroker:
+    """Broker stand-in for tests and local runs without RabbitMQ.
+
+    Queues are plain lists. Messages published to a consumed queue are
+    delivered on the next loop iteration; everything else (dead-letter and
+    delay queues included) just accumulates in `queues`. `disconnect()`
+    simulates a lost connection: unacked deliveries go back to their queue
+    and late acks for them are ignored, as with RabbitMQ. Set `fail_connects`
+    to make that many connect attempts fail.
+    """
+
+    def __init__(self):
+        self.queues: dict[str, list[Delivery]] = {}
+        self.acked: list[Delivery] = []
+        self.connects = 0
+        self.fail_connects = 0
+        self._consumers: dict[str, Callable[[Delivery], None]] = {}
+        self._unacked: list[Delivery] = []
+        self._lost = asyncio.Event()
+
+    async def connect(self):
+        if self.fail_connects:
+            self.fail_connects -= 1
+            raise ConnectionError("RabbitMQ connection failed: broker down")
+        self.connects += 1
+        self._lost = asyncio.Event()
+
+    async def declare(self, queue, arguments=None):
+        self.queues.setdefault(queue, [])
+
+    async def consume(self, queue, on_delivery):
+        self._consumers[queue] = on_delivery
+        pending, self.queues[queue] = self.queues.get(queue, []), []
+        for delivery in pending:
+            self._deliver(delivery)
+
+    async def cancel(self):
+        self._consumers.clear()
+
+    async def publish(self, routing_key, body, headers):
+        delivery = Delivery(routing_key, body, dict(headers or {}))
+        if routing_key in self._consumers:
+            self._deliver(delivery)
+        else:
+            self.queues.setdefault(routing_key, []).append(delivery)
+
+    def _deliver(self, delivery):
+        connection = self._lost
+
+        def _ack():
+            if connection is self._lost and not connection.is_set():
+                self._unacked.remove(delivery)
+                self.acked.append(delivery)
+
+        delivery.ack = _ack
+        self._unacked.append(delivery)
+        asyncio.get_running_loop().call_soon(self._consumers[delivery.routing_key], delivery)
+
+    def disconnect(self):
+        """Drop the connection as a broker restart would."""
+        self._consumers.clear()
+        for delivery in reversed(self._unacked):
+            self.queues.setdefault(delivery.routing_key, []).insert(
+                0, Delivery(delivery.routing_key, delivery.body, delivery.headers)
+            )
+        self._unacked.clear()
+        self._lost.set()
+
+    async def close(self):
+        self._consumers.clear()
+        self._lost.set()
+
+    async def wait_closed(self):
+        await self._lost.wait()
+
+
+def make_broker() -> Broker:
+    if settings.events_broker == "memory":
+        return InMemoryBroker()
+    return PikaBroker(settings.rabbitmq_url, prefetch=settings.events_prefetch)
+
+
+# --------------------
+# Consumer
+# --------------------
+
+Handler = Callable[[dict], Awaitable[bool]]
+HANDLERS: dict[str, Handler] = {}
+
+
+def handler(routing_key: str):
+    """Register an async handler; it returns False when the event was a no-op."""
+    def register(fn: Handler) -> Handler:
+        HANDLERS[routing_key] = fn
+        for outcome in OUTCOMES:
+            EVENTS.labels(routing_key, outcome)
+        return fn
+    return register
+
+
+class EventConsumer:
+    """Runs the registered handlers over a broker, reconnecting when it drops.
+
+    A broker that is down at startup, or a connection lost later (broker
+    restart, network blip), is retried in the background with exponential
+    backoff, re-declaring the queues and consuming again. Deliveries that
+    were held when the connection dropped are discarded unacked; RabbitMQ
+    redelivers them.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        handlers: dict[str, Handler] | None = None,
+        workers: int = 8,
+        reconnect_initial_s: float = 0.5,
+        reconnect_max_s: float = 30.0,
+    ):
+        self.broker = broker
+        self.handlers = dict(HANDLERS if handlers is None else handlers)
+        self.workers = workers
+        self.reconnect_initial_s = reconnect_initial_s
+        self.reconnect_max_s = reconnect_max_s
+        self.connected = False
+        self._queue: asyncio.Queue[Delivery] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._supervisor: asyncio.Task | None = None
+
+    async def start(self):
+        """Start the workers and connect; never fails because the broker is down."""
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        try:
+            await self._connect()
+        except Exception as e:
+            logger.warning("[EVENTS] broker unavailable (%s), retrying in the background", e)
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def _connect(self):
+        await self.broker.connect()
+        try:
+            for routing_key in self.handlers:
+                for name, arguments in queue_topology(routing_key):
+                    await self.broker.declare(name, arguments)
+            for routing_key in self.handlers:
+                await self.broker.consume(routing_key, self._queue.put_nowait)
+        except BaseException:
+            await self.broker.close()
+            raise
+        self._set_connected(True)
+        logger.info("[EVENTS] consuming %s with %s workers", ", ".join(self.handlers), self.workers)
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        CONSUMER_CONNECTED.set(int(connected))
+
+    def _drop_held(self) -> int:
+        dropped = 0
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            dropped += 1
+        return dropped
+
+    async def _supervise(self):
+        delay = self.reconnect_initial_s
+        while True:
+            if self.connected:
+                await self.broker.wait_closed()
+                self._set_connected(False)
+                RECONNECTS.inc()
+                logger.warning(
+                    "[EVENTS] broker connection lost, %s held deliveries dropped; reconnecting",
+                    self._drop_held(),
+                )
+                delay = self.reconnect_initial_s
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+            except Exception as e:
+                delay = min(delay * 2, self.reconnect_max_s)
+                logger.warning("[EVENTS] reconnect failed (%s), next attempt in %.1fs", e, delay)
+
+    async def stop(self, drain_timeout_s: float = 10.0):
+        """Stop consuming, finish what was already delivered, then disconnect.
+
+        Deliveries still queued after `drain_timeout_s` stay unacked and are
+        redelivered by the broker once the connection closes.
+        """
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        if self.connected:
+            await self.broker.cancel()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout_s)
+        except asyncio.TimeoutError:
+            logger.warning("[EVENTS] drain timed out with %s deliveries left", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._set_connected(False)
+        await self.broker.close()
+
+    async def _work(self):
+        while True:
+            delivery = await self._queue.get()
+            try:
+                await self.process(delivery)
+            except Exception:
+                logger.exception("[EVENTS] failed to settle a %s delivery", delivery.routing_key)
+            finally:
+                self._queue.task_done()
+
+    async def process(self, delivery: Delivery):
+        queue = delivery.routing_key
+        with tracing.consumer_span(queue, delivery.headers):
+            try:
+                changed = await self.handlers[queue](parse_event(delivery.body, required=("user_id",)))
+            except Exception as e:
+                verdict = classify(e)
+                if verdict == "dead_letter":
+                    await self._dead_letter(delivery, f"{type(e).__name__}: {e}")
+                    return
+                if verdict == "retry":
+                    await self._retry(delivery, f"{type(e).__name__}: {e}")
+                    return
+                changed = False
+
+            delivery.ack()
+            EVENTS.labels(queue, "processed" if changed else "duplicate").inc()
+
+    async def _dead_letter(self, delivery: Delivery, reason: str):
+        logger.error("[EVENT:DEAD_LETTER] %s | %s", delivery.routing_key, reason)
+        await self.broker.publish(dead_letter_queue(delivery.routing_key), delivery.body, tracing.inject({
+            RETRY_HEADER: attempts(delivery.headers),
+            "x-error": reason[:500],
+        }))
+        delivery.ack()
+        EVENTS.labels(delivery.routing_key, "dead_lettered").inc()
+
+    async def _retry(self, delivery: Delivery, reason: str):
+        attempt = attempts(delivery.headers) + 1
+        if attempt > CONSUMER_MAX_RETRIES:
+            await self._dead_letter(delivery, f"gave up after {attempt - 1} retries: {reason}")
+            return
+        logger.warning(
+            "[EVENT:RETRY] %s | attempt=%s in %sms: %s",
+            delivery.routing_key, attempt, retry_delay_ms(attempt), reason,
+        )
+        await self.broker.publish(
+            retry_queue(attempt, delivery.routing_key), delivery.body, tracing.inject({RETRY_HEADER: attempt})
+        )
+        delivery.ack()
+        EVENTS.labels(delivery.routing_key, "retried").inc()
+
+
+# --------------------
+# Handlers
+# --------------------
+
+class UserNotFoundYet(Exception):
+    """The event refers to a user this tenant does not have (yet).
+
+    Queues are consumed independently, so an update can overtake the
+    user_created event it depends on; the message is retried.
+    """
+
+
+def _require(event: dict, *fields):
+    missing = [f for f in fields if f not in event]
+    if missing:
+        raise PoisonMessage(f"missing fields: {', '.join(missing)}")
+
+
+def _tenant(event: dict) -> str:
+    return event.get("tenant_id", "public")
+
+
+@handler("user_created")
+async def on_user_created(event: dict) -> bool:
+    _require(event, "username", "email")
+    stmt = (
+        insert(User.__table__)
+        .values(id=event["user_id"], username=event["username"], email=event["email"])
+        .on_conflict_do_nothing()
+        .returning(User.__table__.c.id)
+    )
+    async with get_async_db_session(schema=_tenant(event)) as db:
+        created = (await db.execute(stmt)).first() is not None
+        await db.commit()
+    await user_cache.ainvalidate(_tenant(event), event["user_id"])
+    return created
+
+
+async def _update_user(event: dict, values: dict) -> bool:
+    stmt = (
+        update(User.__table__)
+        .where(User.__table__.c.id == event["user_id"])
+        .values(**values, updated_at=datetime.utcnow())
+        .returning(User.__table__.c.id)
+    )
+    async with get_async_db_session(schema=_tenant(event)) as db:
+        if (await db.execute(stmt)).first() is None:
+            raise UserNotFoundYet(event["user_id"])
+        await db.commit()
+    await user_cache.ainvalidate(_tenant(event), event["user_id"])
+    return True
+
+
+@handler("user_updated")
+async def on_user_updated(event: dict) -> bool:
+    fields = {k: v for k, v in event.items() if k not in ("user_id", "tenant_id")}
+    try:
+        values = UserUpdate.model_validate(fields).model_dump(exclude_unset=True)
+    except ValidationError as e:
+        raise PoisonMessage(str(e)) from None
+    values.pop("cart", None)  # carts change through the cart endpoints only
+    if not values:
+        return False
+    return await _update_user(event, values)
+
+
+@handler("partner_assigned")
+async def on_partner_assigned(event: dict) -> bool:
+    _require(event, "partner_id")
+    return await _update_user(event, {"partner_id": event["partner_id"]})
+
+
+@handler("user_deleted")
+async def on_user_deleted(event: dict) -> bool:
+    stmt = delete(User.__table__).where(User.__table__.c.id == event["user_id"])
+    async with get_async_db_session(schema=_tenant(event)) as db:
+        deleted = (await db.execute(stmt)).rowcount > 0
+        await db.commit()
+    await user_cache.ainvalidate(_tenant(event), event["user_id"])
+    return deleted
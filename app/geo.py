@@ -0,0 +1,65 @@
+"""Distance math and the grid cells behind the users.geo_cell index.
+
+The earth is cut into GEO_CELL_DEG x GEO_CELL_DEG cells (about 5.5 km x 3.9 km
+around Slovenia). `users.geo_cell` is a generated column holding the cell of
+each user's coordinates, so a radius query becomes a B-tree lookup of the few
+cells covering its bounding box followed by an exact distance check.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+GEO_CELL_DEG = 0.05
+GEO_CELL_COLUMNS = round(360 / GEO_CELL_DEG)
+
+# Must compute exactly what `geo_cell()` does.
+GEO_CELL_SQL = (
+    f"floor((latitude + 90) / {GEO_CELL_DEG})::integer * {GEO_CELL_COLUMNS}"
+    f" + floor((longitude + 180) / {GEO_CELL_DEG})::integer"
+)
+
+
+def geo_cell(lat: float, lon: float) -> int:
+    return math.floor((lat + 90) / GEO_CELL_DEG) * GEO_CELL_COLUMNS + math.floor((lon + 180) / GEO_CELL_DEG)
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle; no antimeridian wrap."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+    # The circle is widest at the latitude closest to a pole, not at its centre.
+    widest = max(abs(min_lat), abs(max_lat))
+    dlon = max(dlon, math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(widest)))))
+    return min_lat, max_lat, max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def cells_for_box(min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> list[int]:
+    rows = range(math.floor((min_lat + 90) / GEO_CELL_DEG), math.floor((max_lat + 90) / GEO_CELL_DEG) + 1)
+    cols = range(math.floor((min_lon + 180) / GEO_CELL_DEG), math.floor((max_lon + 180) / GEO_CELL_DEG) + 1)
+    return [r * GEO_CELL_COLUMNS + c for r in rows for c in cols]
+
+
+def haversine_m(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Great-circle distances in metres from (lat, lon) to each of `lats`/`lons`."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def nearest(lat: float, lon: float, lats, lons, radius_m: float | None = None, k: int | None = None):
+    """Indices and distances of the points within `radius_m`, closest first, at most `k`.
+
+    The in-memory counterpart of the SQL query: vectorised over all points.
+    """
+    distances = haversine_m(lat, lon, lats, lons)
+    candidates = np.arange(len(distances)) if radius_m is None else np.flatnonzero(distances <= radius_m)
+    if k is not None and len(candidates) > k:
+        candidates = candidates[np.argpartition(distances[candidates], k - 1)[:k]]
+    order = candidates[np.argsort(distances[candidates], kind="stable")]
+    return order, distances[order]
@@ -0,0 +1,208 @@
+"""Offline geocoding index for Slovenian addresses.
+
+Built once from an address dataset (CSV, or Parquet when pyarrow is
+installed) with the columns street, house_number, postcode, city, lat, lon:
+
+    python -m app.geocoder build addresses.csv /var/lib/user-service/geocoder
+
+The index directory holds flat numpy arrays that are memory-mapped on load,
+so a country-sized dataset costs little resident memory and no parse time:
+
+* keys.bin + key_offsets.npy: normalised "street number city" search keys,
+  sorted, for binary-searched prefix lookups;
+* labels.bin + label_offsets.npy: display labels in the same order;
+* coords.npy: (lat, lon) per entry;
+* rank.npy: position of each entry in natural address order, so house
+  number 2 sorts before 10.
+"""
+import csv
+import functools
+import logging
+import mmap
+import os
+import re
+import sys
+
+import numpy as np
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+PLACE_ID_PREFIX = "local:"
+
+GEOCODER_LOOKUPS = Counter(
+    "geocoder_lookups_total", "Local geocoding index lookups", ["op", "result"]
+)
+for _op in ("autocomplete", "place"):
+    for _result in ("hit", "miss"):
+        GEOCODER_LOOKUPS.labels(_op, _result)
+
+
+def search_key(text: str) -> str:
+    return " ".join(w for w in re.split(r"[\s,]+", text.casefold()) if w)
+
+
+def _house_number_order(house_number: str):
+    match = re.match(r"(\d*)(.*)", house_number.strip())
+    return int(match.group(1) or 0), match.group(2).casefold()
+
+
+def read_rows(path: str):
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet needs pyarrow; convert the dataset to CSV or install it") from None
+        yield from pq.read_table(path).to_pylist()
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _write_strings(blob_path: str, offsets_path: str, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(blob_path, "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(offsets_path, offsets)
+
+
+def build_index(rows, out_dir: str) -> int:
+    """Write the index for `rows` (dicts) into `out_dir`; returns the entry count."""
+    entries = []
+    for row in rows:
+        street, number = row["street"].strip(), str(row["house_number"]).strip()
+        postcode, city = str(row.get("postcode") or "").strip(), row["city"].strip()
+        entries.append((
+            search_key(f"{street} {number} {city}"),
+            f"{street} {number}, {postcode} {city}".replace(",  ", ", ").strip(),
+            float(row["lat"]),
+            float(row["lon"]),
+            (search_key(street), search_key(city), _house_number_order(number)),
+        ))
+    entries.sort(key=lambda e: e[0])
+
+    natural = sorted(range(len(entries)), key=lambda i: entries[i][4])
+    rank = np.empty(len(entries), dtype=np.int32)
+    rank[natural] = np.arange(len(entries), dtype=np.int32)
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = functools.partial(os.path.join, out_dir)
+    _write_strings(path("keys.bin"), path("key_offsets.npy"), (e[0] for e in entries))
+    _write_strings(path("labels.bin"), path("label_offsets.npy"), (e[1] for e in entries))
+    coords = np.array([(e[2], e[3]) for e in entries], dtype=np.float64).reshape(-1, 2)
+    np.save(path("coords.npy"), coords)
+    np.save(path("rank.npy"), rank)
+    return len(entries)
+
+
+class GeocodingIndex:
+    """Read-only view over an index directory written by `build_index`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._keys = self._map(os.path.join(path, "keys.bin"))
+        self._key_offsets = self._load(os.path.join(path, "key_offsets.npy"))
+        self._labels = self._map(os.path.join(path, "labels.bin"))
+        self._label_offsets = self._load(os.path.join(path, "label_offsets.npy"))
+        self._coords = self._load(os.path.join(path, "coords.npy"))
+        self._rank = self._load(os.path.join(path, "rank.npy"))
+        self.size = len(self._key_offsets) - 1
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _load(path: str) -> np.ndarray:
+        # Still memory-mapped, but as a plain ndarray view: indexing the
+        # np.memmap subclass directly costs microseconds per element.
+        return np.asarray(np.load(path, mmap_mode="r"))
+
+    @staticmethod
+    def _map(path: str):
+        # Plain mmap: slicing it yields bytes, far cheaper than numpy memmap views.
+        if os.path.getsize(path) == 0:
+            return b""
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _key(self, i: int) -> bytes:
+        return self._keys[self._key_offsets[i]:self._key_offsets[i + 1]]
+
+    def _label(self, i: int) -> str:
+        return self._labels[self._label_offsets[i]:self._label_offsets[i + 1]].decode("utf-8")
+
+    def prefix_range(self, prefix: str) -> tuple[int, int]:
+        """[lo, hi) of the entries whose key starts with `prefix`."""
+        p = prefix.encode("utf-8")
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < p:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid)[:len(p)] == p:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def autocomplete(self, text: str, limit: int = 5) -> list[dict]:
+        """Up to `limit` entries starting with `text`, in natural address order."""
+        prefix = search_key(text)
+        lo, hi = self.prefix_range(prefix) if prefix else (0, 0)
+        if hi - lo > limit:
+            ranks = self._rank[lo:hi]
+            picked = np.argpartition(ranks, limit)[:limit]
+            rows = lo + picked[np.argsort(ranks[picked])]
+        else:
+            rows = np.arange(lo, hi)[np.argsort(self._rank[lo:hi])]
+        GEOCODER_LOOKUPS.labels("autocomplete", "hit" if len(rows) else "miss").inc()
+        return [
+            {"description": self._label(int(i)), "place_id": f"{PLACE_ID_PREFIX}{int(i)}"}
+            for i in rows
+        ]
+
+    def place(self, place_id: str) -> dict | None:
+        """Resolve a `local:<n>` id returned by `autocomplete` of this index."""
+        try:
+            i = int(place_id.removeprefix(PLACE_ID_PREFIX))
+        except ValueError:
+            i = -1
+        if not 0 <= i < self.size:
+            GEOCODER_LOOKUPS.labels("place", "miss").inc()
+            return None
+        GEOCODER_LOOKUPS.labels("place", "hit").inc()
+        lat, lon = self._coords[i]
+        return {
+            "formatted_address": self._label(i),
+            "latitude": float(lat),
+            "longitude": float(lon),
+        }
+
+
+_index: GeocodingIndex | None = None
+
+
+def load_index(path: str) -> GeocodingIndex:
+    global _index
+    _index = GeocodingIndex(path)
+    logger.info("[GEOCODER] loaded %s addresses from %s", len(_index), path)
+    return _index
+
+
+def get_index() -> GeocodingIndex | None:
+    return _index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("usage: python -m app.geocoder build <addresses.csv|.parquet> <index dir>")
+    count = build_index(read_rows(sys.argv[2]), sys.argv[3])
+    logger.info("[GEOCODER] wrote %s addresses to %s", count, sys.argv[3])
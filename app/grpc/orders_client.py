@@ -1,22 +1,191 @@
+import asyncio
+import itertools
+import json
 import os
+
 import grpc
-from . import orders_pb2, orders_pb2_grpc
+from opentelemetry.trace import SpanKind
+
+from app import tracing
+from app.resilience import Bulkhead, CircuitBreaker
 
 ORDERS_GRPC_HOST = os.getenv("ORDERS_GRPC_HOST", "orders-ms")
 ORDERS_GRPC_PORT = int(os.getenv("ORDERS_GRPC_PORT", "50051"))
+# HTTP/2 multiplexes calls over one connection; more channels only help once a
+# single connection's concurrent-stream limit becomes the bottleneck.
+ORDERS_GRPC_CHANNELS = int(os.getenv("ORDERS_GRPC_CHANNELS", "1"))
+# Bulkhead: upper bound on in-flight calls from this process. Callers beyond
+# it wait up to ORDERS_GRPC_BULKHEAD_WAIT_S (within their deadline) and are
+# then rejected, instead of piling onto a struggling orders-ms.
+ORDERS_GRPC_MAX_CONCURRENCY = int(os.getenv("ORDERS_GRPC_MAX_CONCURRENCY", "64"))
+ORDERS_GRPC_BULKHEAD_WAIT_S = float(os.getenv("ORDERS_GRPC_BULKHEAD_WAIT_S", "0"))
+# Circuit breaker: open after this many consecutive outage-like failures,
+# probe again after the recovery timeout.
+ORDERS_CB_FAILURE_THRESHOLD = int(os.getenv("ORDERS_CB_FAILURE_THRESHOLD", "5"))
+ORDERS_CB_RECOVERY_S = float(os.getenv("ORDERS_CB_RECOVERY_S", "10"))
+ORDERS_CB_HALF_OPEN_CALLS = int(os.getenv("ORDERS_CB_HALF_OPEN_CALLS", "1"))
+
+_SERVICE_CONFIG = json.dumps({
+    "methodConfig": [{
+        "name": [{"service": "orders.v1.OrdersService"}],
+        "retryPolicy": {
+            "maxAttempts": 3,
+            "initialBackoff": "0.05s",
+            "maxBackoff": "0.5s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE"],
+        },
+    }]
+})
+
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30_000),
+    ("grpc.keepalive_timeout_ms", 10_000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.enable_retries", 1),
+    ("grpc.service_config", _SERVICE_CONFIG),
+]
+
+# Status codes that say something about orders-ms health, as opposed to the
+# request itself (NOT_FOUND, INVALID_ARGUMENT, ...).
+_OUTAGE_CODES = {
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.INTERNAL,
+    grpc.StatusCode.UNKNOWN,
+}
+
+
+def _is_outage(error: BaseException) -> bool:
+    if isinstance(error, grpc.aio.AioRpcError):
+        return error.code() in _OUTAGE_CODES
+    return isinstance(error, TimeoutError)
+
+
+class OrdersClient:
+    """Long-lived grpc.aio client for OrdersService.
+
+    Holds a small pool of channels created once on the running event loop, so
+    the TCP and HTTP/2 handshake is paid at startup instead of per request.
+    Calls go through a bulkhead and a circuit breaker, so a slow or failing
+    orders-ms is rejected in microseconds rather than holding requests open.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        channels: int = 1,
+        max_concurrency: int = 64,
+        bulkhead_wait_s: float = 0.0,
+        breaker: CircuitBreaker | None = None,
+    ):
+        # The generated stubs (and protobuf) load with the first client rather
+        # than with app.main.
+        from . import orders_pb2_grpc
+
+        self.target = target
+        self._channels = [
+            grpc.aio.insecure_channel(target, options=CHANNEL_OPTIONS)
+            for _ in range(max(channels, 1))
+        ]
+        self._stubs = [orders_pb2_grpc.OrdersServiceStub(ch) for ch in self._channels]
+        self._next = itertools.count()
+        self.bulkhead = Bulkhead("orders", max_concurrency, max_wait_s=bulkhead_wait_s)
+        self.breaker = breaker or CircuitBreaker("orders", is_failure=_is_outage)
+
+    def _pick(self) -> int:
+        return next(self._next) % len(self._stubs)
 
-def get_orders_by_user(user_id: str, tenant_id: str | None = None, timeout_s: float = 2.0):
-    target = f"{ORDERS_GRPC_HOST}:{ORDERS_GRPC_PORT}"
+    async def get_orders_by_user(self, user_id: str, tenant_id: str | None = None, timeout_s: float = 2.0):
+        """Call GetOrdersByUser; `timeout_s` covers both queueing and the RPC.
 
-    with grpc.insecure_channel(target) as channel:
-        stub = orders_pb2_grpc.OrdersServiceStub(channel)
+        Raises BulkheadFullError or CircuitOpenError without touching the network.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_s
+        with tracing.span(
+            "orders.v1.OrdersService/GetOrdersByUser",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "rpc.system": "grpc",
+                "rpc.service": "orders.v1.OrdersService",
+                "rpc.method": "GetOrdersByUser",
+                "server.address": self.target,
+                "tenant.id": tenant_id or "public",
+            },
+        ):
+            async with self.bulkhead.slot(timeout_s):
+                return await self.breaker.call(
+                    self._get_orders_by_user,
+                    user_id,
+                    tenant_id,
+                    max(deadline - loop.time(), 0.0),
+                )
 
+    async def _get_orders_by_user(self, user_id: str, tenant_id: str | None, timeout_s: float):
         metadata = []
         if tenant_id:
             metadata.append(("x-tenant-id", tenant_id))
+        # traceparent/tracestate, so orders-ms can continue this trace.
+        metadata.extend(tracing.inject({}).items())
 
-        return stub.GetOrdersByUser(
+        from . import orders_pb2
+
+        index = self._pick()
+        if tracing.enabled:
+            tracing.set_attribute("grpc.channel_state", self._channels[index].get_state().name)
+        return await self._stubs[index].GetOrdersByUser(
             orders_pb2.GetOrdersByUserRequest(user_id=user_id),
             timeout=timeout_s,
             metadata=metadata,
         )
+
+    async def wait_ready(self, timeout_s: float):
+        """Connect every channel now instead of on the first call."""
+        await asyncio.wait_for(
+            asyncio.gather(*(channel.channel_ready() for channel in self._channels)), timeout_s
+        )
+
+    async def close(self):
+        for channel in self._channels:
+            await channel.close()
+
+
+_client: OrdersClient | None = None
+# Process-wide, so breaker state survives a client restart.
+_breaker = CircuitBreaker(
+    "orders",
+    failure_threshold=ORDERS_CB_FAILURE_THRESHOLD,
+    recovery_timeout_s=ORDERS_CB_RECOVERY_S,
+    half_open_max_calls=ORDERS_CB_HALF_OPEN_CALLS,
+    is_failure=_is_outage,
+)
+
+
+def start_orders_client() -> OrdersClient:
+    """Create the shared client; must be called from the serving event loop."""
+    global _client
+    if _client is None:
+        _client = OrdersClient(
+            f"{ORDERS_GRPC_HOST}:{ORDERS_GRPC_PORT}",
+            channels=ORDERS_GRPC_CHANNELS,
+            max_concurrency=ORDERS_GRPC_MAX_CONCURRENCY,
+            bulkhead_wait_s=ORDERS_GRPC_BULKHEAD_WAIT_S,
+            breaker=_breaker,
+        )
+    return _client
+
+
+async def close_orders_client():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+async def get_orders_by_user(user_id: str, tenant_id: str | None = None, timeout_s: float = 2.0):
+    # Lazily started for callers outside the API process (scripts, consumers).
+    client = _client or start_orders_client()
+    return await client.get_orders_by_user(user_id, tenant_id=tenant_id, timeout_s=timeout_s)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: users.proto
+# Protobuf Python Version: 6.31.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    6,
+    31,
+    1,
+    '',
+    'users.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from google.protobuf import timestamp_pb2 as google_dot_protobuf_dot_timestamp__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0busers.proto\x12\x08users.v1\x1a\x1fgoogle/protobuf/timestamp.proto\"3\n\x14GetUsersByIdsRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\x12\x0e\n\x06\x66ields\x18\x02 \x03(\t\"\xf3\x02\n\x04User\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08username\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x11\n\x04name\x18\x04 \x01(\tH\x00\x88\x01\x01\x12\x14\n\x07surname\x18\x05 \x01(\tH\x01\x88\x01\x01\x12\x14\n\x07\x61\x64\x64ress\x18\x06 \x01(\tH\x02\x88\x01\x01\x12\x16\n\tlongitude\x18\x07 \x01(\x01H\x03\x88\x01\x01\x12\x15\n\x08latitude\x18\x08 \x01(\x01H\x04\x88\x01\x01\x12\x17\n\npartner_id\x18\t \x01(\tH\x05\x88\x01\x01\x12.\n\ncreated_at\x18\n \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12.\n\nupdated_at\x18\x0b \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x0c\n\x04\x63\x61rt\x18\x0c \x03(\x05\x42\x07\n\x05_nameB\n\n\x08_surnameB\n\n\x08_addressB\x0c\n\n_longitudeB\x0b\n\t_latitudeB\r\n\x0b_partner_id\"K\n\x15GetUsersByIdsResponse\x12\x1d\n\x05users\x18\x01 \x03(\x0b\x32\x0e.users.v1.User\x12\x13\n\x0bmissing_ids\x18\x02 \x03(\t2`\n\x0cUsersService\x12P\n\rGetUsersByIds\x12\x1e.users.v1.GetUsersByIdsRequest\x1a\x1f.users.v1.GetUsersByIdsResponseb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'users_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_GETUSERSBYIDSREQUEST']._serialized_start=58
+  _globals['_GETUSERSBYIDSREQUEST']._serialized_end=109
+  _globals['_USER']._serialized_start=112
+  _globals['_USER']._serialized_end=483
+  _globals['_GETUSERSBYIDSRESPONSE']._serialized_start=485
+  _globals['_GETUSERSBYIDSRESPONSE']._serialized_end=560
+  _globals['_USERSSERVICE']._serialized_start=562
+  _globals['_USERSSERVICE']._serialized_end=658
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,100 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from app.grpc import users_pb2 as users__pb2
+
+GRPC_GENERATED_VERSION = '1.76.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in users_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class UsersServiceStub(object):
+    """Served by user-service; the tenant is taken from the x-tenant-id metadata.
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.GetUsersByIds = channel.unary_unary(
+                '/users.v1.UsersService/GetUsersByIds',
+                request_serializer=users__pb2.GetUsersByIdsRequest.SerializeToString,
+                response_deserializer=users__pb2.GetUsersByIdsResponse.FromString,
+                _registered_method=True)
+
+
+class UsersServiceServicer(object):
+    """Served by user-service; the tenant is taken from the x-tenant-id metadata.
+    """
+
+    def GetUsersByIds(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_UsersServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'GetUsersByIds': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetUsersByIds,
+                    request_deserializer=users__pb2.GetUsersByIdsRequest.FromString,
+                    response_serializer=users__pb2.GetUsersByIdsResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'users.v1.UsersService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('users.v1.UsersService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class UsersService(object):
+    """Served by user-service; the tenant is taken from the x-tenant-id metadata.
+    """
+
+    @staticmethod
+    def GetUsersByIds(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/users.v1.UsersService/GetUsersByIds',
+            users__pb2.GetUsersByIdsRequest.SerializeToString,
+            users__pb2.GetUsersByIdsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
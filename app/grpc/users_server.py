@@ -0,0 +1,95 @@
+import logging
+import os
+from datetime import datetime
+
+import grpc
+from opentelemetry.trace import SpanKind
+
+from app import tracing
+from app.database import UnknownTenantError, get_async_db_session
+from app.schemas import USERS_BATCH_MAX_IDS
+from app.user_lookup import USER_FIELDS, get_users
+
+logger = logging.getLogger(__name__)
+
+# UsersService for other services (orders-ms); off unless a port is set.
+# orders-ms listens on 50051, so pick another port when they share a host.
+USERS_GRPC_PORT = int(os.getenv("USERS_GRPC_PORT") or 0)
+USERS_GRPC_GRACE_S = float(os.getenv("USERS_GRPC_GRACE_S", "5"))
+
+_TIMESTAMP_FIELDS = ("created_at", "updated_at")
+
+
+def _to_message(message, user: dict, fields):
+    """Fill a users_pb2.User `message` from a UserOut payload."""
+    for field in fields or USER_FIELDS:
+        value = user[field]
+        if value is None or field == "id":
+            continue
+        if field in _TIMESTAMP_FIELDS:
+            getattr(message, field).FromDatetime(datetime.fromisoformat(value))
+        elif field == "cart":
+            message.cart.extend(value)
+        else:
+            setattr(message, field, value)
+    return message
+
+
+class UsersServicer:
+    """UsersService; the generated stubs load when the server starts, not with app.main."""
+
+    async def GetUsersByIds(self, request, context):
+        from . import users_pb2
+
+        if len(request.ids) > USERS_BATCH_MAX_IDS:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT, f"At most {USERS_BATCH_MAX_IDS} ids per call"
+            )
+        unknown = set(request.fields) - set(USER_FIELDS)
+        if unknown:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT, f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+
+        metadata = dict(context.invocation_metadata())
+        tenant_id = metadata.get("x-tenant-id") or "public"
+        with tracing.span(
+            "users.v1.UsersService/GetUsersByIds",
+            kind=SpanKind.SERVER,
+            parent=tracing.extract(metadata),
+            attributes={"rpc.system": "grpc", "tenant.id": tenant_id, "users.requested": len(request.ids)},
+        ):
+            try:
+                async with get_async_db_session(schema=tenant_id) as db:
+                    found, missing = await get_users(db, tenant_id, request.ids)
+            except UnknownTenantError:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Unknown tenant")
+
+        return users_pb2.GetUsersByIdsResponse(
+            users=[_to_message(users_pb2.User(id=u["id"]), u, request.fields) for u in found],
+            missing_ids=missing,
+        )
+
+
+_server: grpc.aio.Server | None = None
+
+
+async def start_users_server(port: int = USERS_GRPC_PORT) -> int:
+    """Serve UsersService on the running event loop; returns the bound port."""
+    global _server
+    from . import users_pb2_grpc
+
+    server = grpc.aio.server()
+    users_pb2_grpc.add_UsersServiceServicer_to_server(UsersServicer(), server)
+    bound = server.add_insecure_port(f"[::]:{port}")
+    await server.start()
+    _server = server
+    logger.info("[GRPC] UsersService listening on :%s", bound)
+    return bound
+
+
+async def stop_users_server(grace_s: float = USERS_GRPC_GRACE_S):
+    global _server
+    if _server is not None:
+        server, _server = _server, None
+        await server.stop(grace_s)
@@ -0,0 +1,290 @@
+"""Google Places lookups behind one shared HTTP client and result caches."""
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import httpx
+from opentelemetry.trace import SpanKind
+
+from app import geocoder, tracing
+from app.cache import CACHE_HITS, autocomplete_cache, place_cache
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_PLACE_DETAILS = "https://maps.googleapis.com/maps/api/place/details/json"
+GOOGLE_PLACES_AUTOCOMPLETE = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
+
+_client: httpx.AsyncClient | None = None
+
+
+def start_places_client() -> httpx.AsyncClient:
+    """Create the shared client; connections (and TLS sessions) are reused across requests."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=settings.google_http2,
+            timeout=settings.google_timeout_s,
+            limits=httpx.Limits(
+                max_connections=settings.google_max_connections,
+                max_keepalive_connections=settings.google_max_keepalive,
+            ),
+        )
+    return _client
+
+
+async def close_places_client():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+async def _get(url: str, params: dict) -> dict:
+    client = _client or start_places_client()
+    # No traceparent: Google is outside our traces. The span URL has no key.
+    with tracing.child_span(
+        f"GET {url}", kind=SpanKind.CLIENT, attributes={"http.request.method": "GET", "url.full": url}
+    ) as current:
+        resp = await client.get(url, params={**params, "key": settings.google_api_key})
+        if current is not None:
+            current.set_attribute("http.response.status_code", resp.status_code)
+        resp.raise_for_status()
+        return resp.json()
+
+
+def normalize_input(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def _words(text: str) -> list[str]:
+    return re.split(r"[\s,]+", normalize_input(text))
+
+
+def _matches(prediction: dict, tokens: list[str]) -> bool:
+    """Every query token starts some word of the prediction's description."""
+    words = _words(prediction["description"])
+    return all(any(w.startswith(t) for w in words) for t in tokens)
+
+
+class _Node:
+    __slots__ = ("children", "value")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.value = None
+
+
+class PrefixTrie:
+    """Recent complete prediction sets, keyed by normalised input.
+
+    `longest_prefix("ljubljanska 1")` finds the entry for the longest stored
+    prefix of the input, e.g. "ljubljanska". Entries expire after `ttl_s`;
+    beyond `max_entries` the least recently stored one is dropped. Only used
+    from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._root = _Node()
+        self._keys: OrderedDict[str, None] = OrderedDict()
+
+    def insert(self, key: str, value):
+        if self.max_entries <= 0:
+            return
+        node = self._root
+        for ch in key:
+            node = node.children.setdefault(ch, _Node())
+        node.value = (time.monotonic() + self.ttl_s, value)
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_entries:
+            self.remove(next(iter(self._keys)))
+
+    def remove(self, key: str):
+        self._keys.pop(key, None)
+        path = [self._root]
+        for ch in key:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].value = None
+        # Prune nodes that no longer lead to any entry.
+        for parent, ch in zip(reversed(path[:-1]), reversed(key)):
+            child = parent.children[ch]
+            if child.value is not None or child.children:
+                break
+            del parent.children[ch]
+
+    def longest_prefix(self, text: str):
+        """(key, value) of the longest live entry that is a prefix of `text`."""
+        now = time.monotonic()
+        node, found, expired = self._root, None, []
+        for i, ch in enumerate(text):
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.value is not None:
+                if node.value[0] > now:
+                    found = (text[: i + 1], node.value[1])
+                else:
+                    expired.append(text[: i + 1])
+        for key in expired:
+            self.remove(key)
+        return found
+
+    def clear(self):
+        self._root = _Node()
+        self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+async def place_details(place_id: str, session_token: str | None = None) -> dict | None:
+    """Formatted address and coordinates of `place_id`, or None if Google has no result.
+
+    A `session_token` used for the preceding autocomplete calls ends that
+    typeahead session with this lookup.
+    """
+    if place_id.startswith(geocoder.PLACE_ID_PREFIX):
+        index = geocoder.get_index()
+        return index.place(place_id) if index is not None else None
+
+    key = f"place:{place_id}"
+    cached = await place_cache.aget(key)
+    if cached is not None:
+        return cached
+
+    params = {
+        "place_id": place_id,
+        "fields": "geometry,formatted_address",
+    }
+    if session_token:
+        params["sessiontoken"] = session_token
+    data = await _get(GOOGLE_PLACE_DETAILS, params)
+    result = data.get("result")
+    if not result:
+        return None
+
+    loc = result["geometry"]["location"]
+    place = {
+        "formatted_address": result["formatted_address"],
+        "latitude": loc["lat"],
+        "longitude": loc["lng"],
+    }
+    await place_cache.aset(key, place)
+    return place
+
+
+# Complete result sets (fewer predictions than Google's page size) by input,
+# for answering longer inputs locally.
+prediction_trie = PrefixTrie(
+    max_entries=settings.autocomplete_cache_max_entries,
+    ttl_s=settings.autocomplete_cache_ttl_s,
+)
+# Upstream autocomplete calls in flight, by normalised input.
+_inflight: dict[str, asyncio.Task] = {}
+
+for _tier in ("prefix", "inflight"):
+    CACHE_HITS.labels(autocomplete_cache.name, _tier)
+
+
+def _narrow(query: str) -> list[dict] | None:
+    """Answer `query` from a cached complete result set for one of its prefixes."""
+    hit = prediction_trie.longest_prefix(query)
+    if hit is None:
+        return None
+    tokens = _words(query)
+    narrowed = [p for p in hit[1] if _matches(p, tokens)]
+    # An empty narrowing may just mean the heuristic missed; ask Google.
+    return narrowed or None
+
+
+async def _fetch_predictions(text: str, query: str, session_token: str | None) -> list[dict]:
+    params = {
+        "input": text,
+        "components": "country:si",
+        "types": "geocode",
+    }
+    if session_token:
+        params["sessiontoken"] = session_token
+    data = await _get(GOOGLE_PLACES_AUTOCOMPLETE, params)
+    predictions = [
+        {
+            "description": p["description"],
+            "place_id": p["place_id"],
+        }
+        for p in data.get("predictions", [])
+    ]
+    await autocomplete_cache.aset(f"autocomplete:{query}", predictions)
+    if len(predictions) < settings.autocomplete_complete_below:
+        prediction_trie.insert(query, predictions)
+    return predictions
+
+
+def _fetch_once(text: str, query: str, session_token: str | None) -> asyncio.Task:
+    task = _inflight.get(query)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_predictions(text, query, session_token))
+        _inflight[query] = task
+        task.add_done_callback(lambda _: _inflight.pop(query, None))
+    return task
+
+
+def _inflight_prefix(query: str) -> asyncio.Task | None:
+    for end in range(len(query) - 1, 0, -1):
+        task = _inflight.get(query[:end])
+        if task is not None:
+            return task
+    return None
+
+
+async def autocomplete(text: str, session_token: str | None = None) -> list[dict]:
+    """Predictions for `text`, going upstream only when nothing local can answer.
+
+    In order: exact cache hit; narrowing a complete result set cached for a
+    prefix of the input; joining an identical in-flight call; waiting for an
+    in-flight call for a prefix and narrowing its result; a new Google call.
+    With the local geocoder enabled, its index is asked before any of these.
+    """
+    index = geocoder.get_index()
+    if index is not None:
+        predictions = index.autocomplete(text)
+        if predictions:
+            return predictions
+
+    query = normalize_input(text)
+    cached = await autocomplete_cache.aget(f"autocomplete:{query}")
+    if cached is not None:
+        return cached
+
+    if settings.autocomplete_prefix_reuse:
+        narrowed = _narrow(query)
+        if narrowed is not None:
+            CACHE_HITS.labels(autocomplete_cache.name, "prefix").inc()
+            return narrowed
+
+    task = _inflight.get(query)
+    if task is None and settings.autocomplete_prefix_reuse:
+        # Typeahead: the previous keystroke's call is usually still running.
+        prefix_task = _inflight_prefix(query)
+        if prefix_task is not None:
+            try:
+                await asyncio.shield(prefix_task)
+            except Exception:
+                pass
+            narrowed = _narrow(query)
+            if narrowed is not None:
+                CACHE_HITS.labels(autocomplete_cache.name, "prefix").inc()
+                return narrowed
+            task = _inflight.get(query)
+    if task is not None:
+        CACHE_HITS.labels(autocomplete_cache.name, "inflight").inc()
+    else:
+        task = _fetch_once(text, query, session_token)
+    return await asyncio.shield(task)
@@ -1,19 +1,46 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Query, status, APIRouter
-import httpx
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from typing import List, Optional
-from datetime import timezone
-
-from app.grpc.orders_client import get_orders_by_user
-from app.database import get_db_session, engine
-from app.models import Base, User
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response, status, APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import exc, select
+from starlette.concurrency import run_in_threadpool
+from typing import List, Literal, Optional
+from datetime import datetime, timezone
+import asyncio
+import logging
+import math
+import time
+
+from app.grpc.orders_client import get_orders_by_user, start_orders_client, close_orders_client
+from app.grpc.users_server import USERS_GRPC_PORT, start_users_server, stop_users_server
+from app.database import (
+    get_db_session,
+    get_async_db_session,
+    async_engine,
+    prewarm_pool,
+    ThreadedSession,
+    UnknownTenantError,
+)
+from app.models import User
+from app import bulk, cart as cart_sql, geocoder, location, nearby, tracing, user_lookup
+from app.serialization import respond, user_json_lines, user_payload, user_rows
+from app.sql_metrics import SQLStatsMiddleware
+from app.tracing import TracingMiddleware
+from app.cache import order_history_cache, user_cache
+from app.resilience import RejectedCallError
+from app.events import EventConsumer, make_broker
 from app.schemas import (
     UserCreate,
     UserUpdate,
     UserOut,
     UserOrderHistory,
-    OrderSummaryOut
+    OrderSummaryOut,
+    CartItemsIn,
+    CartItemOut,
+    CartOut,
+    NearbyUserOut,
+    UserImportOut,
+    UsersBatchIn,
+    UsersBatchOut,
 )
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -21,6 +48,8 @@ from prometheus_fastapi_instrumentator import Instrumentator
 from app.config import settings
 
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="User Microservice")
 app.add_middleware(
     CORSMiddleware,
@@ -30,39 +59,137 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(SQLStatsMiddleware)
 
 instrumentator = Instrumentator()
 instrumentator.instrument(app).expose(app)
+# Outermost, so the server span covers every other middleware.
+app.add_middleware(TracingMiddleware)
+
+@app.exception_handler(exc.TimeoutError)
+async def pool_timeout_handler(request: Request, e: exc.TimeoutError):
+    """Pool checkout timed out: shed load instead of surfacing a 500."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database connection pool exhausted"},
+    )
+
+@app.exception_handler(UnknownTenantError)
+async def unknown_tenant_handler(request: Request, e: UnknownTenantError):
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"detail": "Unknown tenant"},
+    )
 
 def get_tenant_id(x_tenant_id: Optional[str] = Header(None)) -> str:
     """Extract tenant ID from header, default to public"""
     return x_tenant_id or "public"
 
-def get_db_with_schema(tenant_id: str = Depends(get_tenant_id)):
-    with get_db_session(schema=tenant_id) as db:
+async def _get_async_db_with_schema(tenant_id: str = Depends(get_tenant_id)):
+    async with get_async_db_session(schema=tenant_id) as db:
         yield db
 
+def _get_sync_db_with_schema(tenant_id: str = Depends(get_tenant_id)):
+    with get_db_session(schema=tenant_id) as db:
+        yield ThreadedSession(db)
+
+get_db_with_schema = (
+    _get_async_db_with_schema if settings.db_async else _get_sync_db_with_schema
+)
+
+def get_request_deadline(
+    x_request_timeout: Optional[float] = Header(None, gt=0),
+) -> float:
+    """Monotonic deadline for outbound calls made on behalf of this request.
+
+    Callers may shrink the budget with X-Request-Timeout (seconds); it never
+    exceeds REQUEST_TIMEOUT_S.
+    """
+    budget = settings.request_timeout_s
+    if x_request_timeout is not None:
+        budget = min(budget, x_request_timeout)
+    return time.monotonic() + budget
+
 # --------------------
 # Startup
 # --------------------
+async def _prewarm():
+    """Open DB and orders connections now rather than on the first requests.
+
+    Startup finishes before uvicorn serves anything, health checks included,
+    so this happens before the pod reports ready. Failures are logged only:
+    a dependency that is down shows up in /health and the circuit breaker.
+    """
+    started = time.perf_counter()
+    steps = {
+        "db": asyncio.wait_for(prewarm_pool(settings.prewarm_connections), settings.prewarm_timeout_s),
+        "orders": start_orders_client().wait_ready(settings.prewarm_timeout_s),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for name, result in zip(steps, results):
+        if isinstance(result, BaseException):
+            logger.warning("[PREWARM] %s failed: %r", name, result)
+    logger.info("[PREWARM] done in %.0f ms", (time.perf_counter() - started) * 1000)
+
 @app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
+async def on_startup():
+    # Tables are not created here: schemas are migrated out of band with
+    # `python -m app.migrations`.
+    if settings.tracing_enabled:
+        tracing.configure()
+    start_orders_client()
+    location.start_places_client()
+    if settings.geocoder_backend == "local":
+        if not settings.geocoder_index_path:
+            raise RuntimeError("GEOCODER_BACKEND=local needs GEOCODER_INDEX_PATH")
+        await run_in_threadpool(geocoder.load_index, settings.geocoder_index_path)
+    app.state.event_consumer = None
+    if settings.events_consumer_enabled:
+        app.state.event_consumer = EventConsumer(
+            make_broker(),
+            workers=settings.events_workers,
+            reconnect_initial_s=settings.events_reconnect_initial_s,
+            reconnect_max_s=settings.events_reconnect_max_s,
+        )
+        await app.state.event_consumer.start()
+    if USERS_GRPC_PORT:
+        await start_users_server()
+    if settings.prewarm_connections:
+        await _prewarm()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Drain events first: their handlers still need the database.
+    if app.state.event_consumer is not None:
+        await app.state.event_consumer.stop(settings.events_drain_timeout_s)
+    await stop_users_server()
+    await close_orders_client()
+    await location.close_places_client()
+    await async_engine.dispose()
+    if settings.tracing_enabled:
+        tracing.shutdown()
 
 # --------------------
 # Health
 # --------------------
 @app.get("/health", tags=["health"])
-def health(db: Session = Depends(get_db_with_schema)):
+async def health(request: Request, db: AsyncSession = Depends(get_db_with_schema)):
     try:
-        db.execute(select(1))
+        await db.execute(select(1))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Database unavailable: {e}",
         )
-    return {"status": "ok", "db": "ok"}
+    body = {"status": "ok", "db": "ok"}
+    # Reported, not failed on: the API serves without the broker, and the
+    # consumer reconnects by itself.
+    consumer = getattr(request.app.state, "event_consumer", None)
+    if consumer is not None:
+        body["events"] = "ok" if consumer.connected else "disconnected"
+    return body
 
 @app.get("/")
 def root():
@@ -74,8 +201,13 @@ router = APIRouter()
 # Create users
 # --------------------
 @router.post("/", response_model=UserOut)
-def create_user(payload: UserCreate, db: Session = Depends(get_db_with_schema)):
-    existing = db.execute(select(User).where(User.id == payload.id)).scalar_one_or_none()
+async def create_user(
+    payload: UserCreate,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    result = await db.execute(select(User).where(User.id == payload.id))
+    existing = result.scalar_one_or_none()
     if existing:
         return existing
 
@@ -83,60 +215,232 @@ def create_user(payload: UserCreate, db: Session = Depends(get_db_with_schema)):
         id=payload.id,
         username=payload.username,
         email=str(payload.email),
-        cart=payload.cart or [],
     )
 
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    if payload.cart:
+        await db.flush()
+        await db.execute(cart_sql.add_items(user.id, payload.cart))
+    await db.commit()
+    await db.refresh(user)
+    await user_cache.ainvalidate(tenant_id, user.id)
     return user
 
 # --------------------
 # List users
 # --------------------
+LIST_USERS_STREAM_BATCH = 1000
+
+_STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+def _list_users_query(
+    partner_id: Optional[str],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    cursor: Optional[str],
+):
+    # Keyset on the primary key: each page is an index range scan, no OFFSET.
+    stmt = select(*cart_sql.USER_COLUMNS).order_by(User.id)
+    if cursor is not None:
+        stmt = stmt.where(User.id > cursor)
+    if partner_id is not None:
+        stmt = stmt.where(User.partner_id == partner_id)
+    if created_from is not None:
+        stmt = stmt.where(User.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(User.created_at < created_to)
+    return stmt
+
+
+async def _stream_users(tenant_id: str, stmt, fmt: str):
+    """Yield every matching user through a server-side cursor.
+
+    Opens its own session because the body is produced after the handler
+    (and its request-scoped session) has returned.
+    """
+    async with get_async_db_session(schema=tenant_id) as db:
+        result = await db.stream(stmt.execution_options(yield_per=LIST_USERS_STREAM_BATCH))
+        if fmt == "json":
+            yield b"["
+        first = True
+        async for rows in result.partitions():
+            items = user_json_lines(rows)
+            if fmt == "ndjson":
+                yield b"\n".join(items) + b"\n"
+            else:
+                yield (b"" if first else b",") + b",".join(items)
+            first = False
+        if fmt == "json":
+            yield b"]"
+
+
 @router.get("/list_users", response_model=List[UserOut])
-def list_users(db: Session = Depends(get_db_with_schema)):
-    users = db.execute(select(User)).scalars().all()
-    return users
+async def list_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    partner_id: Optional[str] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    stream: Optional[Literal["ndjson", "json"]] = Query(
+        None, description="Stream every matching user instead of one page"
+    ),
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    stmt = _list_users_query(partner_id, created_from, created_to, cursor)
+
+    if stream is not None:
+        return StreamingResponse(
+            _stream_users(tenant_id, stmt, stream),
+            media_type=_STREAM_MEDIA_TYPES[stream],
+        )
+
+    result = await db.execute(stmt.limit(limit))
+    users = result.all()
+    next_cursor = {"X-Next-Cursor": users[-1].id} if len(users) == limit else {}
+    response.headers.update(next_cursor)
+    return respond(user_rows(users), headers=next_cursor)
+
+# --------------------
+# Bulk import / export
+# --------------------
+_IMPORT_FORMATS = {"application/x-ndjson": "ndjson", "application/json": "ndjson", "text/csv": "csv"}
+
+
+@router.post("/import", response_model=UserImportOut)
+async def import_users(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = Query(
+        None, description="Defaults from Content-Type (text/csv or application/x-ndjson)"
+    ),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    """Create users from an NDJSON or CSV upload; existing users are left untouched.
+
+    Rows are validated like POST /; invalid and conflicting rows are reported
+    by line number while the rest are loaded.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = _IMPORT_FORMATS.get(content_type, "ndjson")
+    result = await bulk.import_users(tenant_id, request.stream(), format)
+    for user_id in result.inserted_ids:
+        await user_cache.ainvalidate(tenant_id, user_id)
+    return result
+
+
+_EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@router.get("/export")
+async def export_users(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    partner_id: Optional[str] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    """Every matching user, streamed straight from COPY TO in the given format."""
+    stmt = _list_users_query(partner_id, created_from, created_to, None)
+    return StreamingResponse(
+        bulk.export_users(tenant_id, stmt, format),
+        media_type=_EXPORT_MEDIA_TYPES[format],
+    )
+
+# --------------------
+# Get many users by id
+# --------------------
+@router.post("/batch", response_model=UsersBatchOut)
+async def get_users_batch(
+    payload: UsersBatchIn,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    """Users for a batch of ids in one query, in request order; unknown ids are listed in `missing`."""
+    found, missing = await user_lookup.get_users(db, tenant_id, payload.ids)
+    return respond({
+        "users": [user_lookup.project(u, payload.fields) for u in found],
+        "missing": missing,
+    })
+
+# --------------------
+# Users near a point
+# --------------------
+@router.get("/nearby", response_model=List[NearbyUserOut])
+async def nearby_users(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: Optional[float] = Query(None, gt=0, le=settings.nearby_max_radius_m),
+    k: Optional[int] = Query(None, ge=1, le=1000),
+    partner_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db_with_schema),
+):
+    """Users within `radius_m` of (lat, lon), or the `k` nearest; closest first.
+
+    With both, the `k` nearest within the radius. Users without coordinates
+    are never returned.
+    """
+    if radius_m is None and k is None:
+        raise HTTPException(status_code=422, detail="Either radius_m or k is required")
+    return await nearby.find_nearby(db, lat, lon, radius_m, k or limit, partner_id)
+
 
 # --------------------
 # Get user by id
 # --------------------
 @router.get("/{user_id}", response_model=UserOut)
-def get_user(user_id: str, db: Session = Depends(get_db_with_schema)):
-    user = db.execute(
-        select(User).where(User.id == user_id)
-    ).scalar_one_or_none()
+async def get_user(
+    user_id: str,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    out = await user_cache.aget(tenant_id, user_id)
+    if out is None:
+        generation = user_cache.generation()
+        result = await db.execute(cart_sql.select_user(user_id))
+        row = result.first()
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        if row is None:
+            raise HTTPException(status_code=404, detail="User not found")
 
-    return user
+        out = user_payload(row._mapping)
+        await user_cache.aset(tenant_id, user_id, out, generation)
+    return respond(out)
 
 
 # --------------------
 # Update user
 # --------------------
 @router.patch("/{user_id}", response_model=UserOut)
-def update_user(
+async def update_user(
     user_id: str,
     payload: UserUpdate,
-    db: Session = Depends(get_db_with_schema),
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
 ):
-    user = db.execute(
-        select(User).where(User.id == user_id)
-    ).scalar_one_or_none()
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     update_data = payload.model_dump(exclude_unset=True)
+    new_cart = update_data.pop("cart", None)
 
     for field, value in update_data.items():
         setattr(user, field, value)
 
-    db.commit()
-    db.refresh(user)
+    if "cart" in payload.model_fields_set:
+        await db.execute(cart_sql.clear_items(user_id))
+        if new_cart:
+            await db.execute(cart_sql.add_items(user_id, new_cart))
+
+    await db.commit()
+    await db.refresh(user)
+    await user_cache.ainvalidate(tenant_id, user_id)
 
     return user
 
@@ -145,22 +449,47 @@ def update_user(
 # Get user order history
 # --------------------
 @router.get("/{user_id}/orders", response_model=UserOrderHistory)
-def get_user_orders(user_id: str, db: Session = Depends(get_db_with_schema)):
-    user = db.execute(
-        select(User).where(User.id == user_id)
-    ).scalar_one_or_none()
+async def get_user_orders(
+    user_id: str,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+    deadline: float = Depends(get_request_deadline),
+):
+    if await user_cache.aget(tenant_id, user_id) is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+    # Hand the pooled connection back before waiting on the remote call.
+    await db.close()
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+
+    async def _fetch(timeout_s: float) -> UserOrderHistory:
+        resp = await get_orders_by_user(user_id=user_id, tenant_id=tenant_id, timeout_s=timeout_s)
+        return _to_order_history(user_id, resp)
 
     try:
-        resp = get_orders_by_user(user_id=user_id, timeout_s=2.0)
+        return await order_history_cache.get((tenant_id, user_id), _fetch, timeout_s=remaining)
+    except RejectedCallError as e:
+        # Shed by the breaker or bulkhead: orders-ms was not called.
+        raise HTTPException(
+            status_code=503,
+            detail=f"Order service overloaded: {e}",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after_s)))},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=502,
             detail=f"Order service unavailable: {e}",
         )
 
+
+def _to_order_history(user_id: str, resp) -> UserOrderHistory:
     orders_out = []
     for o in resp.orders:
         dt = o.created_at.ToDatetime().replace(tzinfo=timezone.utc)
@@ -182,136 +511,158 @@ def get_user_orders(user_id: str, db: Session = Depends(get_db_with_schema)):
 
 
 # --------------------
-# Add order to cart (duplicates allowed)
+# Cart
 # --------------------
-@router.post("/{user_id}/cart/{order_id}", response_model=UserOut)
-def add_to_cart(
-    user_id: str,
-    order_id: int,
-    db: Session = Depends(get_db_with_schema),
-):
-    user = db.execute(
-        select(User).where(User.id == user_id)
-    ).scalar_one_or_none()
+async def _cart_user_out(db, tenant_id: str, user_id: str):
+    """Commit a cart change and return the user with the updated cart."""
+    result = await db.execute(cart_sql.select_user(user_id))
+    row = result.first()
+    await db.commit()
 
-    if not user:
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if user.cart is None:
-        user.cart = []
+    await user_cache.ainvalidate(tenant_id, user_id)
+    return row._mapping
 
-    user.cart.append(order_id)
 
-    db.commit()
-    db.refresh(user)
+async def _add_cart_items(db, user_id: str, order_ids):
+    try:
+        await db.execute(cart_sql.add_items(user_id, order_ids))
+    except exc.IntegrityError:
+        # cart_items.user_id foreign key: the user does not exist.
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="User not found")
 
-    return user
+
+async def _remove_cart_items(db, user_id: str, order_ids):
+    for stmt in cart_sql.remove_items(user_id, order_ids):
+        await db.execute(stmt)
 
 
 # --------------------
-# Remove ONE order occurrence from cart
+# Get cart only (no profile columns)
 # --------------------
-@router.delete("/{user_id}/cart/{order_id}", response_model=UserOut)
-def remove_from_cart(
+@router.get("/{user_id}/cart", response_model=CartOut)
+async def get_cart(
     user_id: str,
-    order_id: int,
-    db: Session = Depends(get_db_with_schema),
+    db: AsyncSession = Depends(get_db_with_schema),
 ):
-    user = db.execute(
-        select(User).where(User.id == user_id)
-    ).scalar_one_or_none()
+    result = await db.execute(cart_sql.select_cart(user_id))
+    rows = result.all()
 
-    if not user:
+    if not rows:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if user.cart and order_id in user.cart:
-        user.cart.remove(order_id)
-
-    db.commit()
-    db.refresh(user)
+    items = [
+        CartItemOut(order_id=r.order_id, quantity=r.quantity, added_at=r.added_at)
+        for r in rows
+        if r.order_id is not None
+    ]
+    return CartOut(
+        user_id=user_id,
+        items=items,
+        cart=[item.order_id for item in items for _ in range(item.quantity)],
+    )
 
-    return user
 
 # --------------------
-# Empty cart
+# Bulk cart operations
 # --------------------
-@router.delete("/{user_id}/cart", response_model=UserOut)
-def clear_cart(
+@router.post("/{user_id}/cart", response_model=UserOut)
+async def add_many_to_cart(
     user_id: str,
-    db: Session = Depends(get_db_with_schema),
+    payload: CartItemsIn,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
 ):
-    user = db.execute(
-        select(User).where(User.id == user_id)
-    ).scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    if payload.order_ids:
+        await _add_cart_items(db, user_id, payload.order_ids)
+    return await _cart_user_out(db, tenant_id, user_id)
 
-    user.cart = []
 
-    db.commit()
-    db.refresh(user)
+@router.put("/{user_id}/cart", response_model=UserOut)
+async def replace_cart(
+    user_id: str,
+    payload: CartItemsIn,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    await db.execute(cart_sql.clear_items(user_id))
+    if payload.order_ids:
+        await _add_cart_items(db, user_id, payload.order_ids)
+    return await _cart_user_out(db, tenant_id, user_id)
 
-    return user
 
+@router.post("/{user_id}/cart/remove", response_model=UserOut)
+async def remove_many_from_cart(
+    user_id: str,
+    payload: CartItemsIn,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    if payload.order_ids:
+        await _remove_cart_items(db, user_id, payload.order_ids)
+    return await _cart_user_out(db, tenant_id, user_id)
 
-GOOGLE_PLACE_DETAILS = "https://maps.googleapis.com/maps/api/place/details/json"
 
-@app.get("/location/place")
-async def resolve_place(
-    place_id: str = Query(...),
+# --------------------
+# Add order to cart (duplicates allowed)
+# --------------------
+@router.post("/{user_id}/cart/{order_id}", response_model=UserOut)
+async def add_to_cart(
+    user_id: str,
+    order_id: int,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
 ):
-    params = {
-        "place_id": place_id,
-        "key": settings.google_api_key,
-        "fields": "geometry,formatted_address",
-    }
-
-    async with httpx.AsyncClient(timeout=5) as client:
-        resp = await client.get(GOOGLE_PLACE_DETAILS, params=params)
-        resp.raise_for_status()
+    await _add_cart_items(db, user_id, [order_id])
+    return await _cart_user_out(db, tenant_id, user_id)
 
-    data = resp.json()
 
-    result = data.get("result")
-    if not result:
-        raise HTTPException(status_code=404, detail="Place not found")
+# --------------------
+# Remove ONE order occurrence from cart
+# --------------------
+@router.delete("/{user_id}/cart/{order_id}", response_model=UserOut)
+async def remove_from_cart(
+    user_id: str,
+    order_id: int,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    await _remove_cart_items(db, user_id, [order_id])
+    return await _cart_user_out(db, tenant_id, user_id)
 
-    loc = result["geometry"]["location"]
+# --------------------
+# Empty cart
+# --------------------
+@router.delete("/{user_id}/cart", response_model=UserOut)
+async def clear_cart(
+    user_id: str,
+    db: AsyncSession = Depends(get_db_with_schema),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    await db.execute(cart_sql.clear_items(user_id))
+    return await _cart_user_out(db, tenant_id, user_id)
 
-    return {
-        "formatted_address": result["formatted_address"],
-        "latitude": loc["lat"],
-        "longitude": loc["lng"],
-    }
 
+@app.get("/location/place")
+async def resolve_place(
+    place_id: str = Query(...),
+    session_token: Optional[str] = Query(None, max_length=64),
+):
+    place = await location.place_details(place_id, session_token=session_token)
+    if place is None:
+        raise HTTPException(status_code=404, detail="Place not found")
+    return place
 
-GOOGLE_PLACES_AUTOCOMPLETE = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
 
 @app.get("/location/autocomplete")
 async def autocomplete_address(
     input: str = Query(..., min_length=2),
+    session_token: Optional[str] = Query(None, max_length=64),
 ):
-    params = {
-        "input": input,
-        "key": settings.google_api_key,
-        "components": "country:si",
-        "types": "geocode",
-    }
-
-    async with httpx.AsyncClient(timeout=5) as client:
-        resp = await client.get(GOOGLE_PLACES_AUTOCOMPLETE, params=params)
-        resp.raise_for_status()
-
-    data = resp.json()
-
-    return [
-        {
-            "description": p["description"],
-            "place_id": p["place_id"],
-        }
-        for p in data.get("predictions", [])
-    ]
+    return await location.autocomplete(input, session_token=session_token)
 
 
 app.include_router(router)
\ No newline at end of file
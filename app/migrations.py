@@ -0,0 +1,249 @@
+"""Versioned schema migrations, applied to tenant schemas out of band.
+
+Each tenant schema records the migrations it has had in `schema_migrations`.
+A run applies the missing ones in order, in one transaction per schema and
+under a per-schema advisory lock, so a deploy job and a developer running it
+at the same time do not race. Migrations are idempotent, which lets schemas
+created by the old `create_all` on startup be adopted as they are.
+
+    python -m app.migrations              # every tenant schema
+    python -m app.migrations tenant_a     # selected schemas, created if missing
+    python -m app.migrations --status     # pending migrations, applies nothing
+    python -m app.migrations --contract   # also contract steps, after a rollout
+"""
+import argparse
+import logging
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.geo import GEO_CELL_SQL
+from app.models import CartItem
+
+logger = logging.getLogger(__name__)
+
+
+def create_users(conn):
+    """The users table as first released, minus the legacy cart array."""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS users (
+            id VARCHAR(36) NOT NULL PRIMARY KEY,
+            username VARCHAR(150) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            name VARCHAR(255),
+            surname VARCHAR(255),
+            address VARCHAR(500),
+            longitude FLOAT,
+            latitude FLOAT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            partner_id VARCHAR(36)
+        )
+    """))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_id ON users (id)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)"))
+
+
+# While both releases run, each side of the cart is mirrored into the other.
+# Changes made by one trigger do not fire the other (pg_trigger_depth() > 1).
+_SYNC_LEGACY_CART = text("""
+    CREATE OR REPLACE FUNCTION users_cart_to_cart_items() RETURNS trigger LANGUAGE plpgsql
+    -- The schema being migrated: callers reach the table through schema_translate_map.
+    SET search_path FROM CURRENT AS $$
+    BEGIN
+        IF pg_trigger_depth() > 1 OR (TG_OP = 'UPDATE' AND NEW.cart IS NOT DISTINCT FROM OLD.cart) THEN
+            RETURN NULL;
+        END IF;
+        -- Merge rather than replace, so rows keep their added_at.
+        DELETE FROM cart_items
+        WHERE user_id = NEW.id AND NOT order_id = ANY(coalesce(array_remove(NEW.cart, NULL), '{}'));
+        INSERT INTO cart_items (user_id, order_id, quantity, added_at)
+        SELECT NEW.id, c.order_id, count(*), now() + min(c.pos) * interval '1 microsecond'
+        FROM unnest(NEW.cart) WITH ORDINALITY AS c(order_id, pos)
+        WHERE c.order_id IS NOT NULL
+        GROUP BY c.order_id
+        ON CONFLICT (user_id, order_id) DO UPDATE SET quantity = EXCLUDED.quantity
+        WHERE cart_items.quantity <> EXCLUDED.quantity;
+        RETURN NULL;
+    END
+    $$
+""")
+
+_SYNC_CART_ITEMS = text("""
+    CREATE OR REPLACE FUNCTION cart_items_to_users_cart() RETURNS trigger LANGUAGE plpgsql
+    SET search_path FROM CURRENT AS $$
+    BEGIN
+        IF pg_trigger_depth() > 1 THEN
+            RETURN NULL;
+        END IF;
+        UPDATE users u SET cart = coalesce((
+            SELECT array_agg(ci.order_id ORDER BY ci.added_at, ci.order_id)
+            FROM cart_items ci CROSS JOIN LATERAL generate_series(1, ci.quantity)
+            WHERE ci.user_id = u.id
+        ), '{}')
+        WHERE u.id IN (NEW.user_id, OLD.user_id);
+        RETURN NULL;
+    END
+    $$
+""")
+
+
+def migrate_cart_items(conn):
+    """Expand step: copy the legacy users.cart integer array into cart_items.
+
+    Duplicated order ids collapse into one row with a quantity; the order of
+    first occurrence is kept through added_at. The array stays for pods of
+    the previous release, which still read and write it: it gets a default so
+    inserts that leave it out work, and a pair of triggers keeps it and
+    cart_items in step whichever release writes. `drop_users_cart` removes
+    them. Safe to run repeatedly.
+    """
+    CartItem.__table__.create(conn, checkfirst=True)
+
+    has_array = conn.execute(text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'users' AND column_name = 'cart'"
+    )).first()
+    if not has_array:
+        return
+
+    moved = conn.execute(text("""
+        INSERT INTO cart_items (user_id, order_id, quantity, added_at)
+        SELECT u.id, c.order_id, count(*), now() + min(c.pos) * interval '1 microsecond'
+        FROM users u CROSS JOIN LATERAL unnest(u.cart) WITH ORDINALITY AS c(order_id, pos)
+        WHERE c.order_id IS NOT NULL
+        GROUP BY u.id, c.order_id
+        ON CONFLICT (user_id, order_id) DO NOTHING
+    """)).rowcount
+    conn.execute(text("ALTER TABLE users ALTER COLUMN cart SET DEFAULT '{}'"))
+    conn.execute(_SYNC_LEGACY_CART)
+    conn.execute(text("DROP TRIGGER IF EXISTS users_cart_sync ON users"))
+    conn.execute(text(
+        "CREATE TRIGGER users_cart_sync AFTER INSERT OR UPDATE OF cart ON users "
+        "FOR EACH ROW EXECUTE FUNCTION users_cart_to_cart_items()"
+    ))
+    conn.execute(_SYNC_CART_ITEMS)
+    conn.execute(text("DROP TRIGGER IF EXISTS cart_items_sync ON cart_items"))
+    conn.execute(text(
+        "CREATE TRIGGER cart_items_sync AFTER INSERT OR UPDATE OR DELETE ON cart_items "
+        "FOR EACH ROW EXECUTE FUNCTION cart_items_to_users_cart()"
+    ))
+    logger.info("[MIGRATION] cart_items: moved %s rows in schema %s", moved, conn.execute(text("SELECT current_schema()")).scalar())
+
+
+def drop_users_cart(conn):
+    """Contract step for `cart_items`: drop the legacy array and its sync triggers."""
+    conn.execute(text("DROP TRIGGER IF EXISTS users_cart_sync ON users"))
+    conn.execute(text("DROP FUNCTION IF EXISTS users_cart_to_cart_items()"))
+    conn.execute(text("DROP TRIGGER IF EXISTS cart_items_sync ON cart_items"))
+    conn.execute(text("DROP FUNCTION IF EXISTS cart_items_to_users_cart()"))
+    conn.execute(text("ALTER TABLE users DROP COLUMN IF EXISTS cart"))
+
+
+def migrate_users_geo_cell(conn):
+    """Add the generated users.geo_cell column and its index. Safe to run repeatedly."""
+    conn.execute(text(
+        f"ALTER TABLE users ADD COLUMN IF NOT EXISTS geo_cell integer GENERATED ALWAYS AS ({GEO_CELL_SQL}) STORED"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_geo_cell ON users (geo_cell)"))
+
+
+# Append only: a released version is never edited or renumbered.
+MIGRATIONS = [
+    (1, "create_users", create_users),
+    (2, "cart_items", migrate_cart_items),
+    (3, "users_geo_cell", migrate_users_geo_cell),
+    (4, "drop_users_cart", drop_users_cart),
+]
+# Contract steps remove what the previous release still reads, so they wait
+# for `--contract`, run once that release is gone from every pod.
+CONTRACT = {4}
+
+_CREATE_VERSIONS = text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version integer PRIMARY KEY,
+        name varchar(100) NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT now()
+    )
+""")
+
+
+def tenant_schemas(conn):
+    return conn.execute(text(
+        "SELECT DISTINCT table_schema FROM information_schema.tables "
+        "WHERE table_name IN ('users', 'schema_migrations') ORDER BY table_schema"
+    )).scalars().all()
+
+
+def _applied(conn) -> set[int]:
+    exists = conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar()
+    if exists is None:
+        return set()
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def _use_schema(conn, schema: str):
+    conn.execute(text("SELECT set_config('search_path', :schema, true)"), {"schema": schema})
+
+
+def pending(schemas=None) -> dict[str, list[int]]:
+    """Versions not yet applied, per schema."""
+    out = {}
+    with engine.connect() as conn:
+        for schema in schemas or tenant_schemas(conn):
+            _use_schema(conn, schema)
+            done = _applied(conn)
+            conn.rollback()
+            out[schema] = [version for version, _, _ in MIGRATIONS if version not in done]
+    return out
+
+
+def migrate_schema(schema: str, contract: bool = False) -> list[int]:
+    """Bring one schema (created if missing) up to date; returns the versions applied.
+
+    Contract steps are left pending unless `contract` is set.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {conn.dialect.identifier_preparer.quote(schema)}"))
+        _use_schema(conn, schema)
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations:' || :schema))"), {"schema": schema})
+        conn.execute(_CREATE_VERSIONS)
+        done = _applied(conn)
+
+        applied = []
+        for version, name, step in MIGRATIONS:
+            if version in done or (version in CONTRACT and not contract):
+                continue
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name},
+            )
+            logger.info("[MIGRATION] %s: applied %s %s", schema, version, name)
+            applied.append(version)
+    return applied
+
+
+def migrate(schemas=None, contract: bool = False) -> dict[str, list[int]]:
+    with engine.connect() as conn:
+        schemas = schemas or tenant_schemas(conn)
+    return {schema: migrate_schema(schema, contract) for schema in schemas}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Apply schema migrations to tenant schemas.")
+    parser.add_argument("schemas", nargs="*", help="defaults to every schema with a users table")
+    parser.add_argument("--status", action="store_true", help="list pending migrations and exit")
+    parser.add_argument(
+        "--contract", action="store_true",
+        help="also apply contract steps; only once no pod of the previous release runs",
+    )
+    args = parser.parse_args()
+    if args.status:
+        for schema, versions in pending(args.schemas).items():
+            labels = [f"{v} (contract)" if v in CONTRACT else str(v) for v in versions]
+            print(f"{schema}: {', '.join(labels) or 'up to date'}")
+    else:
+        migrate(args.schemas, contract=args.contract)
@@ -1,11 +1,40 @@
 from datetime import datetime
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import ARRAY, String, DateTime, Integer
-from sqlalchemy.ext.mutable import MutableList
+from sqlalchemy.orm import DeclarativeBase, Mapped, column_property, mapped_column
+from sqlalchemy import ARRAY, CheckConstraint, Computed, String, DateTime, ForeignKey, Integer, func, literal, select, true
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from app.geo import GEO_CELL_SQL
 
 class Base(DeclarativeBase):
     pass
 
+class CartItem(Base):
+    __tablename__ = "cart_items"
+    __table_args__ = (CheckConstraint("quantity >= 0", name="ck_cart_items_quantity"),)
+
+    user_id: Mapped[str] = mapped_column(
+        String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    order_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    added_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+def _expanded_cart(user_id_column):
+    """The cart as the legacy flat list: each order_id repeated `quantity` times."""
+    items = CartItem.__table__
+    units = func.generate_series(1, items.c.quantity).table_valued("n").lateral()
+    return func.coalesce(
+        select(
+            func.array_agg(aggregate_order_by(items.c.order_id, items.c.added_at, items.c.order_id))
+        )
+        .select_from(items.join(units, true()))
+        .where(items.c.user_id == user_id_column)
+        .scalar_subquery(),
+        literal([], ARRAY(Integer)),
+    ).label("cart")
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -19,13 +48,14 @@ class User(Base):
     address: Mapped[str] = mapped_column(String(500), nullable=True)
     longitude: Mapped[float] = mapped_column(nullable=True)
     latitude: Mapped[float] = mapped_column(nullable=True)
+    # Grid cell of (latitude, longitude), see app.geo; indexed for radius queries.
+    geo_cell: Mapped[int] = mapped_column(
+        Integer, Computed(GEO_CELL_SQL, persisted=True), index=True, nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
     partner_id: Mapped[str] = mapped_column(String(36), nullable=True)
-    cart: Mapped[list[int]] = mapped_column(
-    MutableList.as_mutable(ARRAY(Integer)),
-    default=list,
-    nullable=False)
-    
+    # Read-only view over cart_items, loaded in the same SELECT as the user.
+    cart: Mapped[list[int]] = column_property(_expanded_cart(id))
@@ -0,0 +1,101 @@
+"""Proximity queries over users, backed by the users.geo_cell index.
+
+Both backends narrow the table to the grid cells and bounding box around the
+point through the index. "sql" then computes haversine distances, orders and
+limits in Postgres; "numpy" fetches those candidates and ranks them with
+`app.geo.nearest`.
+"""
+from sqlalchemy import ARRAY, Integer, and_, any_, func, literal, select
+
+from app import geo
+from app.config import settings
+from app.models import User
+
+users = User.__table__
+
+NEARBY_COLUMNS = (
+    users.c.id,
+    users.c.username,
+    users.c.name,
+    users.c.surname,
+    users.c.partner_id,
+    users.c.latitude,
+    users.c.longitude,
+)
+
+
+def _haversine_sql(lat: float, lon: float):
+    lat1, lon1 = func.radians(lat), func.radians(lon)
+    lat2, lon2 = func.radians(users.c.latitude), func.radians(users.c.longitude)
+    a = (
+        func.power(func.sin((lat2 - lat1) / 2), 2)
+        + func.cos(lat1) * func.cos(lat2) * func.power(func.sin((lon2 - lon1) / 2), 2)
+    )
+    return 2 * geo.EARTH_RADIUS_M * func.asin(func.sqrt(func.least(a, 1.0)))
+
+
+def _in_area(lat: float, lon: float, radius_m: float, partner_id: str | None):
+    min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius_m)
+    conditions = [
+        users.c.geo_cell == any_(literal(geo.cells_for_box(min_lat, max_lat, min_lon, max_lon), ARRAY(Integer))),
+        users.c.latitude.between(min_lat, max_lat),
+        users.c.longitude.between(min_lon, max_lon),
+    ]
+    if partner_id is not None:
+        conditions.append(users.c.partner_id == partner_id)
+    return and_(*conditions)
+
+
+def select_within(lat: float, lon: float, radius_m: float, limit: int, partner_id: str | None = None):
+    distance = _haversine_sql(lat, lon).label("distance_m")
+    return (
+        select(*NEARBY_COLUMNS, distance)
+        .where(_in_area(lat, lon, radius_m, partner_id), distance <= radius_m)
+        .order_by(distance, users.c.id)
+        .limit(limit)
+    )
+
+
+def select_candidates(lat: float, lon: float, radius_m: float, partner_id: str | None = None):
+    return select(*NEARBY_COLUMNS).where(_in_area(lat, lon, radius_m, partner_id))
+
+
+async def _within(db, lat, lon, radius_m, limit, partner_id) -> list[dict]:
+    if settings.nearby_backend == "sql":
+        result = await db.execute(select_within(lat, lon, radius_m, limit, partner_id))
+        return [dict(row._mapping) for row in result]
+
+    rows = (await db.execute(select_candidates(lat, lon, radius_m, partner_id))).all()
+    if not rows:
+        return []
+    rows.sort(key=lambda r: r.id)  # ties resolve by id, as in SQL
+    order, distances = geo.nearest(
+        lat, lon, [r.latitude for r in rows], [r.longitude for r in rows], radius_m=radius_m, k=limit
+    )
+    return [{**rows[i]._mapping, "distance_m": float(d)} for i, d in zip(order, distances)]
+
+
+async def find_nearby(
+    db,
+    lat: float,
+    lon: float,
+    radius_m: float | None,
+    limit: int,
+    partner_id: str | None = None,
+) -> list[dict]:
+    """Users within `radius_m` of the point, closest first, at most `limit`.
+
+    Without a radius this is a k-nearest query (k = `limit`): the search
+    radius starts at NEARBY_KNN_START_M and grows until `limit` users are
+    found or NEARBY_MAX_RADIUS_M is reached. Any user closer than the k-th
+    hit lies inside the searched circle, so the answer is exact.
+    """
+    if radius_m is not None:
+        return await _within(db, lat, lon, radius_m, limit, partner_id)
+
+    radius = min(settings.nearby_knn_start_m, settings.nearby_max_radius_m)
+    while True:
+        found = await _within(db, lat, lon, radius, limit, partner_id)
+        if len(found) >= limit or radius >= settings.nearby_max_radius_m:
+            return found
+        radius = min(radius * 4, settings.nearby_max_radius_m)
@@ -1,9 +1,18 @@
-import pika
 import json
 import os
+import time
+from collections import defaultdict
 
-from app.database import get_db_session as get_db
+from opentelemetry.trace import SpanKind
+from prometheus_client import Counter, start_http_server
+from sqlalchemy import exc
+from sqlalchemy.dialects.postgresql import insert
+
+from app import tracing
+from app.config import settings
+from app.database import UnknownTenantError, get_db_session as get_db
 from app.models import User
+from app.cache import user_cache
 
 import logging
 
@@ -11,58 +20,329 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+RABBITMQ_PREFETCH = int(os.getenv("RABBITMQ_PREFETCH", "1"))
+# Batch mode is on when the batch size is above 1: up to N messages, or
+# whatever arrived within T ms of the first one, are written per round trip.
+CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "1"))
+CONSUMER_BATCH_TIMEOUT_MS = int(os.getenv("CONSUMER_BATCH_TIMEOUT_MS", "50"))
+# Transient failures are retried after CONSUMER_RETRY_BASE_MS, doubling per
+# attempt up to CONSUMER_RETRY_MAX_MS; after CONSUMER_MAX_RETRIES the message
+# is dead-lettered.
+CONSUMER_MAX_RETRIES = int(os.getenv("CONSUMER_MAX_RETRIES", "5"))
+CONSUMER_RETRY_BASE_MS = int(os.getenv("CONSUMER_RETRY_BASE_MS", "1000"))
+CONSUMER_RETRY_MAX_MS = int(os.getenv("CONSUMER_RETRY_MAX_MS", "60000"))
+# Port for /metrics of the standalone consumer process; 0 disables it.
+CONSUMER_METRICS_PORT = int(os.getenv("CONSUMER_METRICS_PORT", "0"))
+
+QUEUE = "user_created"
+DEAD_LETTER_QUEUE = f"{QUEUE}.dead"
+USER_CREATED_FIELDS = ("user_id", "username", "email")
+RETRY_HEADER = "x-retry-count"
+
+EVENTS = Counter(
+    "consumer_events_total", "Consumed events by outcome", ["queue", "outcome"]
+)
+OUTCOMES = ("processed", "duplicate", "retried", "dead_lettered")
+for _outcome in OUTCOMES:
+    EVENTS.labels(QUEUE, _outcome)
+
+
+class PoisonMessage(ValueError):
+    """The message can never be processed as is; retrying will not help."""
+
 
 def get_connection():
+    # pika is imported where it is used: app.events shares this module's
+    # handlers and should not load it unless the RabbitMQ broker is picked.
+    import pika
+
     return pika.BlockingConnection(
         pika.ConnectionParameters(host=RABBITMQ_HOST)
     )
 
-def callback(ch, method, properties, body):
-    event = json.loads(body.decode("utf-8"))
+# --------------------
+# Topology and routing
+# --------------------
+
+def retry_delay_ms(attempt: int) -> int:
+    return min(CONSUMER_RETRY_BASE_MS * 2 ** (attempt - 1), CONSUMER_RETRY_MAX_MS)
+
+
+def retry_queue(attempt: int, queue: str = QUEUE) -> str:
+    # Named by delay: RabbitMQ only expires messages at the head of a queue,
+    # so each delay gets its own queue with a queue-level TTL.
+    return f"{queue}.retry.{retry_delay_ms(attempt)}"
+
+
+def dead_letter_queue(queue: str = QUEUE) -> str:
+    return f"{queue}.dead"
+
+
+def queue_topology(queue: str = QUEUE):
+    """(name, arguments) of a work queue, its dead-letter and its delay queues."""
+    yield queue, None
+    yield dead_letter_queue(queue), None
+    for attempt in range(1, CONSUMER_MAX_RETRIES + 1):
+        yield retry_queue(attempt, queue), {
+            "x-message-ttl": retry_delay_ms(attempt),
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": queue,
+        }
+
+
+def declare_topology(channel):
+    for name, arguments in queue_topology():
+        channel.queue_declare(queue=name, durable=True, arguments=arguments)
+
+
+def attempts(headers) -> int:
+    return int((headers or {}).get(RETRY_HEADER, 0))
+
+
+def _attempts(properties) -> int:
+    return attempts(getattr(properties, "headers", None))
+
+
+def _republish(ch, routing_key, body, headers):
+    import pika
+
+    ch.basic_publish(
+        exchange="",
+        routing_key=routing_key,
+        body=body,
+        properties=pika.BasicProperties(delivery_mode=2, headers=tracing.inject(headers)),
+    )
+
+
+def dead_letter(ch, method, properties, body, reason):
+    logger.error("[EVENT:DEAD_LETTER] user_created | %s", reason)
+    _republish(ch, DEAD_LETTER_QUEUE, body, {
+        RETRY_HEADER: _attempts(properties),
+        "x-error": str(reason)[:500],
+    })
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+    EVENTS.labels(QUEUE, "dead_lettered").inc()
+
+
+def retry_later(ch, method, properties, body, reason):
+    attempt = _attempts(properties) + 1
+    if attempt > CONSUMER_MAX_RETRIES:
+        dead_letter(ch, method, properties, body, f"gave up after {attempt - 1} retries: {reason}")
+        return
+    logger.warning(
+        "[EVENT:RETRY] user_created | attempt=%s in %sms: %s",
+        attempt, retry_delay_ms(attempt), reason,
+    )
+    _republish(ch, retry_queue(attempt), body, {RETRY_HEADER: attempt})
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+    EVENTS.labels(QUEUE, "retried").inc()
+
+
+def _is_unique_violation(error: exc.IntegrityError) -> bool:
+    orig = error.orig
+    return (getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)) == "23505"
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError))
+
+
+def classify(error: Exception) -> str:
+    """Map a processing error to "duplicate", "retry" or "dead_letter".
+
+    Poison messages (bad payload, unknown tenant, constraint violations other
+    than uniqueness, other non-transient database errors) are dead-lettered.
+    Unique conflicts mean the event was already applied. Anything else,
+    transient database errors included, is retried.
+    """
+    if isinstance(error, (PoisonMessage, UnknownTenantError)):
+        return "dead_letter"
+    if isinstance(error, exc.IntegrityError):
+        return "duplicate" if _is_unique_violation(error) else "dead_letter"
+    if _is_transient(error) or not isinstance(error, exc.SQLAlchemyError):
+        return "retry"
+    return "dead_letter"
+
+# --------------------
+# Per-message mode
+# --------------------
+
+def parse_event(body: bytes, required=USER_CREATED_FIELDS) -> dict:
+    try:
+        event = json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise PoisonMessage(f"malformed body: {e}") from None
+    if not isinstance(event, dict):
+        raise PoisonMessage("body is not a JSON object")
+    missing = [k for k in required if not event.get(k)]
+    if missing:
+        raise PoisonMessage(f"missing fields: {', '.join(missing)}")
+    return event
+
+
+def handle_user_created(event) -> bool:
+    """Insert the user; returns False if the id already exists."""
     tenant_id = event.get("tenant_id", "public")
-    
     with get_db(schema=tenant_id) as db:
-    
-        logger.info(
-            "[EVENT:RECEIVED] user_created | user_id=%s username=%s",
-            event["user_id"], event["username"]
-        )
-        try:
-            existing = db.query(User).filter(User.id == event["user_id"]).first()
-            if existing:
-                print(f"User {event['user_id']} already exists")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                return
+        existing = db.query(User).filter(User.id == event["user_id"]).first()
+        if existing:
+            return False
 
-            user = User(
-                id=event["user_id"],
-                username=event["username"],
-                email=event["email"]
-            )
+        db.add(User(
+            id=event["user_id"],
+            username=event["username"],
+            email=event["email"]
+        ))
+        db.commit()
+    user_cache.invalidate(tenant_id, event["user_id"])
+    return True
 
-            db.add(user)
-            db.commit()
 
+def callback(ch, method, properties, body):
+    """Process one message; every outcome acks it, so the consumer never stalls.
+
+    Poison messages (bad JSON, missing fields, unknown tenant, constraint
+    violations other than uniqueness) go to the dead-letter queue. Transient
+    database errors are retried through the delay queues. Unique conflicts on
+    id, username or email are treated as already-processed duplicates.
+    """
+    with tracing.consumer_span(QUEUE, getattr(properties, "headers", None)):
+        try:
+            event = parse_event(body)
             logger.info(
-                "[EVENT:SUCCESS] user created | user_id=%s",
-                event["user_id"]
+                "[EVENT:RECEIVED] user_created | user_id=%s username=%s",
+                event["user_id"], event["username"]
             )
+            created = handle_user_created(event)
+        except Exception as e:
+            verdict = classify(e)
+            if verdict == "dead_letter":
+                dead_letter(ch, method, properties, body, f"{type(e).__name__}: {e}")
+                return
+            if verdict == "retry":
+                retry_later(ch, method, properties, body, f"{type(e).__name__}: {e}")
+                return
+            created = False
+
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        if created:
+            EVENTS.labels(QUEUE, "processed").inc()
+            logger.info("[EVENT:SUCCESS] user created | user_id=%s", event["user_id"])
+        else:
+            EVENTS.labels(QUEUE, "duplicate").inc()
+            logger.info("[EVENT:DUPLICATE] user already exists | user_id=%s", event["user_id"])
 
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+# --------------------
+# Batch mode
+# --------------------
 
+def insert_users(events):
+    """Write user_created events with one INSERT ... ON CONFLICT per tenant.
+
+    Rows that collide on any unique key (redelivered ids, duplicates within
+    the batch, a username or email already taken) are skipped, matching the
+    per-message duplicate handling. Returns the number of rows inserted.
+    """
+    by_tenant = defaultdict(list)
+    for event in events:
+        by_tenant[event.get("tenant_id", "public")].append({
+            "id": event["user_id"],
+            "username": event["username"],
+            "email": event["email"],
+        })
+
+    inserted = 0
+    for tenant_id, rows in by_tenant.items():
+        stmt = (
+            insert(User.__table__)
+            .values(rows)
+            .on_conflict_do_nothing()
+            .returning(User.__table__.c.id)
+        )
+        with get_db(schema=tenant_id) as db:
+            new_ids = db.execute(stmt).scalars().all()
+            db.commit()
+        for row in rows:
+            user_cache.invalidate(tenant_id, row["id"])
+        inserted += len(new_ids)
+    return inserted
+
+
+def process_batch(ch, batch):
+    """Persist a batch of (method, properties, body) and ack it in one frame."""
+    if not batch:
+        return
+    # One span for the batch, linked to the trace of every message in it.
+    with tracing.span(
+        f"{QUEUE} process",
+        kind=SpanKind.CONSUMER,
+        links=tracing.links(getattr(properties, "headers", None) for _, properties, _ in batch),
+        attributes={"messaging.system": "rabbitmq", "messaging.batch.message_count": len(batch)},
+    ):
+        try:
+            events = [parse_event(body) for _, _, body in batch]
+            inserted = insert_users(events)
         except Exception as e:
-            print(f"Error processing user_created event: {e}")
-            db.rollback()
+            # Let the per-message path sort out which message is the problem.
+            logger.warning("[EVENT:BATCH] batch of %s failed (%s), retrying one by one", len(batch), e)
+            for method, properties, body in batch:
+                callback(ch, method, properties, body)
+            return
+
+        # Deliveries on a channel are acked in order, so the last tag covers all.
+        ch.basic_ack(delivery_tag=batch[-1][0].delivery_tag, multiple=True)
+        EVENTS.labels(QUEUE, "processed").inc(inserted)
+        EVENTS.labels(QUEUE, "duplicate").inc(len(batch) - inserted)
+        logger.info(
+            "[EVENT:SUCCESS] user_created batch | events=%s inserted=%s",
+            len(batch), inserted,
+        )
+
+
+def consume_batches(channel, queue=QUEUE, batch_size=None, batch_timeout_ms=None):
+    """Consume `queue`, flushing at `batch_size` messages or `batch_timeout_ms`.
+
+    The timeout is measured from the first message of a batch; an idle queue
+    flushes a partial batch after the same interval.
+    """
+    batch_size = batch_size or CONSUMER_BATCH_SIZE
+    timeout_s = (batch_timeout_ms if batch_timeout_ms is not None else CONSUMER_BATCH_TIMEOUT_MS) / 1000
+
+    batch = []
+    deadline = 0.0
+    for method, properties, body in channel.consume(queue, inactivity_timeout=timeout_s):
+        if method is not None:
+            if not batch:
+                deadline = time.monotonic() + timeout_s
+            batch.append((method, properties, body))
+        if batch and (method is None or len(batch) >= batch_size or time.monotonic() >= deadline):
+            process_batch(channel, batch)
+            batch = []
+    process_batch(channel, batch)
+
 
 def start_consumer():
+    if CONSUMER_METRICS_PORT:
+        start_http_server(CONSUMER_METRICS_PORT)
+    if settings.tracing_enabled:
+        tracing.configure()
+
     connection = get_connection()
     channel = connection.channel()
 
-    channel.queue_declare(queue="user_created", durable=True)
-    channel.basic_qos(prefetch_count=1)
+    declare_topology(channel)
+    # A batch can only fill up to the prefetch window.
+    channel.basic_qos(prefetch_count=max(RABBITMQ_PREFETCH, CONSUMER_BATCH_SIZE))
+
+    if CONSUMER_BATCH_SIZE > 1:
+        print(f"User Service listening for user_created events in batches of {CONSUMER_BATCH_SIZE}...")
+        consume_batches(channel)
+        return
 
     channel.basic_consume(
-        queue="user_created",
+        queue=QUEUE,
         on_message_callback=callback
     )
 
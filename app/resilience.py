@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state", "Circuit state: 0 closed, 1 open, 2 half-open", ["name"]
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit state transitions", ["name", "from_state", "to_state"]
+)
+CALLS_REJECTED = Counter(
+    "dependency_calls_rejected_total", "Calls rejected without reaching the dependency", ["name", "reason"]
+)
+
+
+class RejectedCallError(Exception):
+    """The call was shed before reaching the dependency; retry after `retry_after_s`."""
+
+    def __init__(self, message: str, retry_after_s: float = 1.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class CircuitOpenError(RejectedCallError):
+    pass
+
+
+class BulkheadFullError(RejectedCallError):
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed: calls pass; `failure_threshold` consecutive failures open it.
+    open: calls are rejected immediately until `recovery_timeout_s` elapses.
+    half-open: up to `half_open_max_calls` trial calls pass; a success closes
+    the circuit, a failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    _STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout_s: float = 10.0,
+        half_open_max_calls: int = 1,
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_s = recovery_timeout_s
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_calls = 0
+        CIRCUIT_STATE.labels(name).set(0)
+        CALLS_REJECTED.labels(name, "circuit_open")
+
+    def _transition(self, to_state: str):
+        if to_state == self.state:
+            return
+        logger.warning("[circuit:%s] %s -> %s", self.name, self.state, to_state)
+        CIRCUIT_TRANSITIONS.labels(self.name, self.state, to_state).inc()
+        CIRCUIT_STATE.labels(self.name).set(self._STATE_VALUES[to_state])
+        self.state = to_state
+        if to_state == self.OPEN:
+            self._opened_at = self.clock()
+        self._trial_calls = 0
+        self._failures = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not reach the dependency."""
+        if self.state == self.OPEN:
+            if self.clock() - self._opened_at < self.recovery_timeout_s:
+                CALLS_REJECTED.labels(self.name, "circuit_open").inc()
+                raise CircuitOpenError(
+                    f"{self.name} circuit is open",
+                    retry_after_s=self.recovery_timeout_s - (self.clock() - self._opened_at),
+                )
+            self._transition(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            if self._trial_calls >= self.half_open_max_calls:
+                CALLS_REJECTED.labels(self.name, "circuit_open").inc()
+                raise CircuitOpenError(f"{self.name} circuit is half-open")
+            self._trial_calls += 1
+
+    def record_success(self):
+        if self.state == self.HALF_OPEN:
+            self._transition(self.CLOSED)
+        self._failures = 0
+
+    def record_failure(self, error: BaseException):
+        if not self.is_failure(error):
+            self.record_success()
+            return
+        if self.state == self.HALF_OPEN:
+            self._transition(self.OPEN)
+            return
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._transition(self.OPEN)
+
+    async def call(self, fn, *args, **kwargs):
+        self.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Not a verdict on the dependency; give the trial slot back.
+            if self.state == self.HALF_OPEN:
+                self._trial_calls -= 1
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+
+class Bulkhead:
+    """Caps concurrent calls to one dependency so it cannot starve the rest.
+
+    A caller waits at most `max_wait_s` for a slot (0 rejects immediately when
+    full) and then gets BulkheadFullError.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_wait_s: float = 0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait_s = max_wait_s
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        CALLS_REJECTED.labels(name, "bulkhead_full")
+
+    @asynccontextmanager
+    async def slot(self, timeout_s: float | None = None):
+        if self._semaphore.locked():
+            wait_s = self.max_wait_s if timeout_s is None else min(self.max_wait_s, timeout_s)
+            try:
+                if wait_s <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=wait_s)
+            except asyncio.TimeoutError:
+                CALLS_REJECTED.labels(self.name, "bulkhead_full").inc()
+                raise BulkheadFullError(f"{self.name} bulkhead is full") from None
+        else:
+            await self._semaphore.acquire()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
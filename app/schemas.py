@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 class UserCreate(BaseModel):
     id: str
@@ -39,6 +39,57 @@ class UserOut(BaseModel):
     class Config:
         from_attributes = True
 
+USERS_BATCH_MAX_IDS = 500
+
+UserField = Literal[tuple(UserOut.model_fields)]
+
+class UsersBatchIn(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=USERS_BATCH_MAX_IDS)
+    # Projection: only these fields (plus id) per user; all when omitted.
+    fields: Optional[List[UserField]] = None
+
+class UsersBatchOut(BaseModel):
+    # In request order; repeated ids appear once.
+    users: List[Dict[str, Any]]
+    missing: List[str]
+
+class NearbyUserOut(BaseModel):
+    id: str
+    username: str
+    name: Optional[str] = None
+    surname: Optional[str] = None
+    partner_id: Optional[str] = None
+    latitude: float
+    longitude: float
+    distance_m: float
+
+class UserImportError(BaseModel):
+    line: int
+    id: Optional[str] = None
+    error: str
+
+class UserImportOut(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    # The first errors by line; `failed` counts all of them.
+    errors: List[UserImportError]
+
+class CartItemsIn(BaseModel):
+    # One unit per occurrence, so [7, 7] adds or removes two of order 7.
+    order_ids: List[int] = Field(..., max_length=1000)
+
+class CartItemOut(BaseModel):
+    order_id: int
+    quantity: int
+    added_at: datetime
+
+class CartOut(BaseModel):
+    user_id: str
+    items: List[CartItemOut]
+    # Same flat shape as UserOut.cart.
+    cart: List[int]
+
 class OrderItemOut(BaseModel):
     id: int               
     order_id: int         
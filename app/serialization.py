@@ -0,0 +1,48 @@
+"""Fast response path for user payloads.
+
+Rows selected with `app.cart.USER_COLUMNS` already have exactly the shape of
+`UserOut`, and their values were validated on the way in. With
+FAST_RESPONSES on, endpoints that opt in skip both `UserOut` validation and
+FastAPI's `response_model` pass and encode with orjson; with it off they go
+through pydantic as before.
+"""
+import orjson
+from fastapi.responses import ORJSONResponse
+
+from app.config import settings
+from app.schemas import UserOut
+
+_DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+def user_payload(mapping) -> dict:
+    """JSON-ready UserOut dict for a row of USER_COLUMNS (cacheable as is)."""
+    if not settings.fast_responses:
+        return UserOut.model_validate(mapping).model_dump(mode="json")
+    out = dict(mapping)
+    for key in _DATETIME_FIELDS:
+        if out[key] is not None:
+            out[key] = out[key].isoformat()
+    return out
+
+
+def user_rows(rows) -> list:
+    """Response content for many rows of USER_COLUMNS."""
+    if not settings.fast_responses:
+        return [row._mapping for row in rows]
+    # orjson writes datetimes exactly as pydantic does, so no conversion.
+    return [dict(row._mapping) for row in rows]
+
+
+def user_json_lines(rows) -> list[bytes]:
+    """One encoded UserOut per row, for streamed responses."""
+    if not settings.fast_responses:
+        return [UserOut.model_validate(row._mapping).model_dump_json().encode() for row in rows]
+    return [orjson.dumps(dict(row._mapping)) for row in rows]
+
+
+def respond(content, headers: dict | None = None):
+    """`content` as an orjson response, or as is for FastAPI to validate and encode."""
+    if not settings.fast_responses:
+        return content
+    return ORJSONResponse(content, headers=headers)
@@ -0,0 +1,233 @@
+"""Statement-level instrumentation for both SQLAlchemy engines.
+
+Engine events time every statement and count round trips (statements plus
+commits and rollbacks). Inside an HTTP request they are collected by
+`SQLStatsMiddleware` and recorded when the request ends, labelled with its
+route, so the extra catalog, `set_config` and `refresh()` queries an endpoint
+issues show up next to its own. Outside requests (event consumer, gRPC,
+scripts) the endpoint label is "-".
+
+Statements slower than SQL_SLOW_MS are logged, with their plan when
+SQL_SLOW_EXPLAIN is on, and a request that runs the same statement
+SQL_N_PLUS_ONE_THRESHOLD times or more is logged as a likely N+1.
+"""
+import contextvars
+import functools
+import logging
+import re
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TENANT_LABEL = settings.sql_metrics_tenant_label
+
+STATEMENT_SECONDS = Histogram(
+    "db_statement_seconds",
+    "Time spent executing one SQL statement",
+    ["statement", "endpoint"] + (["tenant"] if _TENANT_LABEL else []),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+REQUEST_ROUND_TRIPS = Histogram(
+    "db_round_trips_per_request",
+    "Statements, commits and rollbacks sent to Postgres while serving one request",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100),
+)
+SLOW_STATEMENTS = Counter(
+    "db_slow_statements_total", "Statements slower than SQL_SLOW_MS", ["statement"]
+)
+N_PLUS_ONE = Counter(
+    "db_n_plus_one_total",
+    "Requests that ran one statement SQL_N_PLUS_ONE_THRESHOLD times or more",
+    ["endpoint"],
+)
+
+# Distinct `statement` label values; later shapes are reported as "other".
+MAX_STATEMENT_LABELS = 200
+NO_ENDPOINT = "-"
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)', re.I)
+_labels = set()
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(statement: str) -> str:
+    """The statement on one line with literals replaced by `?`."""
+    return _LITERALS.sub("?", _WHITESPACE.sub(" ", statement).strip())
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_label(statement: str) -> str:
+    """Bounded label for a statement: its verb and first table, e.g. "SELECT users".
+
+    Tenant schemas rendered by schema_translate_map are dropped, so every
+    tenant's copy of a statement shares one label.
+    """
+    words = statement.split(None, 1)
+    label = words[0].upper() if words else ""
+    # The outermost table: subqueries in the select list come first.
+    for table in _TABLE.finditer(statement):
+        head = statement[:table.start()]
+        if head.count("(") == head.count(")"):
+            label += " " + table.group(1).rsplit(".", 1)[-1].strip('"')
+            break
+    if label not in _labels:
+        if len(_labels) >= MAX_STATEMENT_LABELS:
+            return "other"
+        _labels.add(label)
+    return label
+
+
+class RequestStats:
+    """What one request sent to Postgres; kept in a context variable."""
+
+    __slots__ = ("tenant", "round_trips", "statements")
+
+    def __init__(self, tenant: str | None = None):
+        self.tenant = tenant
+        self.round_trips = 0
+        self.statements = []  # (statement, seconds)
+
+
+_current: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("sql_request_stats", default=None)
+# Statements seen by `capture()`, across threads and event loops.
+_captures = []
+
+
+def _tenant_label(tenant: str | None) -> str:
+    from app.database import tenant_schemas
+
+    # Only schemas that exist, so a made-up X-Tenant-Id cannot add series.
+    return tenant if tenant in tenant_schemas._schemas else "other"
+
+
+def _observe(statement: str, seconds: float, endpoint: str, tenant: str | None):
+    labels = [statement_label(statement), endpoint]
+    if _TENANT_LABEL:
+        labels.append(_tenant_label(tenant))
+    STATEMENT_SECONDS.labels(*labels).observe(seconds)
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    """EXPLAIN the statement in a second cursor on its connection.
+
+    Plain EXPLAIN plans without executing, and the savepoint keeps a failing
+    EXPLAIN from aborting the caller's transaction.
+    """
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT sql_explain")
+        try:
+            cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT sql_explain")
+            plan = f"(no plan: {e})"
+        cursor.execute("RELEASE SAVEPOINT sql_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+def _slow(conn, statement: str, parameters, seconds: float, executemany: bool):
+    SLOW_STATEMENTS.labels(statement_label(statement)).inc()
+    stats = _current.get()
+    plan = ""
+    if settings.sql_slow_explain and not executemany and statement.lstrip().upper().startswith(_EXPLAINABLE):
+        plan = "\n" + _explain(conn, statement, parameters)
+    logger.warning(
+        "[SQL:SLOW] %.1f ms (tenant=%s): %s%s",
+        seconds * 1000, stats.tenant if stats else None, normalize(statement), plan,
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["sql_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info.pop("sql_started", time.perf_counter())
+    for captured in _captures:
+        captured.append(statement)
+
+    stats = _current.get()
+    if stats is None:
+        _observe(statement, seconds, NO_ENDPOINT, None)
+    else:
+        stats.round_trips += 1
+        stats.statements.append((statement, seconds))
+
+    if settings.sql_slow_ms and seconds * 1000 >= settings.sql_slow_ms:
+        _slow(conn, statement, parameters, seconds, executemany)
+
+
+def _transaction_end(conn):
+    stats = _current.get()
+    if stats is not None:
+        stats.round_trips += 1
+
+
+def instrument_engine(sync_engine):
+    """Attach the statement hooks to an Engine (for an AsyncEngine, its sync_engine)."""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "commit", _transaction_end)
+    event.listen(sync_engine, "rollback", _transaction_end)
+
+
+def record_request(stats: RequestStats, endpoint: str):
+    for statement, seconds in stats.statements:
+        _observe(statement, seconds, endpoint, stats.tenant)
+    REQUEST_ROUND_TRIPS.labels(endpoint).observe(stats.round_trips)
+
+    threshold = settings.sql_n_plus_one_threshold
+    if threshold and len(stats.statements) >= threshold:
+        statement, repeats = Tally(s for s, _ in stats.statements).most_common(1)[0]
+        if repeats >= threshold:
+            N_PLUS_ONE.labels(endpoint).inc()
+            logger.warning("[SQL:N+1] %s ran %d times: %s", endpoint, repeats, normalize(statement))
+
+
+class SQLStatsMiddleware:
+    """Collects the statements of each HTTP request and records them when it ends."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        tenant = headers.get(b"x-tenant-id", b"public").decode("latin-1")
+        stats = RequestStats(tenant)
+        token = _current.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            # The router stores the matched route in the scope.
+            route = scope.get("route")
+            endpoint = f"{scope['method']} {route.path}" if route is not None else "unmatched"
+            record_request(stats, endpoint)
+
+
+@contextmanager
+def capture():
+    """Collect every statement both engines run meanwhile, from any thread."""
+    statements = []
+    _captures.append(statements)
+    try:
+        yield statements
+    finally:
+        _captures.remove(statements)
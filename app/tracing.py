@@ -0,0 +1,241 @@
+"""OpenTelemetry tracing across HTTP, Postgres, gRPC, Google Places and RabbitMQ.
+
+Off unless TRACING_ENABLED; every hook here returns straight away then, and
+the SDK is not even imported. When on, TRACING_SAMPLE_RATIO of new traces
+are kept and incoming ones follow their parent's decision. Spans below an
+unsampled parent are not created at all, so unsampled requests cost little
+more than propagating the context.
+
+Spans recorded:
+
+* one server span per HTTP request (TracingMiddleware), named by route
+* `db.session`: tenant resolution in get_db_session / get_async_db_session
+* `db.pool.checkout` and one client span per SQL statement
+* the GetOrdersByUser call, with the context sent as gRPC metadata, and
+  UsersService calls, continuing the caller's trace
+* each Google Places request (no context is sent to Google)
+* one consumer span per RabbitMQ message, continuing the trace from the
+  AMQP headers; retries and dead letters carry it on
+"""
+from contextlib import contextmanager
+
+from opentelemetry import propagate, trace
+from opentelemetry.context import attach, detach
+from opentelemetry.trace import Link, SpanKind, StatusCode
+from sqlalchemy import event
+
+from app.config import settings
+from app.sql_metrics import normalize, statement_label
+
+tracer = trace.get_tracer("user-service")
+enabled = False
+_provider = None
+
+
+def make_sampler(ratio: float):
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    return ParentBased(TraceIdRatioBased(ratio))
+
+
+def _exporter():
+    if settings.tracing_exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        return ConsoleSpanExporter()
+    # Endpoint, headers and TLS come from the standard OTEL_EXPORTER_OTLP_* variables.
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+    return OTLPSpanExporter()
+
+
+def configure(exporter=None, sample_ratio: float | None = None):
+    """Install the tracer provider once per process and turn tracing on.
+
+    `exporter` replaces the configured one and is flushed synchronously,
+    which is what tests want with an InMemorySpanExporter.
+    """
+    global enabled, _provider
+    if _provider is None:
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+        ratio = settings.tracing_sample_ratio if sample_ratio is None else sample_ratio
+        _provider = TracerProvider(
+            resource=Resource.create({SERVICE_NAME: settings.tracing_service_name}),
+            sampler=make_sampler(ratio),
+        )
+        if exporter is not None:
+            _provider.add_span_processor(SimpleSpanProcessor(exporter))
+        else:
+            _provider.add_span_processor(BatchSpanProcessor(_exporter()))
+        trace.set_tracer_provider(_provider)
+    enabled = True
+    return _provider
+
+
+def shutdown():
+    """Flush spans still queued for export."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+# --------------------
+# Spans
+# --------------------
+def _traced(parent=None) -> bool:
+    """A new span would be recorded: the parent is sampled, or there is none."""
+    current = trace.get_current_span(parent).get_span_context()
+    return not current.is_valid or current.trace_flags.sampled
+
+
+@contextmanager
+def span(name: str, kind: SpanKind = SpanKind.INTERNAL, attributes=None, parent=None, links=None):
+    """Current span for the block; yields None when nothing would be recorded."""
+    if not enabled:
+        yield None
+        return
+    if not _traced(parent):
+        # Keep an unsampled caller's context current, so it is passed on as unsampled.
+        token = attach(parent) if parent is not None else None
+        try:
+            yield None
+        finally:
+            if token is not None:
+                detach(token)
+        return
+    with tracer.start_as_current_span(name, context=parent, kind=kind, attributes=attributes, links=links) as current:
+        yield current
+
+
+@contextmanager
+def child_span(name: str, kind: SpanKind = SpanKind.INTERNAL, attributes=None):
+    """Like `span`, but only under a recording span: never starts a trace."""
+    if not enabled or not trace.get_current_span().is_recording():
+        yield None
+        return
+    with tracer.start_as_current_span(name, kind=kind, attributes=attributes) as current:
+        yield current
+
+
+def set_attribute(key: str, value):
+    current = trace.get_current_span()
+    if current.is_recording():
+        current.set_attribute(key, value)
+
+
+# --------------------
+# Propagation
+# --------------------
+def inject(carrier: dict) -> dict:
+    """Add the current trace context (traceparent, ...) to `carrier` and return it."""
+    if enabled:
+        propagate.inject(carrier)
+    return carrier
+
+
+def extract(carrier):
+    """Trace context from incoming headers or metadata; None when tracing is off."""
+    if not enabled or not carrier:
+        return None
+    return propagate.extract(carrier)
+
+
+def consumer_span(queue: str, headers, **attributes):
+    """Span for processing one message of `queue`, continuing the publisher's trace."""
+    return span(f"{queue} process", kind=SpanKind.CONSUMER, parent=extract(headers), attributes={
+        "messaging.system": "rabbitmq",
+        "messaging.destination.name": queue,
+        "messaging.operation.type": "process",
+        **attributes,
+    })
+
+
+def links(carriers) -> list[Link]:
+    """Links to the traces of several messages handled together."""
+    if not enabled:
+        return []
+    contexts = (trace.get_current_span(extract(c)).get_span_context() for c in carriers)
+    return [Link(context) for context in contexts if context.is_valid]
+
+
+# --------------------
+# HTTP
+# --------------------
+class TracingMiddleware:
+    """Server span per HTTP request, continuing a `traceparent` sent by the caller."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled:
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        method = scope["method"]
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.request.method": method,
+                "url.path": scope["path"],
+                "tenant.id": headers.get("x-tenant-id", "public"),
+            },
+        ) as current:
+            async def _send(message):
+                if message["type"] == "http.response.start" and current.is_recording():
+                    current.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        current.set_status(StatusCode.ERROR)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                route = scope.get("route")
+                if route is not None and current.is_recording():
+                    current.update_name(f"{method} {route.path}")
+                    current.set_attribute("http.route", route.path)
+
+
+# --------------------
+# SQL
+# --------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not enabled or not trace.get_current_span().is_recording():
+        return
+    context._otel_span = tracer.start_span(
+        statement_label(statement),
+        kind=SpanKind.CLIENT,
+        attributes={
+            "db.system.name": "postgresql",
+            "db.namespace": conn.engine.url.database,
+            "db.query.text": normalize(statement),
+        },
+    )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = getattr(context, "_otel_span", None)
+    if current is not None:
+        current.end()
+        context._otel_span = None
+
+
+def _handle_error(exception_context):
+    current = getattr(exception_context.execution_context, "_otel_span", None)
+    if current is not None:
+        current.record_exception(exception_context.original_exception)
+        current.set_status(StatusCode.ERROR)
+        current.end()
+        exception_context.execution_context._otel_span = None
+
+
+def instrument_engine(sync_engine):
+    """One client span per statement, under whatever span is current."""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
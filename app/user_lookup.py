@@ -0,0 +1,51 @@
+"""Batch user lookups shared by POST /batch and the UsersService gRPC server."""
+from sqlalchemy import ARRAY, String, any_, literal, select
+
+from app.cache import user_cache
+from app.cart import USER_COLUMNS, users
+from app.schemas import UserOut
+from app.serialization import user_payload
+
+USER_FIELDS = tuple(UserOut.model_fields)
+
+
+def select_users(ids: list[str]):
+    # One array parameter: the statement text is the same for any batch size.
+    return select(*USER_COLUMNS).where(users.c.id == any_(literal(ids, ARRAY(String))))
+
+
+async def get_users(db, tenant_id: str, ids) -> tuple[list[dict], list[str]]:
+    """(UserOut payloads, missing ids), both in the order of `ids`.
+
+    Cached users are served from the user cache; the rest are loaded with one
+    query and cached. Repeated ids are answered once.
+    """
+    wanted = list(dict.fromkeys(ids))
+    found = {}
+    misses = []
+    for user_id in wanted:
+        cached = await user_cache.aget(tenant_id, user_id)
+        if cached is not None:
+            found[user_id] = cached
+        else:
+            misses.append(user_id)
+
+    if misses:
+        generation = user_cache.generation()
+        result = await db.execute(select_users(misses))
+        for row in result:
+            out = user_payload(row._mapping)
+            await user_cache.aset(tenant_id, out["id"], out, generation)
+            found[out["id"]] = out
+
+    return (
+        [found[user_id] for user_id in wanted if user_id in found],
+        [user_id for user_id in wanted if user_id not in found],
+    )
+
+
+def project(user: dict, fields) -> dict:
+    """Only `fields` of `user` (plus its id); all of it when `fields` is empty."""
+    if not fields:
+        return user
+    return {"id": user["id"], **{f: user[f] for f in fields}}
@@ -0,0 +1,71 @@
+"""Compare onboarding a tenant with POST / per user against POST /import.
+
+* per_user: one POST / per user (SELECT, INSERT, commit, refresh each);
+  timed over --sample users and extrapolated.
+* import: one NDJSON upload of all --users users (COPY into staging, one
+  INSERT ... ON CONFLICT DO NOTHING).
+* export: GET /export of the imported tenant as NDJSON.
+
+Runs the app in process through TestClient against the database from the
+same PG* / GOOGLE_API_KEY environment as the test suite:
+
+    python -m benchmarks.bench_bulk_import --users 100000 --sample 2000
+"""
+import argparse
+import json
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.database import engine
+from app.main import app
+from app.migrations import migrate
+
+SCHEMA = "bench_bulk"
+
+
+def _setup():
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    migrate([SCHEMA])
+
+
+def _user(prefix: str, i: int) -> dict:
+    return {"id": f"{prefix}-{i}", "username": f"{prefix}{i}", "email": f"{prefix}{i}@example.com", "cart": [i % 7]}
+
+
+def main(users: int, sample: int):
+    _setup()
+    headers = {"X-Tenant-Id": SCHEMA}
+    with TestClient(app) as client:
+        started = time.perf_counter()
+        for i in range(sample):
+            client.post("/", json=_user("post", i), headers=headers)
+        per_user_s = (time.perf_counter() - started) / sample
+        print(f" per_user: {1 / per_user_s:9.0f} users/s  (~{per_user_s * users:.1f}s for {users})")
+
+        body = "\n".join(json.dumps(_user("bulk", i)) for i in range(users)).encode()
+        started = time.perf_counter()
+        r = client.post(
+            "/import", content=body, headers={**headers, "Content-Type": "application/x-ndjson"}
+        )
+        elapsed = time.perf_counter() - started
+        print(f"   import: {users / elapsed:9.0f} users/s  ({elapsed:.1f}s, inserted={r.json()['inserted']})")
+
+        started = time.perf_counter()
+        r = client.get("/export", headers=headers)
+        elapsed = time.perf_counter() - started
+        rows = r.text.count("\n")
+        print(f"   export: {rows / elapsed:9.0f} users/s  ({elapsed:.1f}s, {len(r.content) / 1e6:.1f} MB)")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.users, args.sample)
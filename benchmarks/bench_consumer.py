@@ -0,0 +1,92 @@
+"""Compare user_created consumption strategies against a local fake channel.
+
+* callback: the per-message `callback` (existence query, INSERT, commit and
+  ack for every event).
+* batch: `consume_batches`, one INSERT ... ON CONFLICT per tenant per batch
+  and a single multiple-ack.
+
+No broker is needed, only the PG* / GOOGLE_API_KEY environment of the tests:
+
+    python -m benchmarks.bench_consumer --events 5000 --batch-size 200
+"""
+import argparse
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+from sqlalchemy import text
+
+from app import rabbitmq_consumer
+from app.database import engine
+from app.migrations import migrate
+
+TENANTS = ("bench_tenant", "bench_tenant_b")
+
+
+class FakeChannel:
+    """Just enough of pika's BlockingChannel to drive both consumer paths."""
+
+    def __init__(self, bodies):
+        self.deliveries = [
+            (SimpleNamespace(delivery_tag=tag), None, body)
+            for tag, body in enumerate(bodies, start=1)
+        ]
+        self.acked = 0
+
+    def consume(self, queue, inactivity_timeout=None):
+        yield from self.deliveries
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acked = delivery_tag if multiple else self.acked + 1
+
+
+def _setup():
+    migrate(list(TENANTS))
+    with engine.begin() as conn:
+        for schema in TENANTS:
+            conn.execute(text(f"SET search_path TO {schema}"))
+            conn.execute(text("TRUNCATE TABLE users CASCADE"))
+
+
+def _bodies(count: int):
+    bodies = []
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        bodies.append(json.dumps({
+            "user_id": user_id,
+            "username": f"bench-{user_id}",
+            "email": f"{user_id}@example.com",
+            "tenant_id": TENANTS[i % len(TENANTS)],
+        }).encode())
+    return bodies
+
+
+def _run_callback(channel):
+    for method, properties, body in channel.consume("user_created"):
+        rabbitmq_consumer.callback(channel, method, properties, body)
+
+
+def main(events: int, batch_size: int):
+    _setup()
+
+    for name, run in (
+        ("callback", _run_callback),
+        ("batch", lambda ch: rabbitmq_consumer.consume_batches(ch, batch_size=batch_size)),
+    ):
+        channel = FakeChannel(_bodies(events))
+        started = time.perf_counter()
+        run(channel)
+        elapsed = time.perf_counter() - started
+        assert channel.acked == events, f"{name}: acked {channel.acked} of {events}"
+        print(f"{name:>9}: {events / elapsed:8.0f} events/s  ({elapsed:.2f}s for {events})")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+    main(args.events, args.batch_size)
@@ -0,0 +1,101 @@
+"""Compare the local geocoding index with the remote Google Places path.
+
+* local: `GeocodingIndex.autocomplete` over a synthetic Slovenian-style
+  address set built into a temporary directory.
+* remote: `app.location.autocomplete` through the shared httpx client, with
+  Google replaced by a MockTransport that answers after --remote-latency-ms.
+  Every query is distinct, so the caches never help.
+
+Needs the same PG* / GOOGLE_API_KEY environment as the test suite (for
+Settings), but no network and no database:
+
+    python -m benchmarks.bench_geocoder --addresses 500000 --queries 2000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from app import geocoder, location
+from app.geocoder import GeocodingIndex, build_index
+
+SYLLABLES = ["lju", "blja", "na", "ma", "ri", "bor", "ce", "lje", "ko", "per", "kranj", "ska", "ptu", "slo", "ven"]
+KINDS = ["cesta", "ulica", "trg", "pot"]
+CITIES = ["Ljubljana", "Maribor", "Celje", "Kranj", "Koper", "Novo mesto", "Ptuj", "Velenje"]
+
+
+def _addresses(count: int, rng: random.Random):
+    streets = sorted({
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize() + " " + rng.choice(KINDS)
+        for _ in range(max(count // 40, 1))
+    })
+    for i in range(count):
+        yield {
+            "street": streets[i % len(streets)],
+            "house_number": str(i // len(streets) + 1),
+            "postcode": "1000",
+            "city": CITIES[i % len(CITIES)],
+            "lat": 45.4 + rng.random(),
+            "lon": 13.4 + rng.random() * 3,
+        }
+
+
+def _report(name: str, latencies: list[float]):
+    latencies.sort()
+    print(
+        f"{name:>7}: p50={statistics.median(latencies) * 1e6:9.1f}µs  "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1e6:9.1f}µs  "
+        f"{len(latencies) / sum(latencies):10.0f} lookups/s (sequential)"
+    )
+
+
+async def _remote(queries: list[str], latency_s: float):
+    async def _google(request):
+        await asyncio.sleep(latency_s)
+        return httpx.Response(200, json={"predictions": []})
+
+    location._client = httpx.AsyncClient(transport=httpx.MockTransport(_google))
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        await location.autocomplete(q)
+        latencies.append(time.perf_counter() - started)
+    await location.close_places_client()
+    return latencies
+
+
+def main(addresses: int, queries: int, remote_latency_ms: float):
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        build_index(_addresses(addresses, rng), tmp)
+        print(f"built {addresses} addresses in {time.perf_counter() - started:.1f}s")
+        index = GeocodingIndex(tmp)
+
+        samples = [index.autocomplete(p)[0]["description"] for p in ("a", "b", "c", "k", "l", "m", "p", "r", "s", "v") if index.autocomplete(p)]
+        words = [s.split(",")[0] for s in samples]
+        local_queries = [rng.choice(words)[: rng.randint(3, 14)] for _ in range(queries)]
+
+        latencies = []
+        for q in local_queries:
+            started = time.perf_counter()
+            index.autocomplete(q)
+            latencies.append(time.perf_counter() - started)
+        _report("local", latencies)
+
+        geocoder._index = None
+        remote_queries = [f"{q} {i}" for i, q in enumerate(local_queries[: max(queries // 10, 10)])]
+        _report("remote", asyncio.run(_remote(remote_queries, remote_latency_ms / 1000)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--addresses", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--remote-latency-ms", type=float, default=60.0)
+    args = parser.parse_args()
+    main(args.addresses, args.queries, args.remote_latency_ms)
@@ -0,0 +1,113 @@
+"""Compare the ways of answering a nearby-users query.
+
+* full_scan: haversine over every row, ordered and limited in Postgres; what
+  the query costs without the geo_cell index.
+* sql: `app.nearby` with NEARBY_BACKEND=sql, narrowed through the geo_cell
+  index and bounding box.
+* numpy: `app.nearby` with NEARBY_BACKEND=numpy, same narrowing, ranked by
+  `app.geo.nearest`.
+* in_memory: `app.geo.nearest` over all coordinates already held in arrays,
+  i.e. the floor for a process that keeps every user in memory.
+
+Seeds --users users around Slovenia into a scratch schema. Needs the same
+PG* / GOOGLE_API_KEY environment as the test suite:
+
+    python -m benchmarks.bench_nearby --users 1000000 --queries 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import numpy as np
+from sqlalchemy import select, text
+
+from app import geo, nearby
+from app.config import settings
+from app.database import async_engine, get_async_db_session
+from app.migrations import migrate
+
+SCHEMA = "bench_nearby"
+
+
+async def _setup(users: int):
+    await asyncio.to_thread(migrate, [SCHEMA])
+    async with async_engine.begin() as conn:
+        await conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        count = (await conn.execute(text("SELECT count(*) FROM users"))).scalar_one()
+        if count != users:
+            await conn.execute(text("TRUNCATE TABLE users CASCADE"))
+            await conn.execute(
+                text(
+                    "INSERT INTO users (id, username, email, latitude, longitude, created_at, updated_at) "
+                    "SELECT 'u' || n, 'u' || n, 'u' || n || '@example.com', "
+                    "45.4 + random() * 1.5, 13.4 + random() * 3, now(), now() "
+                    "FROM generate_series(1, :users) AS n"
+                ),
+                {"users": users},
+            )
+            await conn.execute(text("ANALYZE users"))
+        rows = (await conn.execute(text("SELECT latitude, longitude FROM users"))).all()
+    return np.array([r[0] for r in rows]), np.array([r[1] for r in rows])
+
+
+async def _full_scan(db, lat, lon, radius_m, limit):
+    distance = nearby._haversine_sql(lat, lon).label("distance_m")
+    stmt = (
+        select(*nearby.NEARBY_COLUMNS, distance)
+        .where(distance <= radius_m)
+        .order_by(distance, nearby.users.c.id)
+        .limit(limit)
+    )
+    return (await db.execute(stmt)).all()
+
+
+async def _time(name: str, query, points, radius_m: float, limit: int):
+    latencies = []
+    async with get_async_db_session(schema=SCHEMA) as db:
+        for lat, lon in points:
+            started = time.perf_counter()
+            await query(db, lat, lon, radius_m, limit)
+            latencies.append(time.perf_counter() - started)
+    _report(name, latencies)
+
+
+def _report(name: str, latencies: list[float]):
+    latencies.sort()
+    print(
+        f"{name:>9}: p50={statistics.median(latencies) * 1e3:8.2f}ms  "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1e3:8.2f}ms"
+    )
+
+
+async def _main(users: int, queries: int, radius_m: float, limit: int):
+    started = time.perf_counter()
+    lats, lons = await _setup(users)
+    print(f"{users} users ready in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(42)
+    points = [(45.6 + rng.random(), 13.8 + rng.random() * 2) for _ in range(queries)]
+
+    await _time("full_scan", _full_scan, points[: max(queries // 10, 5)], radius_m, limit)
+    for backend in ("sql", "numpy"):
+        settings.nearby_backend = backend
+        await _time(backend, nearby.find_nearby, points, radius_m, limit)
+
+    latencies = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        geo.nearest(lat, lon, lats, lons, radius_m=radius_m, k=limit)
+        latencies.append(time.perf_counter() - started)
+    _report("in_memory", latencies)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius-m", type=float, default=2000.0)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(_main(args.users, args.queries, args.radius_m, args.limit))
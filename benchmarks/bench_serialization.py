@@ -0,0 +1,89 @@
+"""CPU per 1k users for the pydantic and the fast (orjson) response paths.
+
+* list_users: GET /list_users?limit=1000, FAST_RESPONSES off vs on.
+* batch: POST /batch for 500 ids, user cache cleared before each call so
+  every user is loaded and serialized.
+* stream: GET /list_users?stream=ndjson (one encoded line per user).
+
+Process CPU time is reported (Postgres' own work is excluded). Runs the app
+in process through TestClient against the database from the same PG* /
+GOOGLE_API_KEY environment as the test suite:
+
+    python -m benchmarks.bench_serialization --users 1000 --iterations 30
+"""
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.cache import user_cache
+from app.config import settings
+from app.database import engine
+from app.main import app
+from app.migrations import migrate
+
+SCHEMA = "bench_serialization"
+
+
+def _setup(users: int):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    migrate([SCHEMA])
+    with engine.begin() as conn:
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        conn.execute(text(
+            "INSERT INTO users (id, username, email, name, surname, address, partner_id, "
+            "latitude, longitude, created_at, updated_at) "
+            "SELECT 'ser-' || lpad(n::text, 6, '0'), 'user' || n, 'user' || n || '@example.com', "
+            "'Name', 'Surname', 'Trubarjeva cesta ' || n || ', Ljubljana', 'p1', 46.05, 14.5, now(), now() "
+            "FROM generate_series(1, :n) AS n"
+        ), {"n": users})
+        conn.execute(text(
+            "INSERT INTO cart_items (user_id, order_id, quantity, added_at) "
+            "SELECT id, k, 1, now() FROM users, generate_series(1, 3) AS k"
+        ))
+
+
+def _cpu_ms_per_1k(call, iterations: int, users: int) -> float:
+    call()
+    started = time.process_time()
+    for _ in range(iterations):
+        call()
+    return (time.process_time() - started) / iterations * 1000 * 1000 / users
+
+
+def main(users: int, iterations: int):
+    _setup(users)
+    headers = {"X-Tenant-Id": SCHEMA}
+    ids = [f"ser-{n:06d}" for n in range(1, min(users, 500) + 1)]
+
+    with TestClient(app) as client:
+        def _list():
+            assert len(client.get("/list_users", params={"limit": users}, headers=headers).json()) == users
+
+        def _batch():
+            user_cache.clear()
+            assert len(client.post("/batch", json={"ids": ids}, headers=headers).json()["users"]) == len(ids)
+
+        def _stream():
+            params = {"limit": users, "stream": "ndjson"}
+            assert client.get("/list_users", params=params, headers=headers).text.count("\n") == users
+
+        for name, call, n in (("list_users", _list, users), ("batch", _batch, len(ids)), ("stream", _stream, users)):
+            settings.fast_responses = False
+            before = _cpu_ms_per_1k(call, iterations, n)
+            settings.fast_responses = True
+            after = _cpu_ms_per_1k(call, iterations, n)
+            print(f"{name:>10}: pydantic {before:6.1f} ms  fast {after:6.1f} ms  per 1k users  ({before / after:.1f}x)")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+    main(args.users, args.iterations)
@@ -0,0 +1,107 @@
+"""Compare tenant routing strategies for a single-user lookup.
+
+* search_path: the previous `get_db_with_schema` behaviour, a fresh session
+  that issues `SET search_path TO <tenant>` before the SELECT.
+* translate_map: the current `get_async_db_session`, which renders
+  `<tenant>.users` through `schema_translate_map` and needs no extra statement.
+
+Needs the same PG* / GOOGLE_API_KEY environment as the test suite:
+
+    python -m benchmarks.bench_tenant_routing --iterations 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import event, select, text
+
+from app.database import AsyncSessionLocal, async_engine, get_async_db_session
+from app.migrations import migrate
+from app.models import User
+
+SCHEMA = "bench_tenant"
+USER_ID = "00000000-0000-0000-0000-00000000b001"
+
+
+async def _setup():
+    await asyncio.to_thread(migrate, [SCHEMA])
+    async with async_engine.begin() as conn:
+        await conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        await conn.execute(text("TRUNCATE TABLE users CASCADE"))
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, email, created_at, updated_at) "
+                "VALUES (:id, 'bench', 'bench@example.com', now(), now())"
+            ),
+            {"id": USER_ID},
+        )
+
+
+async def _lookup_search_path():
+    session = AsyncSessionLocal()
+    try:
+        await session.execute(text(f"SET search_path TO {SCHEMA}"))
+        result = await session.execute(select(User).where(User.id == USER_ID))
+        return result.scalar_one()
+    finally:
+        await session.close()
+
+
+async def _lookup_translate_map():
+    async with get_async_db_session(schema=SCHEMA) as session:
+        result = await session.execute(select(User).where(User.id == USER_ID))
+        return result.scalar_one()
+
+
+async def _run(lookup, iterations: int, concurrency: int):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one():
+        async with sem:
+            start = time.perf_counter()
+            await lookup()
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(iterations)))
+    return latencies, time.perf_counter() - started
+
+
+async def main(iterations: int, concurrency: int):
+    await _setup()
+
+    statements = 0
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        nonlocal statements
+        statements += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _count)
+
+    for name, lookup in (
+        ("search_path", _lookup_search_path),
+        ("translate_map", _lookup_translate_map),
+    ):
+        await _run(lookup, min(iterations, 100), concurrency)  # warm the pool
+        statements = 0
+        latencies, elapsed = await _run(lookup, iterations, concurrency)
+        latencies.sort()
+        print(
+            f"{name:>14}: {iterations / elapsed:8.0f} req/s  "
+            f"p50={statistics.median(latencies) * 1000:.2f}ms  "
+            f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms  "
+            f"statements/req={statements / iterations:.2f}"
+        )
+
+    event.remove(async_engine.sync_engine, "before_cursor_execute", _count)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.concurrency))
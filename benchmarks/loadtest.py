@@ -0,0 +1,369 @@
+"""Load-test the whole API in process, against local stand-ins only.
+
+Boots `app.main:app` (startup and shutdown included) behind an in-process
+ASGI transport, with:
+
+* the local Postgres from the PG* environment, seeded with --rows users per
+  tenant in the bench_t1 / bench_t2 schemas;
+* a fake OrdersService (grpc.aio, protos/orders.proto) on a free port;
+* an httpx MockTransport standing in for the Google Places endpoints.
+
+Then drives each scenario with --concurrency closed-loop clients for
+--requests requests and reports p50/p95/p99 latency, throughput, error count
+and DB round trips (statements executed) per request:
+
+* get_user: 90% GET /{id}, 10% PATCH /{id}
+* cart_churn: add, remove and read cart items
+* order_history: GET /{id}/orders through the fake OrdersService
+* list_users: keyset pages of 100 from random cursors, some filtered by partner
+* multi_tenant: get_user spread over both tenants via X-Tenant-Id
+* location: autocomplete and place details through the mock Google
+
+Results are written as JSON (--out). Given --baseline, every scenario is
+compared with the same scenario there, and the run fails (exit code 1) when
+p95 latency grew or throughput fell by more than --max-regression:
+
+    python -m benchmarks.loadtest --rows 10000,100000 --out results.json
+    python -m benchmarks.loadtest --rows 10000,100000 --baseline results.json
+
+Needs the same PG* / GOOGLE_API_KEY environment as the test suite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+TENANTS = ("bench_t1", "bench_t2")
+PARTNERS = 20
+ORDERS_PER_USER = 10
+SCENARIOS = ("get_user", "cart_churn", "order_history", "list_users", "multi_tenant", "location")
+
+
+# --------------------
+# Stand-ins
+# --------------------
+async def start_fake_orders():
+    """OrdersService answering every GetOrdersByUser with ORDERS_PER_USER orders."""
+    import grpc
+    from google.protobuf.timestamp_pb2 import Timestamp
+    from app.grpc import orders_pb2, orders_pb2_grpc
+
+    created_at = Timestamp()
+    created_at.FromDatetime(datetime(2024, 1, 1))
+
+    class _Orders(orders_pb2_grpc.OrdersServiceServicer):
+        async def GetOrdersByUser(self, request, context):
+            return orders_pb2.GetOrdersByUserResponse(orders=[
+                orders_pb2.OrderSummary(
+                    external_id=f"{request.user_id}-{i}",
+                    order_id=i,
+                    tenant_id="bench",
+                    user_id=request.user_id,
+                    total_amount=9.5,
+                    order_status="PAID",
+                    partner_id="p1",
+                    created_at=created_at,
+                )
+                for i in range(ORDERS_PER_USER)
+            ])
+
+    server = grpc.aio.server()
+    orders_pb2_grpc.add_OrdersServiceServicer_to_server(_Orders(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    return server, port
+
+
+def fake_google_transport():
+    import httpx
+
+    def _handle(request: httpx.Request):
+        if request.url.path.endswith("/autocomplete/json"):
+            text = request.url.params["input"]
+            return httpx.Response(200, json={"predictions": [
+                {"description": f"{text} {i}, Slovenia", "place_id": f"{text}-{i}"} for i in range(5)
+            ]})
+        return httpx.Response(200, json={"result": {
+            "formatted_address": request.url.params["place_id"],
+            "geometry": {"location": {"lat": 46.05, "lng": 14.5}},
+        }})
+
+    return httpx.MockTransport(_handle)
+
+
+# --------------------
+# Data
+# --------------------
+def user_id(n: int) -> str:
+    return f"bench-{n:08d}"
+
+
+def seed(rows: int):
+    """Give every bench tenant exactly `rows` users; reuses a matching seed."""
+    from sqlalchemy import text
+    from app.database import engine
+    from app.migrations import migrate
+
+    migrate(list(TENANTS))
+
+    for schema in TENANTS:
+        with engine.begin() as conn:
+            conn.execute(text(f"SET search_path TO {schema}"))
+            if conn.execute(text("SELECT count(*) FROM users")).scalar_one() == rows:
+                continue
+            conn.execute(text("TRUNCATE TABLE users CASCADE"))
+            conn.execute(
+                text(
+                    "INSERT INTO users (id, username, email, name, partner_id, latitude, longitude, "
+                    "created_at, updated_at) "
+                    "SELECT 'bench-' || lpad(n::text, 8, '0'), 'user' || n, 'user' || n || '@example.com', "
+                    "'User ' || n, 'p' || (n % :partners), 45.4 + random() * 1.5, 13.4 + random() * 3, "
+                    "now() - n * interval '1 second', now() "
+                    "FROM generate_series(0, :rows - 1) AS n"
+                ),
+                {"rows": rows, "partners": PARTNERS},
+            )
+            # Every tenth user starts with a few cart items.
+            conn.execute(text(
+                "INSERT INTO cart_items (user_id, order_id, quantity, added_at) "
+                "SELECT id, k, 1, now() FROM users, generate_series(1, 3) AS k "
+                "WHERE right(id, 1) = '0'"
+            ))
+            conn.execute(text("ANALYZE users"))
+            conn.execute(text("ANALYZE cart_items"))
+
+
+# --------------------
+# Scenarios
+# --------------------
+def scenario_requests(name: str, rows: int):
+    """A function rng -> (method, url, kwargs) for one request of `name`."""
+
+    def _user(rng):
+        return user_id(rng.randrange(rows))
+
+    def get_user(rng, tenant=TENANTS[0]):
+        headers = {"X-Tenant-Id": tenant}
+        if rng.random() < 0.9:
+            return "GET", f"/{_user(rng)}", {"headers": headers}
+        return "PATCH", f"/{_user(rng)}", {"headers": headers, "json": {"name": f"Name {rng.random():.6f}"}}
+
+    def cart_churn(rng):
+        headers = {"X-Tenant-Id": TENANTS[0]}
+        uid = user_id(rng.randrange(min(rows, 1000)))  # a hot set, so adds and removes meet
+        roll = rng.random()
+        if roll < 0.4:
+            return "POST", f"/{uid}/cart/{rng.randrange(1, 20)}", {"headers": headers}
+        if roll < 0.7:
+            return "DELETE", f"/{uid}/cart/{rng.randrange(1, 20)}", {"headers": headers}
+        return "GET", f"/{uid}/cart", {"headers": headers}
+
+    def order_history(rng):
+        return "GET", f"/{_user(rng)}/orders", {"headers": {"X-Tenant-Id": TENANTS[0]}}
+
+    def list_users(rng):
+        params = {"limit": 100, "cursor": user_id(rng.randrange(rows))}
+        if rng.random() < 0.3:
+            params["partner_id"] = f"p{rng.randrange(PARTNERS)}"
+        return "GET", "/list_users", {"headers": {"X-Tenant-Id": TENANTS[1]}, "params": params}
+
+    def multi_tenant(rng):
+        return get_user(rng, tenant=rng.choice(TENANTS))
+
+    def location(rng):
+        # A small vocabulary, so caches and prefix reuse see realistic repeats.
+        word = rng.choice(["ljubljanska", "mariborska", "celjska", "koprska", "trubarjeva"])
+        if rng.random() < 0.8:
+            return "GET", "/location/autocomplete", {"params": {"input": word[: rng.randint(3, len(word))]}}
+        return "GET", "/location/place", {"params": {"place_id": f"{word}-{rng.randrange(5)}"}}
+
+    return locals()[name]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def drive(client, make_request, requests: int, concurrency: int, rng: random.Random):
+    """Run `requests` requests over `concurrency` workers; per-request latencies and errors."""
+    plan = [make_request(rng) for _ in range(requests)]
+    latencies = []
+    errors = 0
+    position = 0
+
+    async def _worker():
+        nonlocal errors, position
+        while position < len(plan):
+            method, url, kwargs = plan[position]
+            position += 1
+            started = time.perf_counter()
+            r = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if r.status_code >= 400 and r.status_code != 404:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class StatementCounter:
+    """Counts statements sent to Postgres by either engine."""
+
+    def __init__(self, *sync_engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for sync_engine in sync_engines:
+            event.listen(sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+async def run_scenarios(rows: int, scenarios, requests: int, concurrency: int, warmup: int, seed_value: int):
+    import httpx
+    from app import location
+    from app.database import async_engine, engine
+    from app.main import app
+
+    counter = StatementCounter(engine, async_engine.sync_engine)
+    results = {}
+    async with app.router.lifespan_context(app):
+        location._client = httpx.AsyncClient(transport=fake_google_transport())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in scenarios:
+                rng = random.Random(f"{seed_value}:{name}:{rows}")
+                make_request = scenario_requests(name, rows)
+                await drive(client, make_request, warmup, concurrency, rng)
+
+                counter.count = 0
+                latencies, errors, elapsed = await drive(client, make_request, requests, concurrency, rng)
+                latencies.sort()
+                results[f"{name}@{rows}"] = {
+                    "scenario": name,
+                    "rows": rows,
+                    "requests": requests,
+                    "concurrency": concurrency,
+                    "errors": errors,
+                    "throughput_rps": requests / elapsed,
+                    "p50_ms": percentile(latencies, 50) * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                    "p99_ms": percentile(latencies, 99) * 1000,
+                    "mean_ms": statistics.fmean(latencies) * 1000,
+                    "db_round_trips_per_request": counter.count / requests,
+                }
+                report(results[f"{name}@{rows}"])
+        await location.close_places_client()
+    return results
+
+
+def report(r: dict):
+    print(
+        f"{r['scenario']:>13} @ {r['rows']:>8}: {r['throughput_rps']:8.0f} req/s  "
+        f"p50={r['p50_ms']:7.2f}ms  p95={r['p95_ms']:7.2f}ms  p99={r['p99_ms']:7.2f}ms  "
+        f"db/req={r['db_round_trips_per_request']:.2f}  errors={r['errors']}"
+    )
+
+
+# --------------------
+# Baseline comparison
+# --------------------
+def compare(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Scenarios whose p95 grew or throughput fell by more than `max_regression`."""
+    failures = []
+    for key, current in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        p95_change = current["p95_ms"] / before["p95_ms"] - 1
+        rps_change = current["throughput_rps"] / before["throughput_rps"] - 1
+        print(f"{key:>24}: p95 {p95_change:+7.1%}  throughput {rps_change:+7.1%}")
+        if p95_change > max_regression:
+            failures.append(f"{key}: p95 {before['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if -rps_change > max_regression:
+            failures.append(
+                f"{key}: throughput {before['throughput_rps']:.0f} -> {current['throughput_rps']:.0f} req/s"
+            )
+    return failures
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> int:
+    from app.grpc import orders_client
+
+    orders_server, orders_port = await start_fake_orders()
+    orders_client.ORDERS_GRPC_HOST, orders_client.ORDERS_GRPC_PORT = "127.0.0.1", orders_port
+
+    results = {}
+    try:
+        for rows in args.rows:
+            started = time.perf_counter()
+            await asyncio.to_thread(seed, rows)
+            print(f"seeded {rows} users per tenant in {time.perf_counter() - started:.1f}s")
+            results.update(await run_scenarios(
+                rows, args.scenarios, args.requests, args.concurrency, args.warmup, args.seed
+            ))
+    finally:
+        await orders_server.stop(None)
+
+    run = {
+        "meta": {
+            "revision": _git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "db_async": os.getenv("DB_ASYNC", "true"),
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        failures = compare(results, baseline, args.max_regression)
+        if failures:
+            print(f"regressions beyond {args.max_regression:.0%}:", *failures, sep="\n  ")
+            return 1
+    return 0
+
+
+def _rows(value: str) -> list[int]:
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=_rows, default=[10_000], help="comma-separated, e.g. 10000,100000,1000000")
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed fraction, e.g. 0.2")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    sys.exit(asyncio.run(main(args)))
@@ -3,6 +3,9 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import text
 
+# Off by default; the suite covers the cached paths. Set before app.config loads.
+os.environ.setdefault("USER_CACHE_ENABLED", "true")
+
 @pytest.fixture(autouse=True)
 def _clean_db(app_and_engine):
     _, engine = app_and_engine
@@ -13,6 +16,15 @@ def _clean_db(app_and_engine):
             conn.execute(text(f"SET search_path TO {schema}"))
             conn.execute(text("TRUNCATE TABLE users RESTART IDENTITY CASCADE"))
 
+    from app.cache import autocomplete_cache, order_history_cache, place_cache, user_cache
+    user_cache.clear()
+    order_history_cache.clear()
+    place_cache.clear()
+    autocomplete_cache.clear()
+
+    from app.location import prediction_trie
+    prediction_trie.clear()
+
 def _ensure_env():
     required = ["PGHOST", "PGUSER", "PGPASSWORD", "PGDATABASE", "GOOGLE_API_KEY"]
     missing = [k for k in required if not os.getenv(k)]
@@ -29,19 +41,124 @@ def app_and_engine():
 
     from app.main import app
     from app.database import engine
-    from app.models import Base
-
-    schemas = ["public", "tenant_a", "tenant_b"]
+    from app.migrations import migrate
 
-    with engine.begin() as conn:
-        for schema in schemas:
-            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
-            conn.execute(text(f"SET search_path TO {schema}"))
-            Base.metadata.create_all(bind=conn)
+    # Creates the schemas, or brings ones left by older runs up to date.
+    migrate(["public", "tenant_a", "tenant_b"], contract=True)
 
     return app, engine
 
 @pytest.fixture()
 def client(app_and_engine):
     app, _ = app_and_engine
-    return TestClient(app)
+    # Entering the client runs startup/shutdown on one event loop, so pooled
+    # asyncpg connections never outlive the loop they were opened on.
+    with TestClient(app) as c:
+        yield c
+
+
+
+@pytest.fixture()
+def max_queries():
+    """`with max_queries(n) as statements:` fails if the block runs more than n.
+
+    Counts what either engine sends, whichever thread or loop it runs on.
+    """
+    from contextlib import contextmanager
+    from app import sql_metrics
+
+    @contextmanager
+    def _at_most(limit: int):
+        with sql_metrics.capture() as statements:
+            yield statements
+        assert len(statements) <= limit, (
+            f"{len(statements)} queries, at most {limit} expected:\n"
+            + "\n".join(sql_metrics.normalize(s) for s in statements)
+        )
+
+    return _at_most
+
+
+@pytest.fixture()
+def orders_server():
+    """In-process OrdersService built from protos/orders.proto on a free port.
+
+    Records every GetOrdersByUser call and answers with `.orders`.
+    """
+    from concurrent import futures
+    import grpc
+    from app.grpc import orders_pb2, orders_pb2_grpc
+
+    class _FakeOrdersServicer(orders_pb2_grpc.OrdersServiceServicer):
+        def __init__(self):
+            self.calls = []
+            self.orders = []
+
+        def GetOrdersByUser(self, request, context):
+            self.calls.append({
+                "user_id": request.user_id,
+                "metadata": dict(context.invocation_metadata()),
+                "peer": context.peer(),
+                "time_remaining": context.time_remaining(),
+            })
+            return orders_pb2.GetOrdersByUserResponse(orders=self.orders)
+
+    servicer = _FakeOrdersServicer()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    orders_pb2_grpc.add_OrdersServiceServicer_to_server(servicer, server)
+    servicer.target = f"127.0.0.1:{server.add_insecure_port('127.0.0.1:0')}"
+    server.start()
+    yield servicer
+    server.stop(grace=None)
+
+
+@pytest.fixture()
+def google(client, monkeypatch):
+    """Route the shared Places client to a local MockTransport.
+
+    Set `.responses[path]` to the JSON body to return and `.delay_s` to slow
+    every answer down; requests are recorded.
+    """
+    import asyncio
+    import httpx
+    from app import location
+
+    class _Google:
+        def __init__(self):
+            self.requests = []
+            self.responses = {}
+            self.delay_s = 0.0
+
+        async def handle(self, request: httpx.Request):
+            self.requests.append(request)
+            await asyncio.sleep(self.delay_s)
+            path = request.url.path.rsplit("/", 2)[-2]  # ".../details/json" -> "details"
+            return httpx.Response(200, json=self.responses.get(path, {}))
+
+    fake = _Google()
+    monkeypatch.setattr(
+        location, "_client", httpx.AsyncClient(transport=httpx.MockTransport(fake.handle))
+    )
+    return fake
+
+
+@pytest.fixture(scope="session")
+def _span_exporter():
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from app import tracing
+
+    exporter = InMemorySpanExporter()
+    tracing.configure(exporter=exporter, sample_ratio=1.0)
+    # Only tests that ask for `spans` trace.
+    tracing.enabled = False
+    return exporter
+
+
+@pytest.fixture()
+def spans(_span_exporter, monkeypatch):
+    """Turn tracing on, every new trace sampled; `.get_finished_spans()` lists them."""
+    from app import tracing
+
+    monkeypatch.setattr(tracing, "enabled", True)
+    _span_exporter.clear()
+    return _span_exporter
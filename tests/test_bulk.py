@@ -0,0 +1,127 @@
+import json
+
+from tests.test_users import _insert_user
+
+
+def _ndjson(*rows):
+    return "\n".join(r if isinstance(r, str) else json.dumps(r) for r in rows) + "\n"
+
+
+def test_import_ndjson_loads_valid_rows_and_reports_the_rest(client, app_and_engine):
+    _, engine = app_and_engine
+    _insert_user(engine, "tenant_a", "old", "old", "old@example.com")
+
+    body = _ndjson(
+        {"id": "u1", "username": "u1", "email": "u1@example.com", "cart": [3, 1, 3]},
+        {"id": "u2", "username": "u2", "email": "not-an-email"},
+        "{broken",
+        {"id": "old", "username": "old2", "email": "old2@example.com"},
+        {"id": "u1", "username": "u1b", "email": "u1b@example.com"},
+        {"id": "u3", "username": "u3", "email": "u3@example.com"},
+    )
+    r = client.post(
+        "/import",
+        content=body,
+        headers={"X-Tenant-Id": "tenant_a", "Content-Type": "application/x-ndjson"},
+    )
+
+    assert r.status_code == 200
+    result = r.json()
+    assert (result["received"], result["inserted"], result["failed"]) == (6, 2, 4)
+    assert [(e["line"], e["id"]) for e in result["errors"]] == [(2, None), (3, None), (4, "old"), (5, "u1")]
+    assert result["errors"][0]["error"].startswith("email:")
+
+    u1 = client.get("/u1", headers={"X-Tenant-Id": "tenant_a"}).json()
+    assert u1["cart"] == [3, 3, 1]
+    assert client.get("/u3", headers={"X-Tenant-Id": "tenant_a"}).status_code == 200
+    assert client.get("/u1").status_code == 404
+
+
+def test_import_reports_rows_that_are_not_utf8(client):
+    ndjson = (
+        b'{"id": "n1", "username": "n1", "email": "n1@example.com"}\n'
+        b'{"id": "n2", "username": "n\xe9", "email": "n2@example.com"}\n'
+    )
+    r = client.post("/import", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+    result = r.json()
+    assert (result["inserted"], result["failed"]) == (1, 1)
+    assert result["errors"] == [{"line": 2, "id": None, "error": "row is not valid UTF-8"}]
+
+    csv_body = "id,username,email\nc1,\"multi\nline\",c1@example.com\n".encode() + b"c2,c\xff2,c2@example.com\n"
+    r = client.post("/import", content=csv_body, headers={"Content-Type": "text/csv"})
+    result = r.json()
+    assert (result["inserted"], result["failed"]) == (1, 1)
+    assert result["errors"] == [{"line": 4, "id": "c2", "error": "row is not valid UTF-8"}]
+    assert client.get("/n2").status_code == 404
+    assert client.get("/c2").status_code == 404
+
+
+def test_csv_export_round_trips_through_import(client, app_and_engine):
+    _, engine = app_and_engine
+    for i in range(3):
+        _insert_user(engine, "tenant_b", f"csv-{i}", f"c{i}", f"c{i}@example.com", [i, 7])
+
+    r = client.get("/export", params={"format": "csv"}, headers={"X-Tenant-Id": "tenant_b"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    lines = r.text.splitlines()
+    assert lines[0].startswith("id,username,email,")
+    assert len(lines) == 4
+
+    r = client.post("/import", content=r.text, headers={"Content-Type": "text/csv"})
+    assert r.json()["inserted"] == 3
+    assert client.get("/csv-2").json()["cart"] == [2, 7]
+
+
+def test_csv_round_trip_keeps_newlines_inside_quoted_fields(client, app_and_engine):
+    import asyncio
+    from sqlalchemy import text
+    from app.bulk import _rows
+
+    _, engine = app_and_engine
+    _insert_user(engine, "tenant_b", "nl-1", "nl1", "nl1@example.com", [4, 4])
+    _insert_user(engine, "tenant_b", "nl-2", "nl2", "nl2@example.com", [5])
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE tenant_b.users SET name = 'Ana\nMarija', address = 'Trg 1\r\n\"Center\", 2nd floor' WHERE id = 'nl-1'"
+        ))
+
+    exported = client.get("/export", params={"format": "csv"}, headers={"X-Tenant-Id": "tenant_b"}).text
+    assert len(exported.splitlines()) > 3
+
+    r = client.post("/import", content=exported, headers={"Content-Type": "text/csv"})
+    assert (r.json()["inserted"], r.json()["failed"]) == (2, 0)
+    assert client.get("/nl-1").json()["cart"] == [4, 4]
+    assert client.get("/nl-2").json()["cart"] == [5]
+
+    async def _parse(chunk_size):
+        data = exported.encode()
+
+        async def _chunks():
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+
+        return [(n, row["id"], row["cart"]) async for n, row in _rows(_chunks(), "csv")]
+
+    # Rows are numbered by their first line, wherever the chunks split them.
+    expected = [(2, "nl-1", ["4", "4"]), (5, "nl-2", ["5"])]
+    assert asyncio.run(_parse(len(exported))) == expected
+    assert asyncio.run(_parse(7)) == expected
+
+
+def test_ndjson_export_matches_list_users(client, app_and_engine):
+    _, engine = app_and_engine
+    for i in range(3):
+        _insert_user(engine, "public", f"exp-{i}", f"e{i}", f"e{i}@example.com", [i])
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE public.users SET partner_id = 'p1', name = 'Ana \"\\ N' WHERE id <> 'exp-1'")
+
+    r = client.get("/export", params={"partner_id": "p1"})
+    exported = [json.loads(line) for line in r.text.splitlines()]
+    listed = client.get("/list_users", params={"partner_id": "p1"}).json()
+
+    assert [u["id"] for u in exported] == ["exp-0", "exp-2"]
+    assert exported[0]["name"] == 'Ana "\\ N'
+    assert [{k: u[k] for k in ("id", "email", "name", "cart")} for u in exported] == [
+        {k: u[k] for k in ("id", "email", "name", "cart")} for u in listed
+    ]
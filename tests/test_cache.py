@@ -0,0 +1,226 @@
+import time
+
+from app.cache import InMemorySharedCache, TTLCache, UserCache
+
+
+def _insert_user(engine, schema: str, user_id: str, username: str, email: str):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"SET search_path TO {schema}")
+        conn.exec_driver_sql(
+            "INSERT INTO users (id, username, email, created_at, updated_at) VALUES (%s,%s,%s, now(), now())",
+            (user_id, username, email),
+        )
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache("t", max_entries=2, ttl_s=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache("t", max_entries=10, ttl_s=60)
+    cache.set("a", 1, ttl_s=0.01)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_user_cache_backfills_local_from_shared_tier():
+    shared = InMemorySharedCache()
+    writer = UserCache(TTLCache("user", 10, 60), shared=shared)
+    reader = UserCache(TTLCache("user", 10, 60), shared=shared)
+
+    writer.set("public", "u1", {"id": "u1"})
+    assert reader.get("public", "u1") == {"id": "u1"}
+    assert reader.local.get("user:public:u1") == {"id": "u1"}
+
+    writer.invalidate("public", "u1")
+    reader.local.clear()
+    assert reader.get("public", "u1") is None
+
+
+def test_get_user_is_served_from_cache_and_invalidated_on_patch(client, app_and_engine):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000020"
+    _insert_user(engine, "public", user_id, "cached", "cached@example.com")
+
+    assert client.get(f"/{user_id}").json()["name"] is None
+
+    # Bypass the API: a cached read must not see this until invalidation.
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE public.users SET name = 'direct' WHERE id = %s", (user_id,))
+    assert client.get(f"/{user_id}").json()["name"] is None
+
+    r = client.patch(f"/{user_id}", json={"surname": "Patched"})
+    assert r.status_code == 200
+
+    body = client.get(f"/{user_id}").json()
+    assert body["name"] == "direct"
+    assert body["surname"] == "Patched"
+
+
+def test_user_cache_drops_fills_read_before_an_invalidation():
+    cache = UserCache(TTLCache("user", 10, 60))
+
+    generation = cache.generation()
+    cache.invalidate("public", "u1")
+    cache.set("public", "u1", {"name": "old"}, generation)
+    assert cache.get("public", "u1") is None
+
+    cache.set("public", "u1", {"name": "new"}, cache.generation())
+    assert cache.get("public", "u1") == {"name": "new"}
+
+
+def test_get_racing_a_patch_does_not_cache_the_old_row(client, app_and_engine, monkeypatch):
+    import app.main as main
+    from app.cache import user_cache
+
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000022"
+    _insert_user(engine, "public", user_id, "racy", "racy@example.com")
+    user_payload = main.user_payload
+
+    def _patch_lands_after_the_read(row):
+        # The GET has already read the row; a writer now commits and invalidates.
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE public.users SET name = 'patched' WHERE id = %s", (user_id,))
+        user_cache.invalidate("public", user_id)
+        return user_payload(row)
+
+    monkeypatch.setattr(main, "user_payload", _patch_lands_after_the_read)
+    assert client.get(f"/{user_id}").json()["name"] is None
+    assert client.get(f"/{user_id}").json()["name"] == "patched"
+
+
+def test_user_cache_reaches_the_shared_tier_off_the_event_loop(client, app_and_engine, monkeypatch):
+    import asyncio
+    from app.cache import user_cache
+
+    class _OffLoopShared(InMemorySharedCache):
+        def __init__(self):
+            super().__init__()
+            self.calls = []
+
+        def _record(self, op):
+            try:
+                asyncio.get_running_loop()
+                on_loop = True
+            except RuntimeError:
+                on_loop = False
+            self.calls.append((op, on_loop))
+
+        def get(self, key):
+            self._record("get")
+            return super().get(key)
+
+        def set(self, key, value, ttl_s):
+            self._record("set")
+            super().set(key, value, ttl_s)
+
+        def delete(self, key):
+            self._record("delete")
+            super().delete(key)
+
+    shared = _OffLoopShared()
+    monkeypatch.setattr(user_cache, "shared", shared)
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000023"
+    _insert_user(engine, "public", user_id, "offloop", "offloop@example.com")
+
+    assert client.get(f"/{user_id}").status_code == 200
+    assert client.patch(f"/{user_id}", json={"name": "n"}).status_code == 200
+    user_cache.local.clear()
+    assert client.get(f"/{user_id}").json()["name"] == "n"
+
+    assert {op for op, _ in shared.calls} == {"get", "set", "delete"}
+    assert not [op for op, on_loop in shared.calls if on_loop]
+
+
+def test_cache_is_keyed_by_tenant(client, app_and_engine):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000021"
+    _insert_user(engine, "tenant_a", user_id, "a", "a@example.com")
+
+    assert client.get(f"/{user_id}", headers={"X-Tenant-Id": "tenant_a"}).status_code == 200
+    assert client.get(f"/{user_id}", headers={"X-Tenant-Id": "tenant_b"}).status_code == 404
+
+
+def test_cache_counters_are_exported(client):
+    body = client.get("/metrics").text
+    assert "cache_hits_total" in body
+    assert "cache_misses_total" in body
+    assert "cache_evictions_total" in body
+
+
+def _swr_cache(**kwargs):
+    from app.cache import StaleWhileRevalidateCache
+
+    options = dict(max_entries=10, ttl_s=60, swr_s=60, stale_if_error_s=60, refresh_timeout_s=1)
+    options.update(kwargs)
+    return StaleWhileRevalidateCache("test_swr", **options)
+
+
+def test_swr_cache_coalesces_concurrent_loads():
+    import asyncio
+
+    cache = _swr_cache()
+    calls = []
+
+    async def _loader(timeout_s):
+        calls.append(timeout_s)
+        await asyncio.sleep(0.01)
+        return "v"
+
+    async def _run():
+        return await asyncio.gather(*(cache.get("k", _loader, timeout_s=1) for _ in range(20)))
+
+    assert asyncio.run(_run()) == ["v"] * 20
+    assert len(calls) == 1
+
+
+def test_swr_cache_serves_stale_and_refreshes_in_background():
+    import asyncio
+
+    cache = _swr_cache(ttl_s=0)
+    values = iter(["old", "new"])
+
+    async def _loader(timeout_s):
+        return next(values)
+
+    async def _run():
+        first = await cache.get("k", _loader, timeout_s=1)
+        second = await cache.get("k", _loader, timeout_s=1)
+        await asyncio.sleep(0)  # let the background refresh finish
+        return first, second, cache.entries.get("k")[1]
+
+    assert asyncio.run(_run()) == ("old", "old", "new")
+
+
+def test_swr_cache_serves_stale_when_reload_fails():
+    import asyncio
+    import pytest
+
+    cache = _swr_cache(ttl_s=0, swr_s=0)
+    responses = iter(["cached"])
+
+    async def _loader(timeout_s):
+        try:
+            return next(responses)
+        except StopIteration:
+            raise RuntimeError("orders down")
+
+    async def _run():
+        await cache.get("k", _loader, timeout_s=1)
+        return await cache.get("k", _loader, timeout_s=1)
+
+    assert asyncio.run(_run()) == "cached"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get("other", _loader, timeout_s=1))
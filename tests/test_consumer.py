@@ -0,0 +1,174 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event as sa_event, exc, text
+
+from app import rabbitmq_consumer
+
+
+def _encode(body):
+    return body if isinstance(body, bytes) else json.dumps(body).encode()
+
+
+class _FakeChannel:
+    """Replays queued bodies through `consume`; records acks and publishes."""
+
+    def __init__(self, bodies):
+        self.deliveries = [
+            (SimpleNamespace(delivery_tag=tag), None, _encode(body))
+            for tag, body in enumerate(bodies, start=1)
+        ]
+        self.acks = []
+        self.published = []
+
+    def consume(self, queue, inactivity_timeout=None):
+        yield from self.deliveries
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((routing_key, body, properties.headers))
+
+    def deliver(self, body, headers=None):
+        """Run one message through the per-message callback."""
+        method = SimpleNamespace(delivery_tag=len(self.acks) + 1)
+        properties = SimpleNamespace(headers=headers)
+        rabbitmq_consumer.callback(self, method, properties, _encode(body))
+
+
+def _event(n, tenant="public"):
+    return {
+        "user_id": f"00000000-0000-0000-0000-{n:012d}",
+        "username": f"user{n}-{tenant}",
+        "email": f"user{n}@{tenant}.example.com",
+        "tenant_id": tenant,
+    }
+
+
+def _user_ids(engine, schema):
+    with engine.connect() as conn:
+        return set(conn.execute(text(f"SELECT id FROM {schema}.users")).scalars())
+
+
+def test_batches_group_by_tenant_and_ack_multiple(app_and_engine):
+    _, engine = app_and_engine
+    events = [_event(i, "tenant_a" if i % 2 else "tenant_b") for i in range(1, 6)]
+    events.append(_event(1, "tenant_a"))  # redelivery inside the batch
+
+    statements = []
+
+    def _count(conn, cursor, statement, *args):
+        if statement.startswith("INSERT"):
+            statements.append(statement)
+
+    sa_event.listen(engine, "before_cursor_execute", _count)
+    try:
+        channel = _FakeChannel(events)
+        rabbitmq_consumer.consume_batches(channel, batch_size=10, batch_timeout_ms=1000)
+    finally:
+        sa_event.remove(engine, "before_cursor_execute", _count)
+
+    assert len(statements) == 2  # one per tenant
+    assert channel.acks == [(6, True)]
+    assert _user_ids(engine, "tenant_a") == {e["user_id"] for e in events[0:5:2]}
+    assert _user_ids(engine, "tenant_b") == {e["user_id"] for e in events[1:5:2]}
+
+
+def test_batch_size_splits_batches_and_skips_existing(app_and_engine):
+    _, engine = app_and_engine
+    rabbitmq_consumer.insert_users([_event(1)])
+
+    channel = _FakeChannel([_event(i) for i in range(1, 6)])
+    rabbitmq_consumer.consume_batches(channel, batch_size=2, batch_timeout_ms=1000)
+
+    assert channel.acks == [(2, True), (4, True), (5, True)]
+    assert len(_user_ids(engine, "public")) == 5
+
+
+def _count(outcome):
+    return rabbitmq_consumer.EVENTS.labels("user_created", outcome)._value.get()
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[]", json.dumps({"user_id": "x"}).encode()])
+def test_poison_messages_are_dead_lettered(body):
+    before = _count("dead_lettered")
+    channel = _FakeChannel([])
+
+    channel.deliver(body)
+
+    assert channel.acks == [(1, False)]
+    [(queue, republished, headers)] = channel.published
+    assert queue == rabbitmq_consumer.DEAD_LETTER_QUEUE
+    assert republished == body
+    assert "x-error" in headers
+    assert _count("dead_lettered") == before + 1
+
+
+def test_unknown_tenant_is_dead_lettered():
+    channel = _FakeChannel([])
+    channel.deliver(_event(1, "no_such_tenant"))
+    assert channel.published[0][0] == rabbitmq_consumer.DEAD_LETTER_QUEUE
+
+
+def test_unique_conflicts_are_duplicates(app_and_engine):
+    _, engine = app_and_engine
+    channel = _FakeChannel([])
+    before = _count("duplicate")
+
+    channel.deliver(_event(1))
+    taken = dict(_event(2), username=_event(1)["username"])
+    channel.deliver(taken)
+    channel.deliver(_event(1))
+
+    assert [tag for tag, _ in channel.acks] == [1, 2, 3]
+    assert channel.published == []
+    assert _count("duplicate") == before + 2
+    assert _user_ids(engine, "public") == {_event(1)["user_id"]}
+
+
+def test_transient_errors_retry_with_backoff_then_dead_letter(monkeypatch):
+    def _down(event):
+        raise exc.OperationalError("INSERT", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(rabbitmq_consumer, "handle_user_created", _down)
+    monkeypatch.setattr(rabbitmq_consumer, "CONSUMER_MAX_RETRIES", 3)
+    monkeypatch.setattr(rabbitmq_consumer, "CONSUMER_RETRY_BASE_MS", 100)
+    channel = _FakeChannel([])
+
+    headers = None
+    for _ in range(4):
+        channel.deliver(_event(1), headers=headers)
+        headers = channel.published[-1][2]
+
+    queues = [queue for queue, _, _ in channel.published]
+    assert queues == [
+        "user_created.retry.100",
+        "user_created.retry.200",
+        "user_created.retry.400",
+        rabbitmq_consumer.DEAD_LETTER_QUEUE,
+    ]
+    assert len(channel.acks) == 4
+
+
+def test_batch_with_poison_message_falls_back_per_message(app_and_engine):
+    _, engine = app_and_engine
+    channel = _FakeChannel([_event(1), b"{not json", _event(2)])
+
+    rabbitmq_consumer.consume_batches(channel, batch_size=10, batch_timeout_ms=1000)
+
+    assert [tag for tag, _ in channel.acks] == [1, 2, 3]
+    assert [queue for queue, _, _ in channel.published] == [rabbitmq_consumer.DEAD_LETTER_QUEUE]
+    assert len(_user_ids(engine, "public")) == 2
+
+
+def test_batch_skips_username_conflicts(app_and_engine):
+    _, engine = app_and_engine
+    taken = dict(_event(2), username=_event(1)["username"])
+    channel = _FakeChannel([_event(1), taken, _event(3)])
+
+    rabbitmq_consumer.consume_batches(channel, batch_size=10, batch_timeout_ms=1000)
+
+    assert channel.acks == [(3, True)]
+    assert _user_ids(engine, "public") == {_event(1)["user_id"], _event(3)["user_id"]}
@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import async_engine
+from app.events import EventConsumer, InMemoryBroker
+
+
+def _run(coro):
+    async def _main():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(_main())
+
+
+async def _consume(broker, messages, **kwargs):
+    for routing_key, event in messages:
+        await broker.publish(routing_key, json.dumps(event).encode(), {})
+    consumer = EventConsumer(broker, **kwargs)
+    await consumer.start()
+    await asyncio.sleep(0)
+    await consumer.stop(drain_timeout_s=5)
+    return consumer
+
+
+def _users(engine, schema="public"):
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT id, email, partner_id FROM {schema}.users ORDER BY id"))
+        return [tuple(r) for r in rows]
+
+
+def test_handlers_apply_each_routing_key(app_and_engine):
+    _, engine = app_and_engine
+    broker = InMemoryBroker()
+    _run(_consume(broker, [
+        ("user_created", {"user_id": "u1", "username": "u1", "email": "u1@example.com"}),
+        ("user_created", {"user_id": "u2", "username": "u2", "email": "u2@example.com"}),
+        ("user_created", {"user_id": "u3", "username": "u3", "email": "u3@example.com", "tenant_id": "tenant_a"}),
+    ]))
+    _run(_consume(broker, [
+        ("user_updated", {"user_id": "u1", "email": "new@example.com"}),
+        ("partner_assigned", {"user_id": "u1", "partner_id": "p1"}),
+        ("user_deleted", {"user_id": "u2"}),
+        ("user_deleted", {"user_id": "u2"}),
+    ]))
+
+    assert _users(engine) == [("u1", "new@example.com", "p1")]
+    assert _users(engine, "tenant_a") == [("u3", "u3@example.com", None)]
+    assert len(broker.acked) == 7
+    assert all(not broker.queues[q] for q in broker.queues if q.endswith(".dead"))
+
+
+def test_poison_and_out_of_order_events(app_and_engine):
+    broker = InMemoryBroker()
+    _run(_consume(broker, [
+        ("user_updated", {"user_id": "missing", "name": "x"}),
+        ("partner_assigned", {"user_id": "u1"}),
+        ("user_updated", {"user_id": "u1", "email": "not-an-email"}),
+    ]))
+
+    [retried] = broker.queues["user_updated.retry.1000"]
+    assert retried.headers == {"x-retry-count": 1}
+    assert len(broker.queues["partner_assigned.dead"]) == 1
+    assert len(broker.queues["user_updated.dead"]) == 1
+    assert len(broker.acked) == 3
+
+
+def test_stop_drains_in_flight_deliveries():
+    broker = InMemoryBroker()
+    done = []
+
+    async def _slow(event):
+        await asyncio.sleep(0.05)
+        done.append(event["user_id"])
+        return True
+
+    _run(_consume(
+        broker,
+        [("slow", {"user_id": str(i)}) for i in range(6)],
+        handlers={"slow": _slow},
+        workers=3,
+    ))
+
+    assert sorted(done) == [str(i) for i in range(6)]
+    assert len(broker.acked) == 6
+
+
+def test_consumer_runs_in_api_lifespan(app_and_engine, monkeypatch):
+    app, engine = app_and_engine
+    monkeypatch.setattr(settings, "events_consumer_enabled", True)
+    monkeypatch.setattr(settings, "events_broker", "memory")
+
+    with TestClient(app) as client:
+        consumer = app.state.event_consumer
+        assert client.get("/health").json()["events"] == "ok"
+        body = json.dumps({"user_id": "u9", "username": "u9", "email": "u9@example.com"}).encode()
+        client.portal.call(consumer.broker.publish, "user_created", body, {})
+
+    assert _users(engine) == [("u9", "u9@example.com", None)]
+    assert len(consumer.broker.acked) == 1
+
+
+async def _until(condition, timeout_s=2.0):
+    async with asyncio.timeout(timeout_s):
+        while not condition():
+            await asyncio.sleep(0.005)
+
+
+def test_consumer_reconnects_after_broker_drops():
+    from app.events import CONSUMER_CONNECTED
+
+    seen = []
+    release = asyncio.Event()
+
+    async def _record(event):
+        seen.append(event["user_id"])
+        if event["user_id"] == "held":
+            await release.wait()
+        return True
+
+    async def _main():
+        broker = InMemoryBroker()
+        broker.fail_connects = 2  # down at startup: start() must not fail
+        consumer = EventConsumer(broker, handlers={"user_created": _record}, reconnect_initial_s=0.01)
+        await consumer.start()
+        assert not consumer.connected
+        await _until(lambda: consumer.connected)
+        assert broker.connects == 1
+        assert CONSUMER_CONNECTED._value.get() == 1
+
+        await broker.publish("user_created", b'{"user_id": "held"}', {})
+        await _until(lambda: seen == ["held"])
+        broker.disconnect()  # while "held" is being handled
+        release.set()
+        await _until(lambda: not consumer.connected)
+        await broker.publish("user_created", b'{"user_id": "later"}', {})
+
+        await _until(lambda: broker.connects == 2 and len(broker.acked) == 2)
+        await consumer.stop(drain_timeout_s=1)
+        return broker
+
+    broker = _run(_main())
+    # The ack for the dropped connection was discarded and "held" redelivered.
+    assert seen == ["held", "held", "later"]
+    assert [json.loads(d.body)["user_id"] for d in broker.acked] == ["held", "later"]
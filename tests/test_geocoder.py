@@ -0,0 +1,70 @@
+import csv
+
+import pytest
+
+from app import geocoder
+from app.geocoder import GeocodingIndex, build_index, read_rows
+
+ADDRESSES = [
+    ("Ljubljanska cesta", "10", "2000", "Maribor", 46.55, 15.65),
+    ("Ljubljanska cesta", "2", "2000", "Maribor", 46.56, 15.64),
+    ("Ljubljanska cesta", "2a", "2000", "Maribor", 46.57, 15.63),
+    ("Ljubljanska ulica", "1", "6000", "Koper", 45.54, 13.73),
+    ("Čopova ulica", "3", "1000", "Ljubljana", 46.05, 14.50),
+    ("Celovška cesta", "1", "1000", "Ljubljana", 46.06, 14.49),
+]
+
+
+@pytest.fixture()
+def index(tmp_path):
+    source = tmp_path / "addresses.csv"
+    with open(source, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["street", "house_number", "postcode", "city", "lat", "lon"])
+        writer.writerows(ADDRESSES)
+    assert build_index(read_rows(str(source)), str(tmp_path / "index")) == len(ADDRESSES)
+    return GeocodingIndex(str(tmp_path / "index"))
+
+
+def test_prefix_autocomplete_in_natural_order(index):
+    results = index.autocomplete("Ljubljanska  CESTA")
+    assert [r["description"] for r in results] == [
+        "Ljubljanska cesta 2, 2000 Maribor",
+        "Ljubljanska cesta 2a, 2000 Maribor",
+        "Ljubljanska cesta 10, 2000 Maribor",
+    ]
+    assert [r["description"] for r in index.autocomplete("ljubljanska", limit=2)] == [
+        "Ljubljanska cesta 2, 2000 Maribor",
+        "Ljubljanska cesta 2a, 2000 Maribor",
+    ]
+    assert index.autocomplete("ČOPOVA ul")[0]["description"] == "Čopova ulica 3, 1000 Ljubljana"
+    assert index.autocomplete("Trubarjeva") == []
+
+
+def test_place_resolves_local_ids(index):
+    [hit] = index.autocomplete("Ljubljanska ulica 1")
+    place = index.place(hit["place_id"])
+    assert place == {
+        "formatted_address": "Ljubljanska ulica 1, 6000 Koper",
+        "latitude": 45.54,
+        "longitude": 13.73,
+    }
+    assert index.place("local:999") is None
+    assert index.place("local:x") is None
+
+
+def test_endpoints_use_local_index_and_fall_back_to_google(client, google, index, monkeypatch):
+    monkeypatch.setattr(geocoder, "_index", index)
+    google.responses["autocomplete"] = {
+        "predictions": [{"description": "Trubarjeva cesta, Ljubljana", "place_id": "g-1"}]
+    }
+
+    local = client.get("/location/autocomplete", params={"input": "Celovška"}).json()
+    assert local[0]["description"] == "Celovška cesta 1, 1000 Ljubljana"
+    place = client.get("/location/place", params={"place_id": local[0]["place_id"]}).json()
+    assert place["latitude"] == 46.06
+    assert google.requests == []
+
+    remote = client.get("/location/autocomplete", params={"input": "Trubarjeva"}).json()
+    assert remote[0]["place_id"] == "g-1"
+    assert len(google.requests) == 1
@@ -25,3 +25,24 @@ def test_health_db_failure_returns_503(app_and_engine):
     assert "Database unavailable" in r.json()["detail"]
 
     app.dependency_overrides.clear()
+
+
+def test_prewarm_opens_connections_before_serving(app_and_engine, orders_server, monkeypatch):
+    import grpc
+    from app.config import settings
+    from app.database import async_engine, engine, tenant_schemas
+    from app.grpc import orders_client
+
+    app, _ = app_and_engine
+    host, port = orders_server.target.rsplit(":", 1)
+    monkeypatch.setattr(orders_client, "ORDERS_GRPC_HOST", host)
+    monkeypatch.setattr(orders_client, "ORDERS_GRPC_PORT", int(port))
+    monkeypatch.setattr(settings, "prewarm_connections", 3)
+    tenant_schemas.clear()
+
+    pool = (async_engine.sync_engine if settings.db_async else engine).pool
+    with TestClient(app):
+        assert pool.checkedin() >= 3
+        assert "public" in tenant_schemas._schemas
+        channel = orders_client._client._channels[0]
+        assert channel.get_state() == grpc.ChannelConnectivity.READY
@@ -1,24 +1,17 @@
-def test_autocomplete_returns_predictions(client, monkeypatch):
-    import app.main as main_mod
-
-    class _FakeResp:
-        def raise_for_status(self): 
-            return None
-        def json(self):
-            return {
-                "predictions": [
-                    {"description": "Ljubljana, Slovenia", "place_id": "abc"},
-                    {"description": "Maribor, Slovenia", "place_id": "def"},
-                ]
-            }
-
-    class _FakeClient:
-        def __init__(self, *args, **kwargs): pass
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): return False
-        async def get(self, url, params=None): return _FakeResp()
-
-    monkeypatch.setattr(main_mod.httpx, "AsyncClient", _FakeClient)
+import asyncio
+
+from app import location
+from app.cache import SQLiteSharedCache, TTLCache, TieredCache
+from app.location import PrefixTrie
+
+
+def test_autocomplete_returns_predictions(client, google):
+    google.responses["autocomplete"] = {
+        "predictions": [
+            {"description": "Ljubljana, Slovenia", "place_id": "abc"},
+            {"description": "Maribor, Slovenia", "place_id": "def"},
+        ]
+    }
 
     r = client.get("/location/autocomplete", params={"input": "Lj"})
     assert r.status_code == 200
@@ -26,29 +19,19 @@ def test_autocomplete_returns_predictions(client, monkeypatch):
         {"description": "Ljubljana, Slovenia", "place_id": "abc"},
         {"description": "Maribor, Slovenia", "place_id": "def"},
     ]
+    params = google.requests[0].url.params
+    assert params["input"] == "Lj"
+    assert params["components"] == "country:si"
+    assert params["key"]
 
 
-def test_place_details_success(client, monkeypatch):
-    import app.main as main_mod
-
-    class _FakeResp:
-        def raise_for_status(self): 
-            return None
-        def json(self):
-            return {
-                "result": {
-                    "formatted_address": "Ljubljana, Slovenia",
-                    "geometry": {"location": {"lat": 46.0569, "lng": 14.5058}},
-                }
-            }
-
-    class _FakeClient:
-        def __init__(self, *args, **kwargs): pass
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): return False
-        async def get(self, url, params=None): return _FakeResp()
-
-    monkeypatch.setattr(main_mod.httpx, "AsyncClient", _FakeClient)
+def test_place_details_success(client, google):
+    google.responses["details"] = {
+        "result": {
+            "formatted_address": "Ljubljana, Slovenia",
+            "geometry": {"location": {"lat": 46.0569, "lng": 14.5058}},
+        }
+    }
 
     r = client.get("/location/place", params={"place_id": "abc"})
     assert r.status_code == 200
@@ -58,23 +41,179 @@ def test_place_details_success(client, monkeypatch):
     assert body["longitude"] == 14.5058
 
 
-def test_place_details_not_found(client, monkeypatch):
-    import app.main as main_mod
-
-    class _FakeResp:
-        def raise_for_status(self): 
-            return None
-        def json(self):
-            return {"result": None}
-
-    class _FakeClient:
-        def __init__(self, *args, **kwargs): pass
-        async def __aenter__(self): return self
-        async def __aexit__(self, exc_type, exc, tb): return False
-        async def get(self, url, params=None): return _FakeResp()
-
-    monkeypatch.setattr(main_mod.httpx, "AsyncClient", _FakeClient)
+def test_place_details_not_found(client, google):
+    google.responses["details"] = {"result": None}
 
     r = client.get("/location/place", params={"place_id": "missing"})
     assert r.status_code == 404
     assert r.json()["detail"] == "Place not found"
+
+    # Misses are not cached.
+    client.get("/location/place", params={"place_id": "missing"})
+    assert len(google.requests) == 2
+
+
+def test_place_and_autocomplete_results_are_cached(client, google):
+    google.responses["details"] = {
+        "result": {
+            "formatted_address": "Ljubljana, Slovenia",
+            "geometry": {"location": {"lat": 46.0569, "lng": 14.5058}},
+        }
+    }
+    google.responses["autocomplete"] = {
+        "predictions": [{"description": "Ljubljana, Slovenia", "place_id": "abc"}]
+    }
+
+    for _ in range(3):
+        assert client.get("/location/place", params={"place_id": "abc"}).status_code == 200
+    # Same query after normalisation of case and whitespace.
+    for text in ("Ljubljana", "ljubljana ", "  LJUBLJANA"):
+        assert client.get("/location/autocomplete", params={"input": text}).json()[0]["place_id"] == "abc"
+
+    assert [r.url.path.split("/")[-2] for r in google.requests] == ["details", "autocomplete"]
+
+
+def test_startup_creates_one_pooled_http2_client(client):
+    shared = location._client
+    assert shared is not None
+    assert location.start_places_client() is shared
+    pool = shared._transport._pool
+    assert pool._http2
+    assert pool._max_connections == 20
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "places.sqlite")
+    before = TieredCache("place", TTLCache("place", 10, 60), shared=SQLiteSharedCache(path))
+    before.set("place:abc", {"formatted_address": "Ljubljana"})
+    before.shared.set("place:old", {"formatted_address": "gone"}, ttl_s=-1)
+    before.shared.close()
+
+    after = TieredCache("place", TTLCache("place", 10, 60), shared=SQLiteSharedCache(path))
+    assert after.get("place:abc") == {"formatted_address": "Ljubljana"}
+    assert after.get("place:old") is None
+
+
+def test_shared_place_tier_is_used_off_the_event_loop(client, google, monkeypatch):
+    import threading
+    from app.cache import InMemorySharedCache, place_cache
+
+    class _Recording(InMemorySharedCache):
+        def __init__(self):
+            super().__init__()
+            self.threads = set()
+
+        def get(self, key):
+            self.threads.add(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value, ttl_s):
+            self.threads.add(threading.get_ident())
+            super().set(key, value, ttl_s)
+
+    shared = _Recording()
+    monkeypatch.setattr(place_cache, "shared", shared)
+    google.responses["details"] = {
+        "result": {
+            "formatted_address": "Ljubljana, Slovenia",
+            "geometry": {"location": {"lat": 46.0569, "lng": 14.5058}},
+        }
+    }
+
+    assert client.get("/location/place", params={"place_id": "abc"}).status_code == 200
+    place_cache.local.clear()
+    assert client.get("/location/place", params={"place_id": "abc"}).status_code == 200
+
+    assert len(google.requests) == 1  # the second lookup was a shared-tier hit
+    assert shared.threads
+    assert client.portal.call(threading.get_ident) not in shared.threads
+
+
+def _predictions(*descriptions):
+    return {"predictions": [
+        {"description": d, "place_id": f"id-{i}"} for i, d in enumerate(descriptions)
+    ]}
+
+
+def _gather(client, *calls):
+    async def _all():
+        return await asyncio.gather(*(location.autocomplete(*c) for c in calls))
+    return client.portal.call(_all)
+
+
+def test_identical_concurrent_queries_share_one_upstream_call(client, google):
+    google.responses["autocomplete"] = _predictions(*(f"Celje {i}" for i in range(5)))
+    google.delay_s = 0.05
+
+    results = _gather(client, *[("Celje",)] * 10)
+
+    assert len(google.requests) == 1
+    assert all(r == results[0] for r in results)
+
+
+def test_longer_input_is_narrowed_from_complete_prefix_result(client, google):
+    google.responses["autocomplete"] = _predictions(
+        "Ljubljanska cesta 1, Maribor, Slovenia",
+        "Ljubljanska cesta 12, Celje, Slovenia",
+        "Ljubljanska ulica 3, Koper, Slovenia",
+    )
+    client.get("/location/autocomplete", params={"input": "Ljubljanska"})
+
+    r = client.get("/location/autocomplete", params={"input": "Ljubljanska cesta 1"})
+
+    assert [p["description"] for p in r.json()] == [
+        "Ljubljanska cesta 1, Maribor, Slovenia",
+        "Ljubljanska cesta 12, Celje, Slovenia",
+    ]
+    assert len(google.requests) == 1
+
+
+def test_truncated_prefix_result_is_not_narrowed(client, google):
+    google.responses["autocomplete"] = _predictions(*(f"Ljubljanska cesta {i}" for i in range(5)))
+    client.get("/location/autocomplete", params={"input": "Ljubljanska"})
+    client.get("/location/autocomplete", params={"input": "Ljubljanska cesta 1"})
+    assert len(google.requests) == 2
+
+
+def test_next_keystroke_waits_for_in_flight_prefix(client, google):
+    google.responses["autocomplete"] = _predictions("Koper, Slovenia", "Kopriva, Slovenia")
+    google.delay_s = 0.05
+
+    kop, kope = _gather(client, ("Kop",), ("Kope",))
+
+    assert len(google.requests) == 1
+    assert [p["description"] for p in kope] == ["Koper, Slovenia"]
+    assert len(kop) == 2
+
+
+def test_session_token_is_forwarded(client, google):
+    google.responses["autocomplete"] = _predictions("Ptuj, Slovenia")
+    google.responses["details"] = {
+        "result": {
+            "formatted_address": "Ptuj, Slovenia",
+            "geometry": {"location": {"lat": 46.42, "lng": 15.87}},
+        }
+    }
+
+    client.get("/location/autocomplete", params={"input": "Ptuj", "session_token": "s-1"})
+    client.get("/location/place", params={"place_id": "id-0", "session_token": "s-1"})
+
+    assert [r.url.params["sessiontoken"] for r in google.requests] == ["s-1", "s-1"]
+
+
+def test_prefix_trie_longest_prefix_eviction_and_expiry():
+    trie = PrefixTrie(max_entries=2, ttl_s=60)
+    trie.insert("lj", ["a"])
+    trie.insert("ljub", ["b"])
+    assert trie.longest_prefix("ljubljana") == ("ljub", ["b"])
+    assert trie.longest_prefix("ljx") == ("lj", ["a"])
+    assert trie.longest_prefix("mar") is None
+
+    trie.insert("mar", ["c"])  # evicts "lj"
+    assert trie.longest_prefix("ljx") is None
+    assert len(trie) == 2
+
+    trie.ttl_s = -1
+    trie.insert("ce", ["d"])
+    assert trie.longest_prefix("celje") is None
+    assert len(trie) == 1
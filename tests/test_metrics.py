@@ -0,0 +1,61 @@
+def test_metrics_expose_pool_statistics(client):
+    assert client.get("/health").status_code == 200
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    body = r.text
+    assert 'db_pool_size{engine="async"}' in body
+    assert 'db_pool_checked_out{engine="async"}' in body
+    assert 'db_pool_overflow{engine="sync"}' in body
+    assert 'db_pool_checkout_seconds_count{engine="async"}' in body
+
+
+def test_metrics_expose_statement_latency_and_round_trips_per_endpoint(client):
+    client.post("/", json={"id": "m-1", "username": "m1", "email": "m1@example.com"})
+    client.get("/m-1")
+
+    body = client.get("/metrics").text
+    assert 'db_statement_seconds_count{endpoint="POST /",statement="INSERT users"}' in body
+    assert 'db_statement_seconds_count{endpoint="GET /{user_id}",statement="SELECT users"}' in body
+    assert 'db_round_trips_per_request_count{endpoint="POST /"}' in body
+
+
+def test_statement_labels_are_bounded_and_tenant_neutral():
+    from app.sql_metrics import normalize, statement_label
+
+    label = statement_label(
+        "SELECT coalesce((SELECT array_agg(t.cart_items.order_id) FROM t.cart_items), $1) AS cart, "
+        "t.users.id FROM tenant_a.users WHERE tenant_a.users.id = $2"
+    )
+    assert label == "SELECT users"
+    assert statement_label("UPDATE \"tenant_b\".users SET name = $1") == "UPDATE users"
+    assert normalize("SELECT *\n  FROM users WHERE name = 'x' LIMIT 10") == "SELECT * FROM users WHERE name = ? LIMIT ?"
+
+
+def test_repeated_statement_is_reported_as_n_plus_one(caplog):
+    from app.sql_metrics import N_PLUS_ONE, RequestStats, record_request
+
+    stats = RequestStats("public")
+    stats.statements = [("SELECT users WHERE id = $1", 0.001)] * 12 + [("SELECT cart_items", 0.001)]
+    before = N_PLUS_ONE.labels("GET /loop")._value.get()
+
+    with caplog.at_level("WARNING", logger="app.sql_metrics"):
+        record_request(stats, "GET /loop")
+
+    assert N_PLUS_ONE.labels("GET /loop")._value.get() == before + 1
+    assert "ran 12 times" in caplog.text
+
+
+def test_slow_statements_are_logged_with_their_plan(client, monkeypatch, caplog):
+    import re
+    from app.config import settings
+
+    client.get("/list_users")  # tenant list loaded
+    monkeypatch.setattr(settings, "sql_slow_ms", 0.001)
+    monkeypatch.setattr(settings, "sql_slow_explain", True)
+
+    with caplog.at_level("WARNING", logger="app.sql_metrics"):
+        assert client.get("/list_users").status_code == 200
+
+    assert "[SQL:SLOW]" in caplog.text
+    assert re.search(r"Scan .*on users", caplog.text)
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import text
+
+from app import geo
+from app.config import settings
+
+LJUBLJANA = (46.0569, 14.5058)
+# id, lat, lon, partner
+POINTS = [
+    ("near-1", 46.0570, 14.5060, "p1"),     # ~20 m
+    ("near-2", 46.0600, 14.5100, None),     # ~460 m
+    ("near-3", 46.0700, 14.5300, "p1"),     # ~2.3 km
+    ("domzale", 46.1377, 14.5942, "p1"),    # ~11.5 km
+    ("maribor", 46.5547, 15.6459, None),    # ~103 km
+]
+
+
+@pytest.fixture()
+def located_users(app_and_engine):
+    _, engine = app_and_engine
+    with engine.begin() as conn:
+        for user_id, lat, lon, partner in POINTS:
+            conn.execute(
+                text(
+                    "INSERT INTO public.users (id, username, email, latitude, longitude, partner_id, created_at, updated_at) "
+                    "VALUES (:id, :id, :email, :lat, :lon, :partner, now(), now())"
+                ),
+                {"id": user_id, "email": f"{user_id}@example.com", "lat": lat, "lon": lon, "partner": partner},
+            )
+        conn.execute(text(
+            "INSERT INTO public.users (id, username, email, created_at, updated_at) "
+            "VALUES ('nowhere', 'nowhere', 'nowhere@example.com', now(), now())"
+        ))
+    return engine
+
+
+@pytest.fixture(params=["sql", "numpy"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(settings, "nearby_backend", request.param)
+    return request.param
+
+
+def _get(client, **params):
+    r = client.get("/nearby", params={"lat": LJUBLJANA[0], "lon": LJUBLJANA[1], **params})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_radius_query_orders_by_distance(client, located_users, backend):
+    body = _get(client, radius_m=3000)
+    assert [u["id"] for u in body] == ["near-1", "near-2", "near-3"]
+    assert body[0]["distance_m"] < 30
+    assert 2000 < body[2]["distance_m"] < 2600
+
+    assert [u["id"] for u in _get(client, radius_m=3000, partner_id="p1")] == ["near-1", "near-3"]
+    assert [u["id"] for u in _get(client, radius_m=3000, limit=1)] == ["near-1"]
+
+
+def test_k_nearest_expands_search_radius(client, located_users, backend):
+    assert [u["id"] for u in _get(client, k=4)] == ["near-1", "near-2", "near-3", "domzale"]
+    # Maribor is ~103 km away, beyond NEARBY_MAX_RADIUS_M.
+    assert [u["id"] for u in _get(client, k=10)] == ["near-1", "near-2", "near-3", "domzale"]
+    assert [u["id"] for u in _get(client, k=10, radius_m=5000)] == ["near-1", "near-2", "near-3"]
+
+
+def test_nearby_requires_radius_or_k(client):
+    r = client.get("/nearby", params={"lat": 46, "lon": 14})
+    assert r.status_code == 422
+
+
+def test_geo_cell_column_matches_python(located_users):
+    with located_users.connect() as conn:
+        rows = conn.execute(text("SELECT latitude, longitude, geo_cell FROM public.users")).all()
+    for lat, lon, cell in rows:
+        assert cell == (None if lat is None else geo.geo_cell(lat, lon))
+
+
+def test_haversine_and_nearest():
+    lats = [46.5547, 46.0570, 46.2397]
+    lons = [15.6459, 14.5060, 15.2677]
+    distances = geo.haversine_m(*LJUBLJANA, lats, lons)
+    assert 100_000 < distances[0] < 105_000  # Ljubljana - Maribor
+
+    order, dist = geo.nearest(*LJUBLJANA, lats, lons, radius_m=70_000, k=5)
+    assert list(order) == [1, 2]
+    assert list(dist) == sorted(dist)
+
+    box = geo.bounding_box(*LJUBLJANA, 10_000)
+    cells = geo.cells_for_box(*box)
+    assert geo.geo_cell(*LJUBLJANA) in cells
@@ -1,5 +1,10 @@
+import asyncio
 import datetime
 
+import pytest
+
+from app.resilience import BulkheadFullError, CircuitOpenError
+
 class _FakeTimestamp:
     def __init__(self, dt: datetime.datetime):
         self._dt = dt
@@ -31,9 +36,16 @@ def _insert_user(engine, schema: str, user_id: str, username: str, email: str, c
     with engine.begin() as conn:
         conn.exec_driver_sql(f"SET search_path TO {schema}")
         conn.exec_driver_sql(
-            "INSERT INTO users (id, username, email, cart, created_at, updated_at) VALUES (%s,%s,%s,%s, now(), now())",
-            (user_id, username, email, cart),
+            "INSERT INTO users (id, username, email, created_at, updated_at) VALUES (%s,%s,%s, now(), now())",
+            (user_id, username, email),
         )
+        for i, order_id in enumerate(cart):
+            conn.exec_driver_sql(
+                "INSERT INTO cart_items (user_id, order_id, quantity, added_at) "
+                "VALUES (%s,%s,1, now() + %s * interval '1 microsecond') "
+                "ON CONFLICT (user_id, order_id) DO UPDATE SET quantity = cart_items.quantity + 1",
+                (user_id, order_id, i),
+            )
 
 
 def test_get_user_orders_success(client, app_and_engine, monkeypatch):
@@ -57,7 +69,7 @@ def test_get_user_orders_success(client, app_and_engine, monkeypatch):
         )
     ])
 
-    def _fake_get_orders_by_user(user_id: str, timeout_s: float = 2.0, tenant_id=None):
+    async def _fake_get_orders_by_user(user_id: str, timeout_s: float = 2.0, tenant_id=None):
         return fake_resp
 
     monkeypatch.setattr(main_mod, "get_orders_by_user", _fake_get_orders_by_user)
@@ -79,7 +91,7 @@ def test_get_user_orders_grpc_failure_returns_502(client, app_and_engine, monkey
 
     import app.main as main_mod
 
-    def _boom(*args, **kwargs):
+    async def _boom(*args, **kwargs):
         raise RuntimeError("grpc down")
 
     monkeypatch.setattr(main_mod, "get_orders_by_user", _boom)
@@ -87,3 +99,81 @@ def test_get_user_orders_grpc_failure_returns_502(client, app_and_engine, monkey
     r = client.get(f"/{user_id}/orders")
     assert r.status_code == 502
     assert "Order service unavailable" in r.json()["detail"]
+
+
+@pytest.mark.parametrize(
+    "error, retry_after",
+    [(CircuitOpenError("orders circuit is open", retry_after_s=4.2), "5"),
+     (BulkheadFullError("orders bulkhead is full"), "1")],
+    ids=["circuit-open", "bulkhead-full"],
+)
+def test_get_user_orders_shed_load_returns_503(client, app_and_engine, monkeypatch, error, retry_after):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000006"
+    _insert_user(engine, "public", user_id, "s", "s@example.com", [])
+
+    import app.main as main_mod
+
+    async def _rejected(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(main_mod, "get_orders_by_user", _rejected)
+
+    r = client.get(f"/{user_id}/orders")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == retry_after
+
+
+def test_orders_client_reuses_one_connection(orders_server):
+    from app.grpc import orders_pb2
+    from app.grpc.orders_client import OrdersClient
+
+    orders_server.orders = [orders_pb2.OrderSummary(order_id=1, user_id="u1")]
+
+    async def _calls():
+        client = OrdersClient(orders_server.target)
+        try:
+            return (
+                await client.get_orders_by_user("u1", tenant_id="tenant_a"),
+                await client.get_orders_by_user("u1"),
+            )
+        finally:
+            await client.close()
+
+    r1, r2 = asyncio.run(_calls())
+
+    assert [o.order_id for o in r1.orders] == [1]
+    assert len(r2.orders) == 1
+    assert orders_server.calls[0]["metadata"]["x-tenant-id"] == "tenant_a"
+    assert "x-tenant-id" not in orders_server.calls[1]["metadata"]
+    # Same client-side address and port: both calls went over one connection.
+    assert orders_server.calls[0]["peer"] == orders_server.calls[1]["peer"]
+
+
+def _use_orders_server(client, orders_server):
+    import app.grpc.orders_client as orders_client
+
+    async def _swap():
+        await orders_client.close_orders_client()
+        orders_client._client = orders_client.OrdersClient(orders_server.target)
+
+    # grpc.aio channels are bound to the loop that serves the app.
+    client.portal.call(_swap)
+
+
+def test_get_user_orders_forwards_tenant_and_request_deadline(client, app_and_engine, orders_server):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000012"
+    _insert_user(engine, "tenant_a", user_id, "t", "t@example.com", [])
+    _use_orders_server(client, orders_server)
+
+    r = client.get(
+        f"/{user_id}/orders",
+        headers={"X-Tenant-Id": "tenant_a", "X-Request-Timeout": "0.5"},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"user_id": user_id, "orders": []}
+
+    call = orders_server.calls[0]
+    assert call["metadata"]["x-tenant-id"] == "tenant_a"
+    assert 0 < call["time_remaining"] <= 0.5
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.resilience import Bulkhead, BulkheadFullError, CircuitBreaker, CircuitOpenError
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def _fail():
+    raise RuntimeError("down")
+
+
+async def _ok():
+    return "ok"
+
+
+def test_circuit_opens_after_threshold_and_recovers_through_half_open():
+    clock = _Clock()
+    breaker = CircuitBreaker("test_cb", failure_threshold=2, recovery_timeout_s=10, clock=clock)
+
+    async def _run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await breaker.call(_fail)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        clock.now = 3
+        with pytest.raises(CircuitOpenError) as rejected:
+            await breaker.call(_ok)
+        assert rejected.value.retry_after_s == 7
+
+        clock.now = 10
+        assert await breaker.call(_ok) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(_run())
+
+
+def test_half_open_failure_reopens_circuit():
+    clock = _Clock()
+    breaker = CircuitBreaker("test_cb", failure_threshold=1, recovery_timeout_s=5, clock=clock)
+
+    async def _run():
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+        clock.now = 5
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(_ok)
+
+    asyncio.run(_run())
+
+
+def test_non_outage_errors_do_not_trip_the_circuit():
+    breaker = CircuitBreaker("test_cb", failure_threshold=1, is_failure=lambda e: False)
+
+    async def _run():
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(_run())
+
+
+def test_bulkhead_rejects_when_full():
+    async def _run():
+        bulkhead = Bulkhead("test_bulkhead", max_concurrent=1)
+        release = asyncio.Event()
+
+        async def _hold():
+            async with bulkhead.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(_hold())
+        await asyncio.sleep(0)
+        with pytest.raises(BulkheadFullError):
+            async with bulkhead.slot():
+                pass
+        release.set()
+        await holder
+
+        async with bulkhead.slot():
+            pass
+
+    asyncio.run(_run())
+
+
+def test_orders_client_fails_fast_once_circuit_is_open():
+    import socket
+    import time
+    from app.grpc.orders_client import OrdersClient, _is_outage
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        dead_target = f"127.0.0.1:{s.getsockname()[1]}"
+
+    breaker = CircuitBreaker("orders_test", failure_threshold=2, recovery_timeout_s=60, is_failure=_is_outage)
+
+    async def _run():
+        client = OrdersClient(dead_target, breaker=breaker)
+        try:
+            for _ in range(2):
+                with pytest.raises(Exception):
+                    await client.get_orders_by_user("u1", timeout_s=0.5)
+            start = time.perf_counter()
+            with pytest.raises(CircuitOpenError):
+                await client.get_orders_by_user("u1", timeout_s=0.5)
+            return time.perf_counter() - start
+        finally:
+            await client.close()
+
+    assert asyncio.run(_run()) < 0.01
+
+
+def test_resilience_metrics_are_exported(client):
+    body = client.get("/metrics").text
+    assert 'circuit_breaker_state{name="orders"}' in body
+    assert 'dependency_calls_rejected_total{name="orders",reason="bulkhead_full"}' in body
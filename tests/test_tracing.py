@@ -0,0 +1,98 @@
+import json
+
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
+
+from app import tracing
+from app.events import Delivery, EventConsumer, InMemoryBroker
+from app.rabbitmq_consumer import RETRY_HEADER
+from tests.test_events import _run
+from tests.test_orders import _insert_user, _use_orders_server
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+def _by_name(spans):
+    return {s.name: s for s in spans.get_finished_spans()}
+
+
+def test_orders_request_is_one_trace_across_sql_and_grpc(client, app_and_engine, orders_server, spans):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000031"
+    _insert_user(engine, "tenant_a", user_id, "t", "t@example.com", [])
+    _use_orders_server(client, orders_server)
+
+    r = client.get(
+        f"/{user_id}/orders",
+        headers={"X-Tenant-Id": "tenant_a", "traceparent": TRACEPARENT},
+    )
+    assert r.status_code == 200
+
+    finished = _by_name(spans)
+    server = finished["GET /{user_id}/orders"]
+    assert server.kind == SpanKind.SERVER
+    assert server.attributes["http.response.status_code"] == 200
+    assert finished["db.session"].attributes["tenant.id"] == "tenant_a"
+    assert finished["SELECT users"].attributes["db.system.name"] == "postgresql"
+    rpc = finished["orders.v1.OrdersService/GetOrdersByUser"]
+    assert rpc.kind == SpanKind.CLIENT
+    # Everything continues the caller's trace...
+    assert {format(s.context.trace_id, "032x") for s in finished.values()} == {TRACE_ID}
+    # ...and orders-ms is handed the gRPC span as its parent.
+    sent = orders_server.calls[0]["metadata"]["traceparent"]
+    assert sent == f"00-{TRACE_ID}-{format(rpc.context.span_id, '016x')}-01"
+
+
+def test_consumer_continues_trace_from_headers_and_retries_carry_it(spans):
+    async def _flaky(event):
+        raise ConnectionError("db down")
+
+    broker = InMemoryBroker()
+    consumer = EventConsumer(broker, handlers={"user_created": _flaky})
+    body = json.dumps({"user_id": "u1", "username": "u1", "email": "u1@example.com"}).encode()
+    _run(consumer.process(Delivery("user_created", body, {"traceparent": TRACEPARENT})))
+
+    processed = _by_name(spans)["user_created process"]
+    assert processed.kind == SpanKind.CONSUMER
+    assert format(processed.context.trace_id, "032x") == TRACE_ID
+    (retried,) = [d for q, ds in broker.queues.items() if ".retry." in q for d in ds]
+    assert retried.headers[RETRY_HEADER] == 1
+    assert retried.headers["traceparent"].split("-")[1] == TRACE_ID
+
+
+def test_sampling_follows_parent_and_skips_unsampled_children(spans):
+    from opentelemetry.sdk.trace.sampling import Decision
+
+    sampler = tracing.make_sampler(0.0)
+    assert sampler.should_sample(None, 1, "root").decision == Decision.DROP
+    sampled = tracing.extract({"traceparent": TRACEPARENT})
+    assert sampler.should_sample(sampled, 1, "child").decision == Decision.RECORD_AND_SAMPLE
+
+    unsampled = tracing.extract({"traceparent": TRACEPARENT[:-2] + "00"})
+    with tracing.span("request", parent=unsampled) as current:
+        assert current is None
+        assert tracing.inject({})["traceparent"].endswith("-00")
+    with tracing.child_span("orphan") as current:
+        assert current is None
+    assert not spans.get_finished_spans()
+
+
+def test_google_calls_are_traced_without_propagating(client, google, spans):
+    google.responses["autocomplete"] = {"predictions": []}
+
+    r = client.get("/location/autocomplete", params={"input": "Lj"}, headers={"traceparent": TRACEPARENT})
+    assert r.status_code == 200
+
+    (call,) = [s for s in spans.get_finished_spans() if s.kind == SpanKind.CLIENT and s.name.startswith("GET ")]
+    assert "key" not in call.attributes["url.full"]
+    assert call.attributes["http.response.status_code"] == 200
+    assert "traceparent" not in google.requests[0].headers
+
+
+def test_disabled_tracing_records_nothing(client, _span_exporter):
+    _span_exporter.clear()
+    r = client.get("/health", headers={"traceparent": TRACEPARENT})
+    assert r.status_code == 200
+    assert not _span_exporter.get_finished_spans()
+    assert not trace.get_current_span().is_recording()
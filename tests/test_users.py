@@ -1,15 +1,22 @@
+import pytest
+
+
 def _insert_user(engine, schema: str, user_id: str, username: str, email: str, cart=None):
     if cart is None:
         cart = []
     with engine.begin() as conn:
         conn.exec_driver_sql(f"SET search_path TO {schema}")
         conn.exec_driver_sql(
-            """
-            INSERT INTO users (id, username, email, cart, created_at, updated_at)
-            VALUES (%s,%s,%s,%s, now(), now())
-            """,
-            (user_id, username, email, cart),
+            "INSERT INTO users (id, username, email, created_at, updated_at) VALUES (%s,%s,%s, now(), now())",
+            (user_id, username, email),
         )
+        for i, order_id in enumerate(cart):
+            conn.exec_driver_sql(
+                "INSERT INTO cart_items (user_id, order_id, quantity, added_at) "
+                "VALUES (%s,%s,1, now() + %s * interval '1 microsecond') "
+                "ON CONFLICT (user_id, order_id) DO UPDATE SET quantity = cart_items.quantity + 1",
+                (user_id, order_id, i),
+            )
 
 
 def test_get_user_404(client):
@@ -87,3 +94,438 @@ def test_clear_cart_endpoint(client, app_and_engine):
     r = client.delete(f"/{user_id}/cart")
     assert r.status_code == 200
     assert r.json()["cart"] == []
+
+
+def test_create_user_then_post_again_returns_existing(client):
+    user_id = "00000000-0000-0000-0000-000000000007"
+    payload = {"id": user_id, "username": "new", "email": "new@example.com"}
+
+    r1 = client.post("/", json=payload)
+    assert r1.status_code == 200
+    assert r1.json()["cart"] == []
+
+    r2 = client.post("/", json={**payload, "username": "other"})
+    assert r2.status_code == 200
+    assert r2.json()["username"] == "new"
+
+
+@pytest.mark.parametrize("db_async", [True, False], ids=["asyncpg", "threaded-psycopg2"])
+def test_user_endpoints_on_either_engine(client, db_async):
+    from sqlalchemy import event
+    import app.main as main
+    from app.database import async_engine, engine
+
+    # DB_ASYNC picks the dependency at import; override it to cover both here.
+    dependency = main._get_async_db_with_schema if db_async else main._get_sync_db_with_schema
+    main.app.dependency_overrides[main.get_db_with_schema] = dependency
+    used, unused = (async_engine.sync_engine, engine) if db_async else (engine, async_engine.sync_engine)
+    counts = {"used": 0, "unused": 0}
+
+    def _counter(name):
+        def _count(*args):
+            counts[name] += 1
+        return _count
+
+    listeners = [(used, _counter("used")), (unused, _counter("unused"))]
+    for target, fn in listeners:
+        event.listen(target, "before_cursor_execute", fn)
+    try:
+        user_id = "00000000-0000-0000-0000-000000000008"
+        headers = {"X-Tenant-Id": "tenant_a"}
+        r = client.post("/", json={"id": user_id, "username": "both", "email": "both@example.com"}, headers=headers)
+        assert r.status_code == 200
+        assert client.post(f"/{user_id}/cart/5", headers=headers).json()["cart"] == [5]
+        assert client.patch(f"/{user_id}", json={"name": "Ana"}, headers=headers).json()["name"] == "Ana"
+        body = client.get(f"/{user_id}", headers=headers).json()
+        assert (body["name"], body["cart"]) == ("Ana", [5])
+        assert client.get("/missing", headers=headers).status_code == 404
+    finally:
+        main.app.dependency_overrides.pop(main.get_db_with_schema, None)
+        for target, fn in listeners:
+            event.remove(target, "before_cursor_execute", fn)
+
+    assert counts["used"] > 0
+    assert counts["unused"] == 0
+
+
+def test_unknown_tenant_returns_400(client):
+    r = client.get("/anything", headers={"X-Tenant-Id": "public; DROP TABLE users"})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Unknown tenant"
+
+
+def test_get_user_is_a_single_round_trip(client, app_and_engine):
+    from sqlalchemy import event
+    from app.config import settings
+    from app.cache import user_cache
+    from app.database import async_engine
+
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000011"
+    _insert_user(engine, "tenant_a", user_id, "rt", "rt@example.com", [])
+    client.get(f"/{user_id}", headers={"X-Tenant-Id": "tenant_a"})
+    user_cache.clear()
+
+    target = async_engine.sync_engine if settings.db_async else engine
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(target, "before_cursor_execute", _record)
+    try:
+        r = client.get(f"/{user_id}", headers={"X-Tenant-Id": "tenant_a"})
+    finally:
+        event.remove(target, "before_cursor_execute", _record)
+
+    assert r.status_code == 200
+    assert len(statements) == 1
+    assert "tenant_a.users" in statements[0]
+
+
+def test_list_users_keyset_pagination_and_filters(client, app_and_engine):
+    _, engine = app_and_engine
+    ids = [f"00000000-0000-0000-0000-0000000001{i:02d}" for i in range(5)]
+    for i, user_id in enumerate(ids):
+        _insert_user(engine, "public", user_id, f"page{i}", f"page{i}@example.com", [])
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE public.users SET partner_id = 'p1' WHERE username IN ('page1', 'page3')")
+
+    r1 = client.get("/list_users", params={"limit": 2})
+    assert [u["id"] for u in r1.json()] == ids[:2]
+    cursor = r1.headers["X-Next-Cursor"]
+
+    r2 = client.get("/list_users", params={"limit": 2, "cursor": cursor})
+    assert [u["id"] for u in r2.json()] == ids[2:4]
+
+    r3 = client.get("/list_users", params={"limit": 2, "cursor": r2.headers["X-Next-Cursor"]})
+    assert [u["id"] for u in r3.json()] == ids[4:]
+    assert "X-Next-Cursor" not in r3.headers
+
+    r4 = client.get("/list_users", params={"partner_id": "p1"})
+    assert [u["username"] for u in r4.json()] == ["page1", "page3"]
+
+
+def test_list_users_streams_ndjson_and_json_array(client, app_and_engine):
+    import json
+
+    _, engine = app_and_engine
+    for i in range(3):
+        _insert_user(engine, "tenant_b", f"stream-{i}", f"s{i}", f"s{i}@example.com", [i])
+
+    headers = {"X-Tenant-Id": "tenant_b"}
+    r = client.get("/list_users", params={"stream": "ndjson"}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [u["id"] for u in rows] == ["stream-0", "stream-1", "stream-2"]
+    assert rows[2]["cart"] == [2]
+
+    r = client.get("/list_users", params={"stream": "json", "cursor": "stream-0"}, headers=headers)
+    assert [u["id"] for u in r.json()] == ["stream-1", "stream-2"]
+
+    r = client.get("/list_users", params={"stream": "json"}, headers={"X-Tenant-Id": "tenant_a"})
+    assert r.json() == []
+
+
+def test_remove_from_cart_drops_only_first_occurrence(client, app_and_engine):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000008"
+    _insert_user(engine, "public", user_id, "rm", "rm@example.com", [1, 2, 1, 3])
+    # Duplicates are grouped per order id in order of first occurrence.
+    assert client.get(f"/{user_id}").json()["cart"] == [1, 1, 2, 3]
+
+    assert client.delete(f"/{user_id}/cart/1").json()["cart"] == [1, 2, 3]
+    assert client.delete(f"/{user_id}/cart/3").json()["cart"] == [1, 2]
+    assert client.delete(f"/{user_id}/cart/9").json()["cart"] == [1, 2]
+    assert client.delete(f"/missing/cart/1").status_code == 404
+
+
+def test_concurrent_cart_adds_do_not_lose_updates(client, app_and_engine):
+    from concurrent.futures import ThreadPoolExecutor
+
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000009"
+    _insert_user(engine, "public", user_id, "race", "race@example.com", [])
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        statuses = list(pool.map(lambda i: client.post(f"/{user_id}/cart/{i}").status_code, range(30)))
+
+    assert statuses == [200] * 30
+    cart = client.get(f"/{user_id}").json()["cart"]
+    assert sorted(cart) == list(range(30))
+
+
+def test_bulk_cart_operations_and_cart_only_get(client, app_and_engine):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000013"
+    _insert_user(engine, "public", user_id, "bulk", "bulk@example.com", [5])
+
+    r = client.post(f"/{user_id}/cart", json={"order_ids": [7, 5, 7, 8]})
+    assert r.status_code == 200
+    assert r.json()["cart"] == [5, 5, 7, 7, 8]
+
+    r = client.post(f"/{user_id}/cart/remove", json={"order_ids": [7, 5, 5, 9]})
+    assert r.json()["cart"] == [7, 8]
+
+    cart = client.get(f"/{user_id}/cart").json()
+    assert cart["user_id"] == user_id
+    assert cart["cart"] == [7, 8]
+    assert [(i["order_id"], i["quantity"]) for i in cart["items"]] == [(7, 1), (8, 1)]
+    assert "email" not in cart
+
+    r = client.put(f"/{user_id}/cart", json={"order_ids": [1, 1]})
+    assert r.json()["cart"] == [1, 1]
+
+    assert client.post("/missing/cart", json={"order_ids": [1]}).status_code == 404
+    assert client.get("/missing/cart").status_code == 404
+
+
+def test_patch_cart_replaces_cart_items(client, app_and_engine):
+    _, engine = app_and_engine
+    user_id = "00000000-0000-0000-0000-000000000014"
+    _insert_user(engine, "public", user_id, "pc", "pc@example.com", [1, 2])
+
+    r = client.patch(f"/{user_id}", json={"cart": [3, 3]})
+    assert r.status_code == 200
+    assert r.json()["cart"] == [3, 3]
+
+
+def test_migration_moves_legacy_cart_array(app_and_engine):
+    from sqlalchemy import text
+    from app.migrations import migrate
+
+    _, engine = app_and_engine
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA IF EXISTS legacy_cart CASCADE"))
+        conn.execute(text("CREATE SCHEMA legacy_cart"))
+        conn.execute(text(
+            "CREATE TABLE legacy_cart.users (id varchar(36) PRIMARY KEY, username varchar(150), "
+            "email varchar(255), latitude double precision, longitude double precision, cart integer[] NOT NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO legacy_cart.users VALUES "
+            "('u1', 'u1', 'u1@example.com', NULL, NULL, '{3,1,3,2}'), ('u2', 'u2', 'u2@example.com', NULL, NULL, '{}')"
+        ))
+
+    def _cart(conn):
+        return [tuple(r) for r in conn.execute(text(
+            "SELECT user_id, order_id, quantity FROM legacy_cart.cart_items ORDER BY user_id, added_at"
+        ))]
+
+    def _columns(conn):
+        return conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = 'legacy_cart' AND table_name = 'users'"
+        )).scalars().all()
+
+    try:
+        # Expand: the array is copied and stays usable by the previous release.
+        assert migrate(["legacy_cart"]) == {"legacy_cart": [1, 2, 3]}
+        assert migrate(["legacy_cart"]) == {"legacy_cart": []}  # idempotent
+        with engine.begin() as conn:
+            assert _cart(conn) == [("u1", 3, 2), ("u1", 1, 1), ("u1", 2, 1)]
+            assert "cart" in _columns(conn)
+            # New code inserts users without the array...
+            conn.execute(text("INSERT INTO legacy_cart.users (id, username, email) VALUES ('u3', 'u3', 'u3@x')"))
+            # ...while what an old pod appends reaches cart_items.
+            conn.execute(text("UPDATE legacy_cart.users SET cart = cart || 7 WHERE id = 'u2'"))
+            assert _cart(conn)[-1] == ("u2", 7, 1)
+
+        # Contract, once no pod reads the array.
+        assert migrate(["legacy_cart"], contract=True) == {"legacy_cart": [4]}
+        with engine.connect() as conn:
+            assert "cart" not in _columns(conn)
+            assert len(_cart(conn)) == 4
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA legacy_cart CASCADE"))
+
+
+def test_cart_stays_in_step_when_both_releases_write(app_and_engine):
+    from sqlalchemy import text
+    from app.migrations import migrate
+
+    _, engine = app_and_engine
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA IF EXISTS mixed_cart CASCADE"))
+        conn.execute(text("CREATE SCHEMA mixed_cart"))
+        conn.execute(text(
+            "CREATE TABLE mixed_cart.users (id varchar(36) PRIMARY KEY, username varchar(150), "
+            "email varchar(255), latitude double precision, longitude double precision, cart integer[] NOT NULL)"
+        ))
+        conn.execute(text("INSERT INTO mixed_cart.users VALUES ('u1', 'u1', 'u1@x', NULL, NULL, '{1,2}')"))
+
+    def _state(conn):
+        items = [tuple(r) for r in conn.execute(text(
+            "SELECT order_id, quantity FROM mixed_cart.cart_items ORDER BY added_at, order_id"
+        ))]
+        return items, conn.execute(text("SELECT cart FROM mixed_cart.users")).scalar()
+
+    try:
+        migrate(["mixed_cart"])
+        with engine.begin() as conn:
+            # A new pod adds to cart_items; old pods read the array.
+            conn.execute(text(
+                "INSERT INTO mixed_cart.cart_items (user_id, order_id, quantity, added_at) "
+                "VALUES ('u1', 9, 2, now() + interval '1 hour')"
+            ))
+            assert _state(conn) == ([(1, 1), (2, 1), (9, 2)], [1, 2, 9, 9])
+
+            # An old pod appends and drops an item; the new pod's rows survive.
+            conn.execute(text("UPDATE mixed_cart.users SET cart = array_remove(cart, 1) || 5 WHERE id = 'u1'"))
+            items, cart = _state(conn)
+            assert sorted(items) == [(2, 1), (5, 1), (9, 2)]
+            assert sorted(cart) == [2, 5, 9, 9]
+
+            conn.execute(text("DELETE FROM mixed_cart.cart_items WHERE order_id = 9"))
+            conn.execute(text("UPDATE mixed_cart.cart_items SET quantity = 3 WHERE order_id = 2"))
+            items, cart = _state(conn)
+            assert sorted(items) == [(2, 3), (5, 1)]
+            assert sorted(cart) == [2, 2, 2, 5]
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA mixed_cart CASCADE"))
+
+
+def test_migrations_build_the_model_schema_once(app_and_engine):
+    from sqlalchemy import inspect, text
+    from app.migrations import MIGRATIONS, migrate, pending
+    from app.models import Base
+
+    _, engine = app_and_engine
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA IF EXISTS fresh_tenant CASCADE"))
+
+    try:
+        assert migrate(["fresh_tenant"], contract=True) == {"fresh_tenant": [v for v, _, _ in MIGRATIONS]}
+        assert migrate(["fresh_tenant"], contract=True) == {"fresh_tenant": []}
+        assert pending(["fresh_tenant"]) == {"fresh_tenant": []}
+
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            columns = {c["name"] for c in inspector.get_columns(table.name, schema="fresh_tenant")}
+            indexes = {i["name"] for i in inspector.get_indexes(table.name, schema="fresh_tenant")}
+            assert columns == set(table.columns.keys()), table.name
+            assert {i.name for i in table.indexes} <= indexes, table.name
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA fresh_tenant CASCADE"))
+
+
+def test_endpoint_query_budgets(client, max_queries):
+    headers = {"X-Tenant-Id": "tenant_a"}
+    client.get("/list_users", headers=headers)  # tenant list loaded
+
+    with max_queries(4):
+        client.post("/", json={"id": "q-1", "username": "q1", "email": "q1@example.com", "cart": [1, 2]}, headers=headers)
+    with max_queries(1):
+        assert client.get("/q-1", headers=headers).status_code == 200
+    with max_queries(0):
+        client.get("/q-1", headers=headers)  # cached
+    with max_queries(1):
+        client.get("/list_users", headers=headers)
+    with max_queries(3):
+        client.patch("/q-1", json={"name": "Q"}, headers=headers)
+    with max_queries(2):
+        client.post("/q-1/cart/5", headers=headers)
+    with max_queries(3):
+        client.put("/q-1/cart", json={"order_ids": [1]}, headers=headers)
+
+
+def test_batch_lookup_keeps_order_reports_missing_and_projects(client, app_and_engine, max_queries):
+    _, engine = app_and_engine
+    for i in range(3):
+        _insert_user(engine, "tenant_a", f"batch-{i}", f"b{i}", f"b{i}@example.com", [i])
+    headers = {"X-Tenant-Id": "tenant_a"}
+    client.get("/batch-1", headers=headers)  # now cached
+
+    with max_queries(1) as statements:
+        r = client.post("/batch", json={"ids": ["batch-2", "nope", "batch-1", "batch-0", "batch-2"]}, headers=headers)
+
+    assert r.status_code == 200
+    assert [u["id"] for u in r.json()["users"]] == ["batch-2", "batch-1", "batch-0"]
+    assert r.json()["users"][0]["cart"] == [2]
+    assert r.json()["missing"] == ["nope"]
+    assert len(statements) == 1
+
+    r = client.post("/batch", json={"ids": ["batch-0"], "fields": ["email"]}, headers=headers)
+    assert r.json()["users"] == [{"id": "batch-0", "email": "b0@example.com"}]
+
+    assert client.post("/batch", json={"ids": ["x"], "fields": ["password"]}).status_code == 422
+    assert client.post("/batch", json={"ids": [str(i) for i in range(501)]}).status_code == 422
+
+
+def test_grpc_get_users_by_ids(client, app_and_engine):
+    import grpc
+    from app.grpc import users_pb2, users_pb2_grpc
+    from app.grpc.users_server import start_users_server, stop_users_server
+
+    _, engine = app_and_engine
+    _insert_user(engine, "tenant_b", "g1", "g1", "g1@example.com", [5, 5])
+    _insert_user(engine, "tenant_b", "g2", "g2", "g2@example.com")
+
+    port = client.portal.call(start_users_server, 0)
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = users_pb2_grpc.UsersServiceStub(channel)
+            resp = stub.GetUsersByIds(
+                users_pb2.GetUsersByIdsRequest(ids=["g2", "missing", "g1"]),
+                metadata=[("x-tenant-id", "tenant_b")],
+                timeout=5,
+            )
+            projected = stub.GetUsersByIds(
+                users_pb2.GetUsersByIdsRequest(ids=["g1"], fields=["cart"]),
+                metadata=[("x-tenant-id", "tenant_b")],
+                timeout=5,
+            )
+            try:
+                stub.GetUsersByIds(users_pb2.GetUsersByIdsRequest(ids=["g1"], fields=["nope"]), timeout=5)
+            except grpc.RpcError as e:
+                invalid = e.code()
+    finally:
+        client.portal.call(stop_users_server, 0)
+
+    assert [u.id for u in resp.users] == ["g2", "g1"]
+    assert list(resp.missing_ids) == ["missing"]
+    assert resp.users[1].email == "g1@example.com"
+    assert list(resp.users[1].cart) == [5, 5]
+    assert resp.users[1].created_at.seconds > 0
+    assert not resp.users[1].HasField("name")
+
+    assert list(projected.users[0].cart) == [5, 5]
+    assert projected.users[0].email == ""
+    assert invalid == grpc.StatusCode.INVALID_ARGUMENT
+
+
+def test_fast_responses_match_the_pydantic_path(client, app_and_engine, monkeypatch):
+    import json
+    from app.cache import user_cache
+    from app.config import settings
+
+    _, engine = app_and_engine
+    _insert_user(engine, "public", "fast-1", "f1", "f1@example.com", [4, 4, 2])
+    _insert_user(engine, "public", "fast-2", "f2", "f2@example.com")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE public.users SET latitude = 46.05, name = 'Zan \"Z\"' WHERE id = 'fast-1'")
+
+    def _responses():
+        user_cache.clear()
+        page = client.get("/list_users", params={"limit": 1})
+        stream = client.get("/list_users", params={"stream": "ndjson"})
+        return {
+            "user": client.get("/fast-1").json(),
+            "page": page.json(),
+            "cursor": page.headers["X-Next-Cursor"],
+            "stream": [json.loads(line) for line in stream.text.splitlines()],
+            "batch": client.post("/batch", json={"ids": ["fast-2", "fast-1"]}).json(),
+        }
+
+    monkeypatch.setattr(settings, "fast_responses", True)
+    fast = _responses()
+    monkeypatch.setattr(settings, "fast_responses", False)
+    slow = _responses()
+
+    assert fast == slow
+    assert fast["user"]["cart"] == [4, 4, 2]
+    assert fast["user"]["name"] == 'Zan "Z"'